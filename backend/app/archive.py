@@ -0,0 +1,363 @@
+"""
+串流 ZIP 下載 (GET /folders/{id}/archive、POST /download/batch)
+
+ZIP 在回應的同時逐塊產生，不寫入磁碟也不先組成完整檔案：
+1. 以查詢取得所有項目 (壓縮檔內路徑、物件名稱、大小)，不佔用串流期間的資料庫連線
+2. zipfile 寫入不可 seek 的緩衝區 (各項目以 data descriptor 記錄 CRC 與大小)，
+   每寫入一塊即取出送給客戶端
+3. 接下來 ARCHIVE_PREFETCH 個物件由執行緒池同時自 MinIO 讀取，各自最多緩衝
+   ARCHIVE_PREFETCH_BYTES；客戶端讀取較慢時讀取執行緒會停下等待
+
+記憶體用量約為 ARCHIVE_PREFETCH × ARCHIVE_PREFETCH_BYTES，與檔案大小及數量無關
+(central directory 每個項目約數百位元組，以 ARCHIVE_MAX_FILES 限制)。
+
+圖片、影音、壓縮檔、PDF、Office 文件等已壓縮的內容以 stored (不壓縮) 寫入；其餘依第一塊內容試壓，
+壓縮率不足時同樣 stored。開頭即無法讀取的物件會略過並記錄於壓縮檔內的 _errors.txt；
+傳輸途中失敗時回應會中斷 (已送出的標頭無法更改狀態碼)，客戶端會收到不完整的檔案。
+"""
+import os
+import queue
+import threading
+import zlib
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+from urllib.parse import quote
+from fastapi import HTTPException
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+from .models import FileRecord, FileVersion, Folder
+from .folder_tree import subtree_cte
+from . import storage
+
+# 單一壓縮檔的檔案數上限
+ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", 10000))
+# 同時預先讀取的物件數
+ARCHIVE_PREFETCH = int(os.getenv("ARCHIVE_PREFETCH", 4))
+# 每個預先讀取中的物件最多緩衝的位元組數
+ARCHIVE_PREFETCH_BYTES = int(os.getenv("ARCHIVE_PREFETCH_BYTES", 4 * 1024 * 1024))
+# deflate 壓縮等級 (1 最快、9 最小)；Python 3.13 之前 zipfile 沒有公開的逐項目等級，串流寫入的項目使用 zlib 預設的 6
+ARCHIVE_COMPRESS_LEVEL = int(os.getenv("ARCHIVE_COMPRESS_LEVEL", 6))
+
+CHUNK_SIZE = storage.DOWNLOAD_CHUNK_SIZE
+ERRORS_ENTRY = "_errors.txt"
+
+# 內容已壓縮，deflate 幾乎無法再縮小
+STORED_TYPE_PREFIXES = ("image/", "video/", "audio/", "font/woff")
+COMPRESSIBLE_TYPES = {
+    "image/svg+xml", "image/bmp", "image/x-ms-bmp", "image/tiff", "audio/wav", "audio/x-wav",
+}
+STORED_TYPES = {
+    "application/zip", "application/x-zip-compressed", "application/gzip", "application/x-gzip",
+    "application/x-bzip2", "application/x-xz", "application/x-7z-compressed", "application/vnd.rar",
+    "application/x-rar-compressed", "application/zstd", "application/x-compress", "application/pdf",
+    "application/epub+zip", "application/java-archive", "application/vnd.android.package-archive",
+}
+STORED_TYPE_PREFIXES_APP = ("application/vnd.openxmlformats-officedocument.", "application/vnd.oasis.opendocument.")
+STORED_EXTENSIONS = {
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".7z", ".rar", ".zst", ".jar", ".apk", ".epub",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif", ".mp3", ".m4a", ".aac", ".ogg", ".flac",
+    ".mp4", ".m4v", ".mov", ".mkv", ".webm", ".avi", ".pdf", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp",
+}
+# 未知類型以第一塊內容試壓，壓縮後仍超過原大小的此比例即不壓縮
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_RATIO = 0.9
+# 小於此大小的檔案不壓縮 (省下的空間不及 deflate 的額外負擔)
+MIN_COMPRESS_SIZE = 256
+# 每個 IN (...) 查詢的檔案數
+LOOKUP_BATCH_SIZE = 500
+
+
+class ArchiveEntry(NamedTuple):
+    """壓縮檔內的一個項目；object_name 為 None 時為目錄"""
+    path: str
+    object_name: Optional[str] = None
+    size: int = 0
+    content_type: Optional[str] = None
+    modified: Optional[datetime] = None
+
+
+class _EntryNames:
+    """產生不重複的壓縮檔內路徑 (不分大小寫，避免在不分大小寫的檔案系統上解壓時互相覆蓋)"""
+
+    def __init__(self):
+        self.used = set()
+
+    def add(self, directory: str, name: str, is_dir: bool = False) -> str:
+        name = safe_name(name)
+        stem, ext = (name, "") if is_dir else os.path.splitext(name)
+        candidate, n = name, 1
+        while (directory + candidate).lower() in self.used:
+            n += 1
+            candidate = f"{stem} ({n}){ext}"
+        path = directory + candidate + ("/" if is_dir else "")
+        self.used.add((directory + candidate).lower())
+        return path
+
+
+def safe_name(name: Optional[str]) -> str:
+    """單一路徑元件：去除路徑分隔符號與控制字元，避免解壓時寫到目標目錄之外"""
+    name = "".join("_" if c in "/\\" or ord(c) < 32 else c for c in (name or "")).strip()
+    return "_" if name in ("", ".", "..") else name
+
+
+def collect_tree(db: Session, folder_id: Optional[int], directory: str, names: _EntryNames, entries: List[ArchiveEntry]):
+    """
+    將資料夾子樹 (folder_id 為 None 時為整個根目錄) 加入 entries，置於壓縮檔內的 directory 下。
+
+    以一次遞迴查詢取得子樹、一次查詢取得所有檔案的當前版本。超過 ARCHIVE_MAX_FILES 時回傳 413。
+    """
+    tree = subtree_cte(folder_id)
+    paths = {}
+    for row in db.execute(select(tree.c.id, tree.c.parent_id, tree.c.name).order_by(tree.c.depth, tree.c.name, tree.c.id)):
+        if row.id == folder_id:
+            paths[row.id] = directory
+            continue
+        paths[row.id] = names.add(paths.get(row.parent_id, directory), row.name, is_dir=True)
+        entries.append(ArchiveEntry(paths[row.id]))
+
+    folder_filter = FileRecord.folder_id.in_(select(tree.c.id))
+    if folder_id is None:
+        folder_filter = or_(folder_filter, FileRecord.folder_id.is_(None))
+    remaining = ARCHIVE_MAX_FILES - sum(1 for entry in entries if entry.object_name)
+    rows = db.execute(
+        select(
+            FileRecord.folder_id, FileRecord.filename, FileVersion.object_name, FileVersion.size,
+            FileVersion.content_type, FileVersion.uploaded_at
+        )
+        .join(FileVersion, FileVersion.id == FileRecord.current_version_id)
+        .where(folder_filter)
+        .order_by(FileRecord.folder_id, FileRecord.filename, FileRecord.id)
+        .limit(remaining + 1)
+    ).all()
+    if len(rows) > remaining:
+        raise HTTPException(status_code=413, detail=f"Too many files for one archive (max {ARCHIVE_MAX_FILES})")
+    for row in rows:
+        directory_path = paths.get(row.folder_id, directory)
+        entries.append(ArchiveEntry(
+            names.add(directory_path, row.filename), row.object_name, row.size or 0, row.content_type, row.uploaded_at
+        ))
+
+
+def folder_entries(db: Session, folder_id: int) -> List[ArchiveEntry]:
+    """資料夾 (0 為根目錄) 的所有子資料夾與檔案，路徑相對於該資料夾"""
+    if folder_id != 0 and not db.query(Folder.id).filter(Folder.id == folder_id).first():
+        raise HTTPException(status_code=404, detail="Folder not found")
+    entries = []
+    collect_tree(db, folder_id or None, "", _EntryNames(), entries)
+    return sorted(entries, key=lambda entry: entry.path)
+
+
+def batch_entries(db: Session, file_ids: Iterable[int], folder_ids: Iterable[int]) -> List[ArchiveEntry]:
+    """
+    指定檔案 (置於壓縮檔根目錄) 與資料夾 (各自成為一個目錄) 的項目。
+
+    任一 id 不存在或檔案沒有版本時回傳 404。
+    """
+    file_ids = list(dict.fromkeys(file_ids))
+    folder_ids = list(dict.fromkeys(folder_ids))
+    if len(file_ids) > ARCHIVE_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files for one archive (max {ARCHIVE_MAX_FILES})")
+    names = _EntryNames()
+    entries = []
+
+    rows = {}
+    for start in range(0, len(file_ids), LOOKUP_BATCH_SIZE):
+        chunk = file_ids[start:start + LOOKUP_BATCH_SIZE]
+        for row in db.execute(
+            select(
+                FileRecord.id, FileRecord.filename, FileVersion.object_name, FileVersion.size,
+                FileVersion.content_type, FileVersion.uploaded_at
+            )
+            .join(FileVersion, FileVersion.id == FileRecord.current_version_id)
+            .where(FileRecord.id.in_(chunk))
+        ):
+            rows[row.id] = row
+    missing = [file_id for file_id in file_ids if file_id not in rows]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"File not found: {missing[0]}")
+    for file_id in file_ids:
+        row = rows[file_id]
+        entries.append(ArchiveEntry(
+            names.add("", row.filename), row.object_name, row.size or 0, row.content_type, row.uploaded_at
+        ))
+
+    folders = dict(db.query(Folder.id, Folder.name).filter(Folder.id.in_(folder_ids)).all()) if folder_ids else {}
+    missing = [folder_id for folder_id in folder_ids if folder_id not in folders]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Folder not found: {missing[0]}")
+    for folder_id in folder_ids:
+        directory = names.add("", folders[folder_id], is_dir=True)
+        entries.append(ArchiveEntry(directory))
+        collect_tree(db, folder_id, directory, names, entries)
+    return entries
+
+
+def is_compressible(entry: ArchiveEntry, sample: bytes) -> bool:
+    """依內容類型、副檔名與第一塊內容的試壓結果決定是否以 deflate 壓縮"""
+    if entry.size < MIN_COMPRESS_SIZE:
+        return False
+    content_type = (entry.content_type or "").split(";")[0].strip().lower()
+    if content_type in COMPRESSIBLE_TYPES or content_type.startswith("text/"):
+        return True
+    if (content_type in STORED_TYPES or content_type.startswith(STORED_TYPE_PREFIXES)
+            or content_type.startswith(STORED_TYPE_PREFIXES_APP)):
+        return False
+    if os.path.splitext(entry.path)[1].lower() in STORED_EXTENSIONS:
+        return False
+    sample = sample[:SAMPLE_SIZE]
+    return len(zlib.compress(sample, 1)) < len(sample) * SAMPLE_RATIO
+
+
+def zip_date_time(value: Optional[datetime]) -> tuple:
+    """ZIP 的時間欄位只能表示 1980 ~ 2107 年"""
+    value = value or datetime.utcnow()
+    value = min(max(value, datetime(1980, 1, 1)), datetime(2107, 12, 31, 23, 59, 58))
+    return value.timetuple()[:6]
+
+
+_END = object()
+
+
+class _Prefetch:
+    """在背景執行緒讀取一個物件，以有上限的佇列交給產生 ZIP 的執行緒"""
+
+    def __init__(self, object_name: str, stop: threading.Event):
+        self.object_name = object_name
+        self.stop = stop
+        self.chunks = queue.Queue(maxsize=max(1, ARCHIVE_PREFETCH_BYTES // CHUNK_SIZE))
+
+    def run(self):
+        try:
+            path = storage.local_object_path(self.object_name) if storage.backend.local_files else None
+            if path:
+                with open(path, "rb") as f:
+                    while chunk := f.read(CHUNK_SIZE):
+                        if not self._put(chunk):
+                            return
+            else:
+                response = storage.download_file_from_minio(self.object_name)
+                try:
+                    for chunk in response.stream(CHUNK_SIZE):
+                        if not self._put(chunk):
+                            return
+                finally:
+                    response.close()
+                    response.release_conn()
+            self._put(_END)
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item) -> bool:
+        # 客戶端中斷時 stop 會被設定，不再等待佇列空間
+        while not self.stop.is_set():
+            try:
+                self.chunks.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self):
+        """下一塊內容；讀取結束時回傳 _END，讀取失敗時回傳例外"""
+        return self.chunks.get()
+
+
+class _Sink:
+    """zipfile 的輸出目標：只接受寫入 (不可 seek)，內容由串流逐次取出"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def stream_zip(entries: List[ArchiveEntry]) -> Iterator[bytes]:
+    """
+    逐塊產生 ZIP 內容 (同步產生器，StreamingResponse 會在執行緒池中迭代)。
+
+    產生器提前關閉 (客戶端中斷) 時停止所有預先讀取並釋放連線。
+    """
+    files = [entry for entry in entries if entry.object_name]
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=max(1, ARCHIVE_PREFETCH), thread_name_prefix="archive")
+    pending = deque()
+    upcoming = iter(files)
+
+    def prefetch():
+        # 目前寫入的物件之後，保持 ARCHIVE_PREFETCH 個物件已排入讀取
+        while len(pending) < max(1, ARCHIVE_PREFETCH):
+            entry = next(upcoming, None)
+            if entry is None:
+                return
+            reader = _Prefetch(entry.object_name, stop)
+            executor.submit(reader.run)
+            pending.append(reader)
+
+    sink = _Sink()
+    errors = []
+    zf = zipfile.ZipFile(sink, "w", allowZip64=True, compresslevel=ARCHIVE_COMPRESS_LEVEL)
+    try:
+        prefetch()
+        for entry in entries:
+            if entry.object_name is None:
+                info = zipfile.ZipInfo(entry.path, zip_date_time(entry.modified))
+                info.external_attr = (0o40755 << 16) | 0x10
+                zf.writestr(info, b"")
+                continue
+
+            reader = pending.popleft()
+            prefetch()
+            first = reader.get()
+            if isinstance(first, Exception):
+                print(f"Error archiving {entry.path}: {first}")
+                errors.append(f"{entry.path}: could not be read from storage")
+                continue
+
+            info = zipfile.ZipInfo(entry.path, zip_date_time(entry.modified))
+            info.external_attr = 0o100644 << 16
+            # 預先宣告大小，讓 zipfile 在需要時使用 ZIP64 的本地標頭
+            info.file_size = entry.size
+            if first is not _END and is_compressible(entry, first):
+                info.compress_type = zipfile.ZIP_DEFLATED
+                if hasattr(info, "compress_level"):
+                    info.compress_level = zf.compresslevel
+            with zf.open(info, "w") as out:
+                chunk = first
+                while chunk is not _END:
+                    if isinstance(chunk, Exception):
+                        raise chunk
+                    out.write(chunk)
+                    if len(sink.buffer) >= CHUNK_SIZE:
+                        yield sink.take()
+                    chunk = reader.get()
+            yield sink.take()
+
+        if errors:
+            zf.writestr(ERRORS_ENTRY, "\n".join(errors) + "\n")
+        zf.close()
+        yield sink.take()
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def content_disposition(filename: str) -> str:
+    """附件的 Content-Disposition；非 ASCII 檔名另以 RFC 5987 的 filename* 提供"""
+    fallback = "".join(c if 32 <= ord(c) < 127 and c not in '"\\' else "_" for c in filename)
+    header = f'attachment; filename="{fallback}"'
+    if fallback != filename:
+        header += f"; filename*=UTF-8''{quote(filename, safe='')}"
+    return header
@@ -0,0 +1,255 @@
+"""
+內容定址 Blob 儲存
+
+MinIO 物件以完整內容雜湊加上隨機後綴命名，相同內容的檔案 (不論所在資料夾或版本)
+只儲存一份 (透過 blobs 記錄查詢物件名稱)，並以 blobs.ref_count 記錄引用次數；
+最後一個引用移除時才刪除物件。
+"""
+import uuid
+from collections import Counter, defaultdict
+from typing import BinaryIO, Callable, Dict, List, Optional, Set, Tuple
+from datetime import datetime
+from sqlalchemy import delete, select, union
+from sqlalchemy.orm import Session
+from .models import Blob, Derivative, FileVersion, PendingDeletion
+from .storage import upload_file_to_minio, copy_object_in_bucket, delete_objects_from_minio, BUCKET_NAME
+
+# 每個 IN (...) 陳述式的物件數，避免超過 SQLite 參數數量上限
+RELEASE_BATCH_SIZE = 500
+# 取得引用時 Blob 被並行刪除的重試次數
+ACQUIRE_ATTEMPTS = 3
+
+
+def blob_object_name(hash_algorithm: str, content_hash: str) -> str:
+    """
+    新 Blob 的物件名稱：內容雜湊 (以前兩碼分散前綴) 加上隨機後綴。
+
+    每次建立 Blob 都使用新的名稱，Blob 記錄刪除後其物件名稱不會再被使用；
+    釋放後延遲執行的 purge_objects 或 pending_deletions 的重試，不會刪除之後重新上傳相同內容的物件。
+    """
+    return f"blobs/{hash_algorithm}/{content_hash[:2]}/{content_hash}-{uuid.uuid4().hex}"
+
+
+def find_blob(db: Session, hash_algorithm: str, content_hash: str) -> Optional[Blob]:
+    return db.query(Blob).filter(
+        Blob.hash_algorithm == hash_algorithm,
+        Blob.content_hash == content_hash
+    ).first()
+
+
+def _insert_ignore(db: Session, model, values, returning=None):
+    """
+    INSERT ... ON CONFLICT DO NOTHING，讓並行寫入相同的唯一鍵時不會互相衝突。
+
+    指定 returning 欄位時回傳實際新增的列 (已存在而略過的不回傳)。
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    statement = insert(model).values(values).on_conflict_do_nothing()
+    if returning is not None:
+        return db.execute(statement.returning(returning)).scalars().all()
+    db.execute(statement)
+
+
+def _acquire(
+    db: Session,
+    hash_algorithm: str,
+    content_hash: str,
+    size: int,
+    store: Callable[[str], None]
+) -> Tuple[Blob, bool]:
+    """
+    以 UPDATE ref_count + 1 取得引用，並以影響列數確認 Blob 仍存在。
+
+    查詢與 UPDATE 之間並行的 release_blobs 可能已將最後一個引用釋放、刪除 Blob 記錄並刪除物件；
+    此時 UPDATE 不影響任何列，以新的物件名稱重新儲存並建立 Blob。
+
+    Returns:
+        (Blob, 是否由本次呼叫儲存物件並建立 Blob 記錄)
+    """
+    for _ in range(ACQUIRE_ATTEMPTS):
+        created = False
+        blob = find_blob(db, hash_algorithm, content_hash)
+        if blob is None:
+            object_name = blob_object_name(hash_algorithm, content_hash)
+            store(object_name)
+            inserted = _insert_ignore(db, Blob, {
+                "hash_algorithm": hash_algorithm,
+                "content_hash": content_hash,
+                "bucket_name": BUCKET_NAME,
+                "object_name": object_name,
+                "size": size,
+                "ref_count": 0,
+                "created_at": datetime.utcnow(),
+            }, returning=Blob.id)
+            if not inserted:
+                # 並行的上傳先建立了相同內容的 Blob；剛寫入的物件名稱唯一，沒有其他引用
+                failures = delete_objects_from_minio([object_name])
+                if failures:
+                    enqueue_pending_deletions(db, failures)
+                continue
+            created = True
+            blob = db.get(Blob, inserted[0])
+
+        updated = db.query(Blob).filter(Blob.id == blob.id).update(
+            {Blob.ref_count: Blob.ref_count + 1}, synchronize_session=False
+        )
+        if updated == 1:
+            return blob, created
+        db.expunge(blob)
+    raise RuntimeError(f"Blob {hash_algorithm}:{content_hash} was released concurrently {ACQUIRE_ATTEMPTS} times")
+
+
+def acquire_blob(
+    db: Session,
+    hash_algorithm: str,
+    content_hash: str,
+    size: int,
+    content_type: str,
+    file_data: BinaryIO
+) -> Tuple[Blob, bool]:
+    """
+    取得內容對應的 Blob 並增加引用次數；若尚未儲存才上傳至 MinIO。
+
+    Returns:
+        (Blob, 是否新上傳了物件)
+    """
+    start = file_data.tell()
+
+    def store(object_name: str):
+        # Blob 被並行刪除而重新儲存時，從頭再讀一次內容
+        file_data.seek(start)
+        upload_file_to_minio(file_data, size, object_name, content_type)
+
+    return _acquire(db, hash_algorithm, content_hash, size, store)
+
+
+def acquire_staged_blob(
+    db: Session,
+    hash_algorithm: str,
+    content_hash: str,
+    size: int,
+    content_type: str,
+    staged_object: str
+) -> Tuple[Blob, bool]:
+    """
+    同 acquire_blob，但內容已在 MinIO 的暫存物件中 (可續傳上傳組成的物件)；
+    尚未儲存時以伺服器端複製建立 Blob 物件。暫存物件由呼叫端刪除。
+    """
+    return _acquire(
+        db, hash_algorithm, content_hash, size,
+        lambda object_name: copy_object_in_bucket(staged_object, object_name, content_type)
+    )
+
+
+def release_blobs(db: Session, object_names: List[str]) -> List[str]:
+    """
+    減少物件的引用次數，並刪除已無引用的 Blob 記錄及其衍生檔 (縮圖) 記錄。
+
+    以批次 UPDATE / DELETE 處理 (同一物件被多個版本引用時一次扣除)，
+    刪除大量檔案時不需逐筆查詢。
+
+    呼叫端需在 commit 之後再從 MinIO 刪除回傳的物件，
+    避免交易失敗時留下指向已刪除物件的版本。
+
+    Returns:
+        已無任何引用、應從 MinIO 刪除的物件名稱 (含衍生檔物件)
+    """
+    counts = Counter(name for name in object_names if name)
+    names = list(counts)
+    orphaned = []
+
+    for i in range(0, len(names), RELEASE_BATCH_SIZE):
+        batch = names[i:i + RELEASE_BATCH_SIZE]
+        existing = set(db.execute(select(Blob.object_name).where(Blob.object_name.in_(batch))).scalars())
+        # 沒有 Blob 記錄的舊物件視為版本獨佔
+        orphaned.extend(name for name in batch if name not in existing)
+
+        by_count = defaultdict(list)
+        for name in existing:
+            by_count[counts[name]].append(name)
+        for count, group in by_count.items():
+            db.query(Blob).filter(Blob.object_name.in_(group)).update(
+                {Blob.ref_count: Blob.ref_count - count}, synchronize_session=False
+            )
+
+        released = db.execute(
+            delete(Blob)
+            .where(Blob.object_name.in_(batch), Blob.ref_count <= 0)
+            .returning(Blob.object_name)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        orphaned.extend(released)
+
+    sources = list(orphaned)
+    for i in range(0, len(sources), RELEASE_BATCH_SIZE):
+        orphaned.extend(db.execute(
+            delete(Derivative)
+            .where(Derivative.source_object.in_(sources[i:i + RELEASE_BATCH_SIZE]))
+            .returning(Derivative.object_name)
+            .execution_options(synchronize_session=False)
+        ).scalars().all())
+
+    return list(dict.fromkeys(orphaned))
+
+
+def referenced_objects(db: Session, object_names: List[str]) -> Set[str]:
+    """物件中仍被 Blob、FileVersion 或衍生檔記錄引用的名稱"""
+    query = union(
+        select(Blob.object_name).where(Blob.object_name.in_(object_names)),
+        select(FileVersion.object_name).where(FileVersion.object_name.in_(object_names)),
+        select(Derivative.object_name).where(Derivative.object_name.in_(object_names)),
+    )
+    return set(db.execute(query).scalars())
+
+
+def enqueue_pending_deletions(db: Session, failures: Dict[str, str]):
+    """將刪除失敗的物件加入待刪除佇列 (已在佇列中的物件不重複加入)"""
+    now = datetime.utcnow()
+    names = list(failures)
+    for i in range(0, len(names), RELEASE_BATCH_SIZE):
+        _insert_ignore(db, PendingDeletion, [
+            {
+                "bucket_name": BUCKET_NAME,
+                "object_name": name,
+                "attempts": 1,
+                "last_error": failures[name][:1000],
+                "created_at": now,
+                "updated_at": now,
+            }
+            for name in names[i:i + RELEASE_BATCH_SIZE]
+        ])
+
+
+def purge_objects(db: Session, object_names: List[str]) -> Dict[str, str]:
+    """
+    從 MinIO 批次刪除已無引用的物件，失敗的物件寫入 pending_deletions 待重試。
+
+    需在釋放引用的交易 commit 之後呼叫。
+
+    Returns:
+        刪除失敗的物件 {object_name: 錯誤訊息}
+    """
+    failures = delete_objects_from_minio(object_names)
+    if failures:
+        print(f"Failed to delete {len(failures)} objects from storage, queued for retry")
+        enqueue_pending_deletions(db, failures)
+        db.commit()
+    return failures
+
+
+def discard_objects(db: Session, object_names: List[str]) -> Dict[str, str]:
+    """
+    刪除已上傳但最終未被引用的物件 (例如上傳後資料庫交易失敗)。
+
+    刪除前確認物件仍未被引用，避免誤刪並行上傳相同內容後剛建立的 Blob。
+    """
+    failures = {}
+    for i in range(0, len(object_names), RELEASE_BATCH_SIZE):
+        batch = object_names[i:i + RELEASE_BATCH_SIZE]
+        referenced = referenced_objects(db, batch)
+        failures.update(purge_objects(db, [name for name in batch if name not in referenced]))
+    return failures
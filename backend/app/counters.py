@@ -0,0 +1,263 @@
+"""
+預先彙總的統計計數器
+
+stats_counters 依 (scope, key) 記錄檔案數、版本數與版本總大小：
+- total: 全系統 (key 為空字串)
+- category: 每個分類
+- folder: 每個資料夾直接包含的檔案 (key 為資料夾 id，"0" 為根目錄)
+
+資料夾的變動同時沿祖先鏈加到 folders.total_* 欄位 (子樹統計，含所有子資料夾)：
+以一個遞迴查詢找出所有祖先，在記憶體中合併後以一個 executemany UPDATE 寫入。
+
+ORM 的新增/刪除/移動於 flush 時自動更新計數；批次 SQL (批次匯入、資料夾刪除) 需自行呼叫。
+每次 flush 的所有變動合併為一個 INSERT ... ON CONFLICT DO UPDATE 陳述式。
+/stats 只讀取少量計數列，並在行程內快取 STATS_CACHE_TTL_SECONDS 秒。
+
+使用方式 (依現有資料重建計數)：
+    python -m app.counters --rebuild
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy import bindparam, event, func, inspect, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .models import FileRecord, FileVersion, Folder, StatsCounter
+from .folder_tree import ancestor_pairs
+
+# /stats 快取秒數，0 表示不快取
+STATS_CACHE_TTL_SECONDS = float(os.getenv("STATS_CACHE_TTL_SECONDS", 5))
+
+_cache = {"expires": 0.0, "value": None}
+_cache_lock = threading.Lock()
+
+
+def folder_key(folder_id: Optional[int]) -> str:
+    return str(folder_id or 0)
+
+
+class StatsDelta:
+    """累積計數變動 {(scope, key): [檔案數, 版本數, 位元組數]}"""
+
+    def __init__(self):
+        self.values = defaultdict(lambda: [0, 0, 0])
+
+    def add(self, category: Optional[str], folder_id: Optional[int], files: int = 0, versions: int = 0, size: int = 0):
+        for scope_key in (("total", ""), ("category", category or "other"), ("folder", folder_key(folder_id))):
+            value = self.values[scope_key]
+            value[0] += files
+            value[1] += versions
+            value[2] += size or 0
+
+    def apply(self, connection):
+        """以單一 upsert 陳述式套用變動 (依鍵排序，避免並行交易互相死結)"""
+        rows = [
+            {"scope": scope, "key": key, "file_count": files, "version_count": versions, "total_bytes": size}
+            for (scope, key), (files, versions, size) in sorted(self.values.items())
+            if files or versions or size
+        ]
+        if not rows:
+            return
+        if connection.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        table = StatsCounter.__table__
+        stmt = insert(table).values(rows)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.scope, table.c.key],
+            set_={
+                "file_count": table.c.file_count + stmt.excluded.file_count,
+                "version_count": table.c.version_count + stmt.excluded.version_count,
+                "total_bytes": table.c.total_bytes + stmt.excluded.total_bytes,
+            }
+        ))
+        self._apply_folder_totals(connection)
+
+    def _apply_folder_totals(self, connection):
+        direct = {
+            int(key): value for (scope, key), value in self.values.items()
+            if scope == "folder" and key != "0" and any(value)
+        }
+        totals = defaultdict(lambda: [0, 0, 0])
+        for folder_id, ancestor_id in ancestor_pairs(connection, direct):
+            total = totals[ancestor_id]
+            for i in range(3):
+                total[i] += direct[folder_id][i]
+        if not totals:
+            return
+        folders = Folder.__table__
+        connection.execute(
+            folders.update().where(folders.c.id == bindparam("folder_id")).values(
+                total_file_count=folders.c.total_file_count + bindparam("files"),
+                total_version_count=folders.c.total_version_count + bindparam("versions"),
+                total_bytes=folders.c.total_bytes + bindparam("size"),
+            ),
+            [
+                {"folder_id": folder_id, "files": files, "versions": versions, "size": size}
+                for folder_id, (files, versions, size) in sorted(totals.items())
+            ]
+        )
+
+
+def aggregate_files(connection, condition=None, sign: int = 1) -> StatsDelta:
+    """彙總符合條件的檔案 (及其版本) 的計數，每個資料表一個 GROUP BY 查詢"""
+    delta = StatsDelta()
+    files = select(FileRecord.category, FileRecord.folder_id, func.count(FileRecord.id))
+    versions = select(
+        FileRecord.category, FileRecord.folder_id, func.count(FileVersion.id), func.coalesce(func.sum(FileVersion.size), 0)
+    ).join(FileVersion, FileVersion.file_id == FileRecord.id)
+    if condition is not None:
+        files = files.where(condition)
+        versions = versions.where(condition)
+    for category, folder_id, count in connection.execute(files.group_by(FileRecord.category, FileRecord.folder_id)):
+        delta.add(category, folder_id, files=sign * count)
+    for category, folder_id, count, size in connection.execute(versions.group_by(FileRecord.category, FileRecord.folder_id)):
+        delta.add(category, folder_id, versions=sign * count, size=sign * size)
+    return delta
+
+
+def remove_files(db: Session, condition):
+    """批次 SQL 刪除檔案前呼叫，扣除符合條件的檔案與版本"""
+    connection = db.connection()
+    aggregate_files(connection, condition, sign=-1).apply(connection)
+
+
+def rebuild_counters(db: Session):
+    """清空並依 file_records / file_versions 重建所有計數 (含資料夾子樹統計)"""
+    connection = db.connection()
+    connection.execute(StatsCounter.__table__.delete())
+    connection.execute(Folder.__table__.update().values(total_file_count=0, total_version_count=0, total_bytes=0))
+    aggregate_files(connection).apply(connection)
+    db.commit()
+    invalidate_cache()
+
+
+def init_stats_counters(engine: Engine):
+    """既有資料庫首次建立計數表時回填計數"""
+    with engine.connect() as conn:
+        has_counters = conn.execute(select(StatsCounter.id).limit(1)).first() is not None
+        has_files = conn.execute(select(FileRecord.id).limit(1)).first() is not None
+    if has_files and not has_counters:
+        db = SessionLocal()
+        try:
+            rebuild_counters(db)
+        finally:
+            db.close()
+
+
+def invalidate_cache():
+    with _cache_lock:
+        _cache["expires"] = 0.0
+
+
+def get_system_counters(db: Session) -> dict:
+    """全系統與各分類的計數 (行程內 TTL 快取)"""
+    now = time.monotonic()
+    with _cache_lock:
+        if _cache["value"] is not None and now < _cache["expires"]:
+            return _cache["value"]
+
+    rows = db.query(StatsCounter).filter(StatsCounter.scope.in_(("total", "category"))).all()
+    total = next((row for row in rows if row.scope == "total"), None)
+    value = {
+        "total_files": total.file_count if total else 0,
+        "total_versions": total.version_count if total else 0,
+        "total_size_bytes": total.total_bytes if total else 0,
+        "categories": {row.key: row.file_count for row in rows if row.scope == "category" and row.file_count},
+        "category_sizes": {row.key: row.total_bytes for row in rows if row.scope == "category" and row.file_count},
+    }
+    with _cache_lock:
+        _cache["value"] = value
+        _cache["expires"] = now + STATS_CACHE_TTL_SECONDS
+    return value
+
+
+def _read_counter(db: Session, scope: str, key: str) -> dict:
+    row = db.query(StatsCounter).filter(StatsCounter.scope == scope, StatsCounter.key == key).first()
+    return {
+        "file_count": row.file_count if row else 0,
+        "version_count": row.version_count if row else 0,
+        "total_bytes": row.total_bytes if row else 0,
+    }
+
+
+def get_total_counters(db: Session) -> dict:
+    """全系統計數 (不經快取)"""
+    return _read_counter(db, "total", "")
+
+
+def get_folder_counters(db: Session, folder_id: Optional[int]) -> dict:
+    """資料夾直接包含的檔案計數 (不含子資料夾)"""
+    return {"folder_id": folder_id or 0, **_read_counter(db, "folder", folder_key(folder_id))}
+
+
+def _file_of(session: Session, version: FileVersion) -> Optional[FileRecord]:
+    return version.file or (session.get(FileRecord, version.file_id) if version.file_id else None)
+
+
+def _old_value(obj, attr: str):
+    history = getattr(inspect(obj).attrs, attr).history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+
+@event.listens_for(SessionLocal, "before_flush")
+def _track_counters(session: Session, flush_context, instances):
+    """flush 前依待寫入的新增、刪除與資料夾移動計算變動"""
+    delta = StatsDelta()
+    for obj in session.new:
+        if isinstance(obj, FileRecord):
+            delta.add(obj.category, obj.folder_id, files=1)
+        elif isinstance(obj, FileVersion):
+            db_file = _file_of(session, obj)
+            if db_file is not None:
+                delta.add(db_file.category, db_file.folder_id, versions=1, size=obj.size)
+
+    for obj in session.deleted:
+        if isinstance(obj, FileRecord):
+            delta.add(obj.category, _old_value(obj, "folder_id"), files=-1)
+        elif isinstance(obj, FileVersion):
+            db_file = _file_of(session, obj)
+            if db_file is not None:
+                delta.add(db_file.category, _old_value(db_file, "folder_id"), versions=-1, size=-(obj.size or 0))
+
+    for obj in session.dirty:
+        if not isinstance(obj, FileRecord) or obj in session.deleted:
+            continue
+        history = inspect(obj).attrs.folder_id.history
+        if not history.has_changes() or not history.deleted:
+            continue
+        old_folder, new_folder = history.deleted[0], obj.folder_id
+        if old_folder == new_folder:
+            continue
+        # 移動檔案時，已寫入的版本一併移到新資料夾
+        count, size = session.connection().execute(
+            select(func.count(FileVersion.id), func.coalesce(func.sum(FileVersion.size), 0))
+            .where(FileVersion.file_id == obj.id)
+        ).one()
+        delta.add(obj.category, old_folder, files=-1, versions=-count, size=-size)
+        delta.add(obj.category, new_folder, files=1, versions=count, size=size)
+
+    if delta.values:
+        delta.apply(session.connection())
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 統計計數工具")
+    parser.add_argument("--rebuild", action="store_true", help="依現有資料重建計數")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        session = SessionLocal()
+        try:
+            rebuild_counters(session)
+        finally:
+            session.close()
+        print("[完成] 計數已重建")
+    else:
+        parser.print_help()
@@ -0,0 +1,413 @@
+"""
+衍生檔 (縮圖、預覽) 產生流程
+
+上傳後由背景工作 (app/jobs.py 的 thumbnail 工作) 為圖片、影片與 PDF 產生縮圖，存成獨立物件，
+GET /files/{id}/thumbnail 只需傳送數 KB 的縮圖，不必下載原始檔案。
+
+- 衍生檔依來源物件 (內容定址的 Blob) 產生，相同內容的檔案與版本共用同一份；
+  物件名稱為 derivatives/{來源物件}/{kind}.jpg
+- 新版本於 ORM flush 時建立 pending 記錄並排入工作 (與版本同一個交易)；來源已有記錄 (相同內容)
+  時不重複排入。批次 SQL (批次匯入) 需自行呼叫 enqueue_thumbnails
+- 來源 Blob 最後一個引用移除時 (blobs.release_blobs)，衍生檔記錄一併刪除，物件隨 Blob 一起刪除
+- 圖片需安裝 Pillow，PDF 首頁預覽另需 pypdfium2，影片需要 ffmpeg；缺少時標記為 unsupported
+"""
+import io
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from importlib.util import find_spec
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy import event, or_, update
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .models import Derivative, FileVersion
+from .blobs import RELEASE_BATCH_SIZE, _insert_ignore, referenced_objects
+from . import jobs, storage
+from .utils import detect_category
+
+# 縮圖長邊的像素數
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", 256))
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", 80))
+# 圖片與 PDF 需下載完整原始檔；超過此大小不產生縮圖
+THUMBNAIL_MAX_SOURCE_BYTES = int(os.getenv("THUMBNAIL_MAX_SOURCE_BYTES", 200 * 1024 * 1024))
+# 影片截取第幾秒的畫面 (影片較短時改取第一個畫面)
+THUMBNAIL_VIDEO_SECONDS = float(os.getenv("THUMBNAIL_VIDEO_SECONDS", 1))
+FFMPEG_PATH = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg")
+FFMPEG_TIMEOUT_SECONDS = 60
+# 允許的影片容器 (ffmpeg demuxer 名稱)；hls / concat 等會開啟其他檔案或網址的格式一律拒絕
+VIDEO_INPUT_FORMATS = [
+    name.strip()
+    for name in os.getenv("VIDEO_INPUT_FORMATS", "mov,matroska,avi,flv,mpeg,mpegts,asf,ogg").split(",")
+    if name.strip()
+]
+# ffmpeg 可使用的協定：本機檔案只允許 file，預簽名網址另需 http(s)
+LOCAL_PROTOCOLS = "file"
+URL_PROTOCOLS = "file,http,https,tcp,tls"
+# 網址帶有內容雜湊 (?v=) 的縮圖回應可快取的秒數
+THUMBNAIL_CACHE_SECONDS = int(os.getenv("THUMBNAIL_CACHE_SECONDS", 365 * 24 * 3600))
+
+THUMBNAIL_KIND = f"thumbnail-{THUMBNAIL_SIZE}"
+DERIVATIVE_PREFIX = "derivatives/"
+# 停留在 processing 超過此時間視為中斷 (行程在產生途中結束)，可重新認領
+STALE_PROCESSING = timedelta(minutes=10)
+THUMBNAIL_JOB = "thumbnail"
+
+
+def derivative_object_name(source_object: str, kind: str = THUMBNAIL_KIND) -> str:
+    return f"{DERIVATIVE_PREFIX}{source_object}/{kind}.jpg"
+
+
+def _renderer(content_type: Optional[str]):
+    """依內容類型選擇縮圖產生函式；不支援或缺少套件時回傳 None"""
+    content_type = content_type or ""
+    category = detect_category(content_type)
+    if category == "image" and find_spec("PIL"):
+        return _render_image
+    if "pdf" in content_type and find_spec("PIL") and find_spec("pypdfium2"):
+        return _render_pdf
+    if category == "video" and FFMPEG_PATH:
+        return _render_video
+    return None
+
+
+def has_preview(content_type: Optional[str]) -> bool:
+    """是否為可產生縮圖的類型 (圖片、影片、PDF)，不論所需套件是否已安裝"""
+    content_type = content_type or ""
+    return detect_category(content_type) in ("image", "video") or "pdf" in content_type
+
+
+# ========== 縮圖產生 ==========
+
+def _encode_jpeg(image) -> bytes:
+    from PIL import Image
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # 透明背景以白色填滿
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+@contextmanager
+def _source_file(source_object: str, size: Optional[int]):
+    """來源物件的本機路徑；非本機後端時下載到暫存檔"""
+    if size and size > THUMBNAIL_MAX_SOURCE_BYTES:
+        raise ValueError(f"Source too large for thumbnail ({size} bytes)")
+    path = storage.local_object_path(source_object) if storage.backend.local_files else None
+    if path:
+        yield path
+        return
+    with tempfile.NamedTemporaryFile(prefix="dms-derivative-") as temp:
+        response = storage.download_file_from_minio(source_object)
+        try:
+            for chunk in response.stream(storage.DOWNLOAD_CHUNK_SIZE):
+                temp.write(chunk)
+        finally:
+            response.close()
+            response.release_conn()
+        temp.flush()
+        yield temp.name
+
+
+def _render_image(source_object: str, size: Optional[int]) -> bytes:
+    from PIL import Image, ImageOps
+
+    with _source_file(source_object, size) as path, Image.open(path) as image:
+        # JPEG 直接以 1/2 ~ 1/8 的比例解碼，大圖不需解碼完整解析度
+        image.draft("RGB", (THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        return _encode_jpeg(image)
+
+
+def _render_pdf(source_object: str, size: Optional[int]) -> bytes:
+    """PDF 首頁預覽"""
+    import pypdfium2
+
+    with _source_file(source_object, size) as path:
+        pdf = pypdfium2.PdfDocument(path)
+        try:
+            page = pdf[0]
+            width, height = page.get_size()
+            image = page.render(scale=THUMBNAIL_SIZE / max(width, height, 1)).to_pil()
+            return _encode_jpeg(image)
+        finally:
+            pdf.close()
+
+
+def _render_video(source_object: str, size: Optional[int]) -> bytes:
+    """
+    以 ffmpeg 截取一個畫面。MinIO 後端直接讀取預簽名網址，ffmpeg 只以 Range 請求讀取
+    所需的部分，不下載整個影片。
+    """
+    path = storage.local_object_path(source_object) if storage.backend.local_files else None
+    if path:
+        return _ffmpeg_frame(path, LOCAL_PROTOCOLS)
+    if storage.STORAGE_BACKEND in ("minio", "s3"):
+        return _ffmpeg_frame(storage.get_presigned_url(source_object, timedelta(minutes=10)), URL_PROTOCOLS)
+    with _source_file(source_object, None) as path:
+        return _ffmpeg_frame(path, LOCAL_PROTOCOLS)
+
+
+def _ffmpeg_input(source: str, protocols: str) -> List[str]:
+    """
+    先探測來源的容器格式，回傳以 -f 固定該格式的輸入參數。
+
+    探測與截圖都限制 -protocol_whitelist 與 -format_whitelist，上傳的 HLS 播放清單或 concat
+    清單無法讓 ffmpeg 讀取其他本機檔案或網址。
+    """
+    whitelist = ["-protocol_whitelist", protocols, "-format_whitelist", ",".join(VIDEO_INPUT_FORMATS)]
+    result = subprocess.run(
+        [FFMPEG_PATH, "-nostdin", "-hide_banner", *whitelist, "-i", source],
+        capture_output=True, timeout=FFMPEG_TIMEOUT_SECONDS,
+    )
+    match = re.search(r"^Input #0, (.+?), from ", result.stderr.decode(errors="replace"), re.MULTILINE)
+    input_format = match.group(1).split(",")[0] if match else None
+    if input_format not in VIDEO_INPUT_FORMATS:
+        raise RuntimeError(f"Unsupported video format: {input_format or 'unknown'}")
+    return [*whitelist, "-f", input_format]
+
+
+def _ffmpeg_frame(source: str, protocols: str) -> bytes:
+    input_args = _ffmpeg_input(source, protocols)
+    scale = f"scale={THUMBNAIL_SIZE}:{THUMBNAIL_SIZE}:force_original_aspect_ratio=decrease"
+    for seek in (THUMBNAIL_VIDEO_SECONDS, 0):
+        result = subprocess.run(
+            [
+                FFMPEG_PATH, "-nostdin", "-loglevel", "error", *input_args, "-ss", str(seek), "-i", source,
+                "-frames:v", "1", "-vf", scale, "-f", "image2pipe", "-c:v", "mjpeg", "-q:v", "4", "-",
+            ],
+            capture_output=True, timeout=FFMPEG_TIMEOUT_SECONDS,
+        )
+        if result.returncode == 0 and result.stdout:
+            return result.stdout
+    raise RuntimeError(result.stderr.decode(errors="replace").strip()[-500:] or "No video frame")
+
+
+def generate(source_object: str, content_type: Optional[str], size: Optional[int] = None) -> str:
+    """
+    產生來源物件的縮圖 (thumbnail 工作執行)。
+
+    以 UPDATE ... WHERE status = 'pending' 認領記錄 (或中斷逾時的 processing)，相同來源的重複工作
+    不會重複產生；完成前記錄已被刪除 (來源 Blob 被釋放) 時，刪除剛寫入的物件。
+
+    Returns:
+        最終狀態
+    """
+    db = SessionLocal()
+    try:
+        # 排入佇列後來源已被刪除
+        if not referenced_objects(db, [source_object]):
+            return "skipped"
+        now = datetime.utcnow()
+        object_name = derivative_object_name(source_object)
+        _insert_ignore(db, Derivative, {
+            "source_object": source_object,
+            "kind": THUMBNAIL_KIND,
+            "object_name": object_name,
+            "status": "pending",
+            "created_at": now,
+            "updated_at": now,
+        })
+        db.commit()
+
+        render = _renderer(content_type)
+        claimed = db.execute(
+            update(Derivative)
+            .where(Derivative.source_object == source_object, Derivative.kind == THUMBNAIL_KIND,
+                   or_(Derivative.status == "pending",
+                       (Derivative.status == "processing") & (Derivative.updated_at < now - STALE_PROCESSING)))
+            .values(status="processing" if render else "unsupported", updated_at=now)
+        ).rowcount
+        db.commit()
+        if not claimed or render is None:
+            return "unsupported" if claimed else "skipped"
+
+        values = {}
+        try:
+            data = render(source_object, size)
+            storage.upload_file_to_minio(io.BytesIO(data), len(data), object_name, "image/jpeg")
+            values.update(status="ready", size=len(data), content_type="image/jpeg", error=None)
+        except Exception as e:
+            print(f"Failed to generate thumbnail for {source_object}: {e}")
+            values.update(status="failed", error=str(e)[:1000])
+        values["updated_at"] = datetime.utcnow()
+
+        updated = db.execute(
+            update(Derivative)
+            .where(Derivative.source_object == source_object, Derivative.kind == THUMBNAIL_KIND,
+                   Derivative.status == "processing")
+            .values(**values)
+        ).rowcount
+        db.commit()
+        if values["status"] == "ready" and not updated:
+            storage.delete_objects_from_minio([object_name])
+        return values["status"]
+    finally:
+        db.close()
+
+
+@jobs.handler(THUMBNAIL_JOB)
+def _thumbnail_job(payload: dict) -> str:
+    return generate(payload["source_object"], payload.get("content_type"), payload.get("size"))
+
+
+def enqueue_thumbnails(db: Session, sources: Iterable[Tuple[str, Optional[str], Optional[int]]]) -> int:
+    """
+    為 (來源物件, 內容類型, 大小) 建立 pending 記錄並在目前的交易中排入 thumbnail 工作；
+    已有記錄的來源 (相同內容已產生或已排入) 略過。回傳排入的工作數。
+    """
+    unique = {}
+    for object_name, content_type, size in sources:
+        if object_name and has_preview(content_type):
+            unique.setdefault(object_name, (content_type, size))
+    if not unique:
+        return 0
+    now = datetime.utcnow()
+    names = list(unique)
+    inserted = []
+    for i in range(0, len(names), RELEASE_BATCH_SIZE):
+        inserted.extend(_insert_ignore(db, Derivative, [
+            {
+                "source_object": object_name,
+                "kind": THUMBNAIL_KIND,
+                "object_name": derivative_object_name(object_name),
+                "status": "pending",
+                "created_at": now,
+                "updated_at": now,
+            }
+            for object_name in names[i:i + RELEASE_BATCH_SIZE]
+        ], returning=Derivative.source_object))
+    jobs.enqueue_many(db, THUMBNAIL_JOB, [
+        {"source_object": object_name, "content_type": unique[object_name][0], "size": unique[object_name][1]}
+        for object_name in inserted
+    ])
+    return len(inserted)
+
+
+def _enqueue_existing(db: Session, sources: Iterable[Tuple[str, Optional[str], Optional[int]]]):
+    """為已有 pending 記錄的來源排入工作"""
+    jobs.enqueue_many(db, THUMBNAIL_JOB, [
+        {"source_object": object_name, "content_type": content_type, "size": size}
+        for object_name, content_type, size in sources
+    ])
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_new_versions(session: Session, flush_context):
+    # 延後處理的上傳 (尚未計算雜湊) 於 finalize_upload 工作改指向 Blob 後才排入
+    sources = [
+        (obj.object_name, obj.content_type, obj.size) for obj in session.new
+        if isinstance(obj, FileVersion) and obj.object_name and obj.sha1_hash and has_preview(obj.content_type)
+    ]
+    if sources:
+        enqueue_thumbnails(session, sources)
+
+
+# ========== 讀取 ==========
+
+def get_thumbnail(db: Session, version) -> Optional[dict]:
+    """
+    版本的縮圖狀態 {"status", "object_name", "size", "id"}；不支援的類型回傳 None。
+
+    尚未有記錄 (例如遷移前上傳的檔案) 時排入工作並回傳 pending；處理中斷逾時的項目重新排入。
+    """
+    if not has_preview(version.content_type):
+        return None
+    if not version.sha1_hash:
+        # 延後處理的上傳，finalize_upload 工作完成後才排入
+        return {"status": "pending"}
+    derivative = db.query(Derivative).filter(
+        Derivative.source_object == version.object_name, Derivative.kind == THUMBNAIL_KIND
+    ).first()
+    if derivative is None:
+        enqueue_thumbnails(db, [(version.object_name, version.content_type, version.size)])
+        db.commit()
+        return {"status": "pending"}
+    status = derivative.status
+    if status == "processing" and derivative.updated_at < datetime.utcnow() - STALE_PROCESSING:
+        reset_thumbnail(db, version, from_status="processing")
+        status = "pending"
+    return {"id": derivative.id, "status": status, "object_name": derivative.object_name, "size": derivative.size}
+
+
+def reset_thumbnail(db: Session, version, from_status: str = "ready"):
+    """將縮圖記錄改回 pending 並重新排入工作 (例如縮圖物件遺失)"""
+    updated = db.execute(
+        update(Derivative)
+        .where(Derivative.source_object == version.object_name, Derivative.kind == THUMBNAIL_KIND,
+               Derivative.status == from_status)
+        .values(status="pending", updated_at=datetime.utcnow())
+    ).rowcount
+    if updated:
+        _enqueue_existing(db, [(version.object_name, version.content_type, version.size)])
+    db.commit()
+
+
+def read_thumbnail(object_name: str) -> Optional[bytes]:
+    """讀取縮圖內容 (數 KB，一次讀完)；物件不存在時回傳 None"""
+    try:
+        response = storage.download_file_from_minio(object_name)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        if getattr(e, "code", None) == "NoSuchKey":
+            return None
+        raise
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def backfill(db: Session) -> int:
+    """
+    為所有版本中尚未產生縮圖 (沒有記錄或仍為 pending) 的圖片、影片與 PDF 排入工作，回傳排入數量。
+
+    呼叫端負責 commit；工作由 worker 執行 (API 行程的 JOB_WORKERS 或 python -m app.jobs --worker)。
+    """
+    rows = db.query(FileVersion.object_name, FileVersion.content_type, FileVersion.size, Derivative.status).outerjoin(
+        Derivative, (Derivative.source_object == FileVersion.object_name) & (Derivative.kind == THUMBNAIL_KIND)
+    ).filter(
+        FileVersion.sha1_hash.isnot(None), or_(Derivative.id.is_(None), Derivative.status == "pending")
+    ).distinct().all()
+    missing, pending = {}, {}
+    for object_name, content_type, size, status in rows:
+        if has_preview(content_type):
+            (pending if status == "pending" else missing).setdefault(object_name, (object_name, content_type, size))
+    count = enqueue_thumbnails(db, missing.values())
+    _enqueue_existing(db, pending.values())
+    return count + len(pending)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="衍生檔 (縮圖) 產生工具")
+    parser.add_argument("--backfill", action="store_true", help="為既有檔案排入縮圖工作")
+    parser.add_argument("--run", action="store_true", help="排入後在本行程執行工作直到完成")
+    args = parser.parse_args()
+
+    if args.backfill:
+        session = SessionLocal()
+        try:
+            count = backfill(session)
+            session.commit()
+            print(f"排入 {count} 個縮圖工作")
+        finally:
+            session.close()
+        if args.run:
+            print(f"完成 {jobs.work('backfill', drain=True)} 個工作")
+    else:
+        parser.print_help()
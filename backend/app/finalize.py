@@ -0,0 +1,153 @@
+"""
+延後處理的上傳 (UPLOAD_DEFERRED_PROCESSING)
+
+POST /upload 預設在請求中計算完整內容雜湊，比對是否已有相同內容後才寫入 MinIO。啟用延後處理時，
+上傳只將內容寫入隨機命名的物件 (blobs/deferred/{uuid})，再以單一交易建立版本記錄與 finalize_upload
+工作後即回應 (物件寫入後內容已持久)；其餘由背景工作完成：
+1. 讀回物件計算完整內容雜湊
+2. 已有相同內容的 Blob 時改指向該 Blob 並刪除剛上傳的物件；否則直接將物件登記為 Blob (不需複製)
+3. 寫入版本的雜湊並排入縮圖工作
+
+完成前版本的 sha1_hash 為 null (下載使用弱 ETag，縮圖回傳 202)。
+與當前版本內容相同的上傳無法再以 409 拒絕，會保留為新版本 (與前一版本共用同一個 Blob)。
+
+可續傳上傳在其他行程完成時也以此工作處理 (見 app/resumable.py)；工作階段宣告了內容雜湊 (expected_hash)
+而計算結果不符時，刪除這些版本 (檔案只有此版本時一併刪除檔案) 與物件，工作結果為 rejected。
+"""
+import os
+import uuid
+from datetime import datetime
+from typing import Tuple
+from sqlalchemy import update
+from .database import SessionLocal
+from .models import Blob, FileVersion
+from .blobs import ACQUIRE_ATTEMPTS, _insert_ignore, discard_objects, find_blob, purge_objects
+from . import derivatives, jobs, metadata_cache, storage
+from .utils import HASH_ALGORITHM, HASH_CHUNK_SIZE, hash_stream, new_hasher
+
+# 上傳後立即回應，雜湊與去重改由 finalize_upload 工作處理
+UPLOAD_DEFERRED_PROCESSING = os.getenv("UPLOAD_DEFERRED_PROCESSING", "false").lower() in ("1", "true", "yes")
+
+DEFERRED_PREFIX = "blobs/deferred/"
+FINALIZE_UPLOAD_JOB = "finalize_upload"
+
+
+def deferred_object_name() -> str:
+    return f"{DEFERRED_PREFIX}{uuid.uuid4().hex}"
+
+
+def hash_object(object_name: str) -> Tuple[str, int]:
+    """讀回物件計算完整內容雜湊，回傳 (雜湊值, 大小)"""
+    path = storage.local_object_path(object_name) if storage.backend.local_files else None
+    if path:
+        with open(path, "rb") as f:
+            return hash_stream(f, HASH_ALGORITHM)
+    hasher = new_hasher(HASH_ALGORITHM)
+    size = 0
+    response = storage.download_file_from_minio(object_name)
+    try:
+        for chunk in response.stream(HASH_CHUNK_SIZE):
+            hasher.update(chunk)
+            size += len(chunk)
+    finally:
+        response.close()
+        response.release_conn()
+    return hasher.hexdigest(), size
+
+
+def reject_upload(db, object_name: str) -> int:
+    """刪除指向尚未完成處理之物件的版本 (檔案只剩此版本時一併刪除) 與物件，回傳刪除的版本數"""
+    versions = db.query(FileVersion).filter(
+        FileVersion.object_name == object_name, FileVersion.sha1_hash.is_(None)
+    ).all()
+    for version in versions:
+        record = version.file
+        if record.version_count <= 1:
+            db.delete(version)
+            db.delete(record)
+            continue
+        if record.current_version_id == version.id:
+            others = [other for other in record.versions if other.id != version.id]
+            record.current_version_id = others[-1].id
+            db.flush()
+        db.delete(version)
+    db.commit()
+    # 物件尚未登記為 Blob，沒有其他引用
+    purge_objects(db, [object_name])
+    return len(versions)
+
+
+@jobs.handler(FINALIZE_UPLOAD_JOB)
+def finalize_upload(payload: dict) -> dict:
+    """
+    計算延後處理上傳的雜湊並改指向內容定址的 Blob。
+
+    以 UPDATE ... WHERE sha1_hash IS NULL 寫入，重複執行或版本已被刪除時不做任何變更。
+    """
+    object_name = payload["object_name"]
+    db = SessionLocal()
+    try:
+        versions = db.query(FileVersion.file_id, FileVersion.content_type, FileVersion.size).filter(
+            FileVersion.object_name == object_name, FileVersion.sha1_hash.is_(None)
+        ).all()
+        if not versions:
+            return {"status": "skipped"}
+
+        content_hash, size = hash_object(object_name)
+        if size != versions[0].size:
+            raise RuntimeError(f"Size mismatch: stored {size} bytes, expected {versions[0].size}")
+        expected_hash = payload.get("expected_hash")
+        if expected_hash and expected_hash != content_hash:
+            db.rollback()
+            removed = reject_upload(db, object_name)
+            print(f"Upload {object_name} rejected: content hash mismatch")
+            return {"status": "rejected", "content_hash": content_hash, "expected_hash": expected_hash,
+                    "versions_removed": removed}
+
+        # 沒有相同內容時直接以上傳的物件作為 Blob；並行完成相同內容時以唯一鍵決定採用哪一個
+        for _ in range(ACQUIRE_ATTEMPTS):
+            blob = find_blob(db, HASH_ALGORITHM, content_hash)
+            if blob is None:
+                _insert_ignore(db, Blob, {
+                    "hash_algorithm": HASH_ALGORITHM,
+                    "content_hash": content_hash,
+                    "bucket_name": storage.BUCKET_NAME,
+                    "object_name": object_name,
+                    "size": size,
+                    "ref_count": 0,
+                    "created_at": datetime.utcnow(),
+                })
+                blob = find_blob(db, HASH_ALGORITHM, content_hash)
+            target = blob.object_name
+
+            updated = db.execute(
+                update(FileVersion)
+                .where(FileVersion.object_name == object_name, FileVersion.sha1_hash.is_(None))
+                .values(sha1_hash=content_hash, hash_algorithm=HASH_ALGORITHM, object_name=target)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not updated:
+                # 雜湊期間版本已被刪除
+                db.rollback()
+                return {"status": "skipped"}
+            if db.query(Blob).filter(Blob.id == blob.id).update(
+                {Blob.ref_count: Blob.ref_count + updated}, synchronize_session=False
+            ) == 1:
+                break
+            # 查詢後並行的 release_blobs 已刪除該 Blob (及其物件)；復原版本的變更，改以本次上傳的物件重新建立
+            db.rollback()
+        else:
+            raise RuntimeError(
+                f"Blob {HASH_ALGORITHM}:{content_hash} was released concurrently {ACQUIRE_ATTEMPTS} times"
+            )
+        metadata_cache.invalidate_files(db, {version.file_id for version in versions})
+        derivatives.enqueue_thumbnails(db, [(target, versions[0].content_type, size)])
+        db.commit()
+
+        deduplicated = target != object_name
+        if deduplicated:
+            discard_objects(db, [object_name])
+        return {"status": "finalized", "content_hash": content_hash, "object_name": target,
+                "deduplicated": deduplicated}
+    finally:
+        db.close()
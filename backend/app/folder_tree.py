@@ -0,0 +1,100 @@
+"""
+資料夾樹的遞迴查詢
+
+資料夾只記錄 parent_id，整棵子樹以 WITH RECURSIVE 一次查出 (SQLite 與 PostgreSQL 皆支援)，
+避免逐層查詢。folders.parent_id 需有索引，遞迴的每一步才是索引查找。
+往上查詢祖先 (更新子樹統計) 時則沿 parent_id 走訪主鍵。
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import literal, select
+from sqlalchemy.orm import Session, aliased
+from .models import Folder
+
+
+def subtree_cte(root_id: Optional[int] = None, max_depth: Optional[int] = None, include_root: bool = True):
+    """
+    子樹的遞迴 CTE (欄位 id, parent_id, name, 子樹統計欄位, depth)。
+
+    Args:
+        root_id: 子樹的根；None 表示從所有頂層資料夾開始
+        max_depth: 最多往下展開的層數 (根為第 0 層)
+        include_root: root_id 本身是否為第 0 層；False 時從其子資料夾開始
+    """
+    anchor = select(
+        Folder.id, Folder.parent_id, Folder.name,
+        Folder.total_file_count, Folder.total_version_count, Folder.total_bytes,
+        literal(0).label("depth")
+    )
+    if root_id is None:
+        anchor = anchor.where(Folder.parent_id.is_(None))
+    elif include_root:
+        anchor = anchor.where(Folder.id == root_id)
+    else:
+        anchor = anchor.where(Folder.parent_id == root_id)
+    tree = anchor.cte("folder_tree", recursive=True)
+
+    child = aliased(Folder)
+    step = select(
+        child.id, child.parent_id, child.name,
+        child.total_file_count, child.total_version_count, child.total_bytes,
+        tree.c.depth + 1
+    ).where(child.parent_id == tree.c.id)
+    if max_depth is not None:
+        step = step.where(tree.c.depth < max_depth)
+    return tree.union_all(step)
+
+
+def subtree_ids(folder_id: int, include_root: bool = True):
+    """子樹 id 的子查詢，可直接用於 IN (...)，不需先載入 id 清單"""
+    return select(subtree_cte(folder_id, include_root=include_root).c.id)
+
+
+def ancestor_pairs(connection, folder_ids: Iterable[int]) -> List[Tuple[int, int]]:
+    """
+    以單一遞迴查詢取得每個資料夾的所有祖先 (含自身)。
+
+    Returns:
+        [(資料夾 id, 祖先 id), ...]
+    """
+    folder_ids = list(folder_ids)
+    if not folder_ids:
+        return []
+    anchor = select(Folder.id.label("origin"), Folder.id, Folder.parent_id).where(Folder.id.in_(folder_ids))
+    chain = anchor.cte("folder_ancestors", recursive=True)
+    parent = aliased(Folder)
+    chain = chain.union_all(
+        select(chain.c.origin, parent.id, parent.parent_id).where(parent.id == chain.c.parent_id)
+    )
+    return [(row.origin, row.id) for row in connection.execute(select(chain.c.origin, chain.c.id))]
+
+
+def subtree_folder_ids(db: Session, folder_id: int, include_root: bool = True) -> List[int]:
+    """資料夾 (及所有子孫) 的 id，依深度由淺至深排列"""
+    tree = subtree_cte(folder_id, include_root=include_root)
+    return list(db.execute(select(tree.c.id).order_by(tree.c.depth)).scalars())
+
+
+def load_tree(db: Session, root_id: Optional[int] = None, max_depth: Optional[int] = None) -> List[dict]:
+    """
+    以單一查詢載入資料夾樹並組成巢狀結構。
+
+    Returns:
+        頂層節點清單 (指定 root_id 時只有該資料夾)，每個節點含 children
+    """
+    tree = subtree_cte(root_id, max_depth)
+    rows = db.execute(select(tree).order_by(tree.c.depth, tree.c.name, tree.c.id)).all()
+
+    nodes: Dict[int, dict] = {}
+    roots = []
+    for row in rows:
+        node = {
+            "id": row.id, "name": row.name, "parent_id": row.parent_id, "depth": row.depth,
+            "total_file_count": row.total_file_count, "total_version_count": row.total_version_count,
+            "total_bytes": row.total_bytes, "children": []
+        }
+        nodes[row.id] = node
+        if row.depth == 0:
+            roots.append(node)
+        else:
+            nodes[row.parent_id]["children"].append(node)
+    return roots
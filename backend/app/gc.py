@@ -0,0 +1,182 @@
+"""
+孤兒物件回收 (garbage collection)
+
+MinIO 中沒有任何 Blob 或 FileVersion 引用的物件視為孤兒，來源包括：
+- 刪除檔案/版本/資料夾時 MinIO 刪除失敗 (記錄於 pending_deletions)
+- 上傳至 MinIO 後資料庫 commit 失敗，物件沒有對應的版本
+- 可續傳上傳組成後未完成建立版本的暫存物件 (uploads/)
+
+回收流程：
+1. 重試 pending_deletions 中的物件
+2. 串流走訪 bucket 的 list_objects，每批與資料庫做 anti-join，
+   只保留目前批次於記憶體中，可處理上千萬個物件的 bucket
+
+最後修改時間在寬限期內的物件一律略過，避免刪除仍在上傳中、尚未寫入資料庫的物件。
+
+使用方式：
+    python -m app.gc --dry-run          # 只回報，不刪除
+    python -m app.gc                    # 刪除孤兒物件
+    python -m app.gc --grace-hours 48
+
+或設定 GC_INTERVAL_HOURS 讓應用程式定期在背景執行 (多個 worker 時建議只在一個實例啟用)。
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .models import PendingDeletion
+from .storage import delete_objects_from_minio, list_objects
+from .blobs import enqueue_pending_deletions, referenced_objects
+from .resumable import expire_sessions
+
+# 建立後未滿寬限期的物件不回收
+GC_GRACE_HOURS = float(os.getenv("GC_GRACE_HOURS", 24))
+# 每批 anti-join 的物件數
+GC_BATCH_SIZE = 500
+# pending_deletions 超過此重試次數後不再自動重試，需人工處理
+GC_MAX_ATTEMPTS = int(os.getenv("GC_MAX_ATTEMPTS", 10))
+# 背景定期回收的間隔 (小時)，0 表示停用，改由排程執行 CLI
+GC_INTERVAL_HOURS = float(os.getenv("GC_INTERVAL_HOURS", 0))
+# 不由 GC 管理的物件前綴
+GC_SKIP_PREFIXES: tuple = ()
+
+
+def _batched(items: Iterable, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _delete_orphans(db: Session, object_names: List[str], stats: Dict[str, int]):
+    """刪除前再確認一次引用，縮短與並行上傳相同內容之間的競態視窗"""
+    still_referenced = referenced_objects(db, object_names)
+    orphans = [name for name in object_names if name not in still_referenced]
+    failures = delete_objects_from_minio(orphans)
+    if failures:
+        enqueue_pending_deletions(db, failures)
+        db.commit()
+    stats["deleted"] += len(orphans) - len(failures)
+    stats["failed"] += len(failures)
+
+
+def drain_pending_deletions(db: Session, dry_run: bool = False) -> Dict[str, int]:
+    """重試 pending_deletions；已被重新引用的物件 (相同內容再次上傳) 直接移出佇列"""
+    stats = {"pending": 0, "deleted": 0, "failed": 0, "rereferenced": 0}
+    last_id = 0
+    while True:
+        entries = db.query(PendingDeletion).filter(
+            PendingDeletion.id > last_id,
+            PendingDeletion.attempts < GC_MAX_ATTEMPTS
+        ).order_by(PendingDeletion.id).limit(GC_BATCH_SIZE).all()
+        if not entries:
+            break
+        last_id = entries[-1].id
+        stats["pending"] += len(entries)
+        if dry_run:
+            continue
+
+        names = [entry.object_name for entry in entries]
+        referenced = referenced_objects(db, names)
+        to_delete = [name for name in names if name not in referenced]
+        failures = delete_objects_from_minio(to_delete)
+
+        now = datetime.utcnow()
+        for entry in entries:
+            if entry.object_name in failures:
+                entry.attempts += 1
+                entry.last_error = failures[entry.object_name][:1000]
+                entry.updated_at = now
+            else:
+                db.delete(entry)
+        db.commit()
+        stats["rereferenced"] += len(referenced)
+        stats["deleted"] += len(to_delete) - len(failures)
+        stats["failed"] += len(failures)
+    return stats
+
+
+def collect_orphans(
+    db: Session,
+    dry_run: bool = False,
+    grace: timedelta = timedelta(hours=GC_GRACE_HOURS),
+    prefix: str = None,
+) -> Dict[str, int]:
+    """
+    串流走訪 bucket 並回收孤兒物件。
+
+    Returns:
+        統計：scanned, referenced, recent (寬限期內), orphaned, orphaned_bytes, deleted, failed
+    """
+    stats = {"scanned": 0, "referenced": 0, "recent": 0, "orphaned": 0, "orphaned_bytes": 0, "deleted": 0, "failed": 0}
+    cutoff = datetime.now(timezone.utc) - grace
+
+    objects = (
+        obj for obj in list_objects(prefix)
+        if not obj.is_dir and not obj.object_name.startswith(GC_SKIP_PREFIXES)
+    )
+    for batch in _batched(objects, GC_BATCH_SIZE):
+        stats["scanned"] += len(batch)
+        referenced = referenced_objects(db, [obj.object_name for obj in batch])
+        orphans = []
+        for obj in batch:
+            if obj.object_name in referenced:
+                stats["referenced"] += 1
+            elif obj.last_modified and obj.last_modified > cutoff:
+                stats["recent"] += 1
+            else:
+                orphans.append(obj.object_name)
+                stats["orphaned_bytes"] += obj.size or 0
+                if dry_run:
+                    print(f"  orphan: {obj.object_name} ({obj.size} bytes, {obj.last_modified})")
+        stats["orphaned"] += len(orphans)
+
+        if orphans and not dry_run:
+            _delete_orphans(db, orphans, stats)
+        # 每批結束釋放交易，避免長時間持有讀取快照
+        db.rollback()
+    return stats
+
+
+def run_gc(dry_run: bool = False, grace_hours: float = GC_GRACE_HOURS, prefix: str = None) -> Dict[str, dict]:
+    """執行一次完整的回收 (重試佇列 + 過期上傳工作階段 + 掃描 bucket)"""
+    db = SessionLocal()
+    try:
+        return {
+            "upload_sessions": {"expired": 0} if dry_run else expire_sessions(db),
+            "pending_deletions": drain_pending_deletions(db, dry_run),
+            "orphans": collect_orphans(db, dry_run, timedelta(hours=grace_hours), prefix),
+        }
+    finally:
+        db.close()
+
+
+async def gc_loop(interval_hours: float = GC_INTERVAL_HOURS):
+    """背景定期回收；在獨立執行緒執行，不佔用儲存執行緒池"""
+    while True:
+        await asyncio.sleep(interval_hours * 3600)
+        try:
+            result = await asyncio.to_thread(run_gc)
+            print(f"GC finished: {result}")
+        except Exception as e:
+            print(f"GC failed: {e}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 孤兒物件回收")
+    parser.add_argument("--dry-run", action="store_true", help="只列出孤兒物件，不刪除")
+    parser.add_argument("--grace-hours", type=float, default=GC_GRACE_HOURS, help="略過最近修改的物件 (小時)")
+    parser.add_argument("--prefix", default=None, help="只掃描此前綴的物件")
+    args = parser.parse_args()
+
+    result = run_gc(args.dry_run, args.grace_hours, args.prefix)
+    for section, stats in result.items():
+        print(f"[{section}] " + ", ".join(f"{key}={value}" for key, value in stats.items()))
@@ -0,0 +1,496 @@
+"""
+批次匯入 (POST /upload/batch)
+
+接受多個檔案或一個 zip / tar 壓縮檔，分兩個階段處理：
+
+1. 上傳階段：依序讀取每個項目並計算內容雜湊，尚未儲存的內容交給有上限的
+   執行緒池並行 PUT 至 MinIO；同一批次中相同的內容只上傳一次。此階段不寫入資料庫，
+   不會長時間持有 SQLite 的寫入鎖。
+2. 寫入階段：資料夾、FileRecord、FileVersion 與 Blob 引用以批次 INSERT / UPDATE
+   在單一交易中寫入。
+
+寫入交易失敗時，本批次新上傳且未被引用的物件會立即刪除 (失敗者進入 pending_deletions)。
+"""
+import mimetypes
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session, joinedload
+from .models import Blob, FileRecord, FileVersion, Folder
+from .blobs import ACQUIRE_ATTEMPTS, _insert_ignore, blob_object_name, discard_objects, find_blob
+from .storage import upload_file_to_minio, BUCKET_NAME
+from .utils import HASH_ALGORITHM, HASH_CHUNK_SIZE, HashingReader, hash_stream, detect_category
+from . import counters, derivatives, metadata_cache, search
+
+# 同時進行的 MinIO PUT 數量；讀取中與等待上傳的項目最多為兩倍，限制暫存檔的用量
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", 8))
+# 壓縮檔內的項目解壓時，超過此大小才寫入磁碟暫存檔
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+# 每個 IN (...) 查詢的檔名數
+LOOKUP_BATCH_SIZE = 500
+
+
+class BatchItem:
+    """批次中的單一項目及其處理結果"""
+
+    def __init__(self, filename: str, path: Optional[str], content_type: str):
+        self.filename = filename
+        self.path = path  # 壓縮檔內的目錄，相對於目標資料夾
+        self.content_type = content_type
+        self.content_hash = None
+        self.size = 0
+        self.object_name = None
+        self.folder_id = None
+        self.file_id = None
+        self.version_number = None
+        self.status = "pending"  # created / versioned / duplicate / failed
+        self.detail = None
+
+    def fail(self, detail: str):
+        self.status = "failed"
+        self.detail = detail
+
+    def to_dict(self) -> dict:
+        return {
+            "filename": self.filename,
+            "path": self.path,
+            "status": self.status,
+            "file_id": self.file_id,
+            "version_number": self.version_number,
+            "size": self.size,
+            "detail": self.detail,
+        }
+
+
+def _split_member_path(name: str) -> Tuple[Optional[str], Optional[str]]:
+    """壓縮檔成員路徑 -> (目錄, 檔名)，移除 .. 等不安全的路徑片段"""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    if not parts or parts[0] == "__MACOSX":
+        return None, None
+    return "/".join(parts[:-1]) or None, parts[-1]
+
+
+def _guess_type(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def iter_archive(archive: UploadFile) -> Iterator[Tuple[str, Optional[str], str, BinaryIO]]:
+    """依序讀取 zip 或 tar (含 gz/bz2/xz) 中的檔案：(檔名, 目錄, content type, 串流)"""
+    fileobj = archive.file
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                path, filename = _split_member_path(info.filename)
+                if filename:
+                    with zf.open(info) as stream:
+                        yield filename, path, _guess_type(filename), stream
+        return
+
+    fileobj.seek(0)
+    try:
+        # 串流模式只順序讀取一次，成員需在取得下一個之前讀完
+        with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                path, filename = _split_member_path(member.name)
+                if filename:
+                    yield filename, path, _guess_type(filename), tar.extractfile(member)
+    except tarfile.ReadError:
+        raise HTTPException(status_code=400, detail="Archive must be a zip or tar file")
+
+
+def _spool(stream: BinaryIO):
+    """將不可 seek 的串流複製到暫存檔，同時計算雜湊"""
+    reader = HashingReader(stream, HASH_ALGORITHM)
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    shutil.copyfileobj(reader, spool, HASH_CHUNK_SIZE)
+    spool.seek(0)
+    return spool, reader.hexdigest(), reader.size
+
+
+def upload_items(db: Session, files: List[UploadFile], archive: Optional[UploadFile]) -> Tuple[List[BatchItem], List[str]]:
+    """
+    上傳階段：計算雜湊並以有上限的執行緒池並行上傳尚未儲存的內容。
+
+    Returns:
+        (所有項目, 本批次新上傳的物件名稱)
+    """
+    sources = [(f.filename, None, f.content_type or _guess_type(f.filename), f.file) for f in files]
+    items = []
+    known = {}  # content_hash -> object_name，同一內容在批次中只處理一次
+    puts = []   # (future, content_hash, object_name)
+    slots = threading.BoundedSemaphore(BATCH_UPLOAD_CONCURRENCY * 2)
+
+    def release(data, spooled: bool):
+        if spooled:
+            data.close()
+        slots.release()
+
+    with ThreadPoolExecutor(max_workers=BATCH_UPLOAD_CONCURRENCY, thread_name_prefix="batch-upload") as pool:
+        entries = iter_archive(archive) if archive is not None else iter(sources)
+        while True:
+            try:
+                filename, path, content_type, stream = next(entries)
+            except StopIteration:
+                break
+            except Exception as e:
+                if isinstance(e, HTTPException) and not items:
+                    raise
+                # 壓縮檔損毀：保留已讀取的項目，並以一個失敗項目回報
+                error_item = BatchItem(archive.filename, None, archive.content_type)
+                error_item.fail(f"Failed to read archive: {e}")
+                items.append(error_item)
+                break
+            item = BatchItem(filename, path, content_type)
+            items.append(item)
+
+            spooled = archive is not None
+            slots.acquire()
+            try:
+                if spooled:
+                    data, item.content_hash, item.size = _spool(stream)
+                else:
+                    data = stream
+                    item.content_hash, item.size = hash_stream(stream, HASH_ALGORITHM)
+            except Exception as e:
+                slots.release()
+                item.fail(f"Failed to read file: {e}")
+                continue
+
+            if item.content_hash in known:
+                item.object_name = known[item.content_hash]
+                release(data, spooled)
+                continue
+
+            blob = find_blob(db, HASH_ALGORITHM, item.content_hash)
+            if blob is not None:
+                item.object_name = known[item.content_hash] = blob.object_name
+                release(data, spooled)
+                continue
+
+            item.object_name = known[item.content_hash] = blob_object_name(HASH_ALGORITHM, item.content_hash)
+            future = pool.submit(upload_file_to_minio, data, item.size, item.object_name, content_type)
+            future.add_done_callback(lambda _, data=data, spooled=spooled: release(data, spooled))
+            puts.append((future, item.content_hash, item.object_name))
+
+    # 讀取階段結束，釋放查詢 Blob 時開啟的讀取交易
+    db.rollback()
+
+    failed = {}
+    uploaded = []
+    for future, content_hash, object_name in puts:
+        error = future.exception()
+        if error is None:
+            uploaded.append(object_name)
+        else:
+            failed[content_hash] = f"Failed to upload to storage: {error}"
+    for item in items:
+        if item.status == "pending" and item.content_hash in failed:
+            item.fail(failed[item.content_hash])
+    return items, uploaded
+
+
+def _resolve_folders(db: Session, base_id: Optional[int], paths) -> Dict[str, int]:
+    """壓縮檔內的目錄 -> 資料夾 id (不存在時建立)"""
+    resolved = {}
+    cache = {}
+    for path in sorted(paths):
+        parent_id = base_id
+        for name in path.split("/"):
+            key = (parent_id, name)
+            if key not in cache:
+                parent_filter = Folder.parent_id == parent_id if parent_id is not None else Folder.parent_id.is_(None)
+                folder = db.query(Folder).filter(parent_filter, Folder.name == name).order_by(Folder.id).first()
+                if folder is None:
+                    folder = Folder(name=name, parent_id=parent_id)
+                    db.add(folder)
+                    db.flush()
+                cache[key] = folder.id
+            parent_id = cache[key]
+        resolved[path] = parent_id
+    return resolved
+
+
+def _find_existing(db: Session, items: List[BatchItem]) -> Dict[tuple, FileRecord]:
+    """批次查詢同資料夾同檔名的既有檔案：(folder_id, filename) -> FileRecord"""
+    by_folder = defaultdict(set)
+    for item in items:
+        by_folder[item.folder_id].add(item.filename)
+
+    existing = {}
+    for folder_id, names in by_folder.items():
+        names = list(names)
+        folder_filter = FileRecord.folder_id == folder_id if folder_id is not None else FileRecord.folder_id.is_(None)
+        for i in range(0, len(names), LOOKUP_BATCH_SIZE):
+            records = db.query(FileRecord).options(joinedload(FileRecord.current_version)).filter(
+                folder_filter, FileRecord.filename.in_(names[i:i + LOOKUP_BATCH_SIZE])
+            ).order_by(FileRecord.id).all()
+            for record in records:
+                existing.setdefault((record.folder_id, record.filename), record)
+    return existing
+
+
+def restore_contents(files: List[UploadFile], archive: Optional[UploadFile], wanted: Dict[str, Tuple[str, str]]):
+    """
+    重新讀取批次的來源並上傳指定的內容 (content_hash -> (物件名稱, content type))。
+
+    上傳階段判定已儲存的內容，在寫入階段前被並行的刪除釋放時使用；
+    壓縮檔重新讀取一次，只上傳需要的成員。
+    """
+    remaining = dict(wanted)
+    if archive is None:
+        for f in files:
+            if not remaining:
+                break
+            f.file.seek(0)
+            content_hash, size = hash_stream(f.file, HASH_ALGORITHM)
+            if content_hash in remaining:
+                object_name, content_type = remaining.pop(content_hash)
+                upload_file_to_minio(f.file, size, object_name, content_type)
+    else:
+        for _, _, _, stream in iter_archive(archive):
+            if not remaining:
+                break
+            data, content_hash, size = _spool(stream)
+            try:
+                if content_hash in remaining:
+                    object_name, content_type = remaining.pop(content_hash)
+                    upload_file_to_minio(data, size, object_name, content_type)
+            finally:
+                data.close()
+    if remaining:
+        raise RuntimeError(f"{len(remaining)} items could not be read again from the batch")
+
+
+def _increment_blobs(db: Session, refs: Counter) -> Dict[str, str]:
+    """
+    增加 Blob 的引用次數 (content_hash -> 次數)。
+
+    以 UPDATE ... RETURNING 只取得實際更新的列，已被並行刪除的 Blob 不會出現在結果中。
+
+    Returns:
+        content_hash -> Blob 的物件名稱
+    """
+    by_count = defaultdict(list)
+    for content_hash, count in refs.items():
+        by_count[count].append(content_hash)
+    found = {}
+    for count, hashes in by_count.items():
+        for i in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+            found.update(db.execute(
+                update(Blob)
+                .where(Blob.hash_algorithm == HASH_ALGORITHM, Blob.content_hash.in_(hashes[i:i + LOOKUP_BATCH_SIZE]))
+                .values(ref_count=Blob.ref_count + count)
+                .returning(Blob.content_hash, Blob.object_name)
+                .execution_options(synchronize_session=False)
+            ).all())
+    return found
+
+
+def _acquire_blobs(
+    db: Session,
+    created: List[BatchItem],
+    uploaded: List[str],
+    restore: Callable[[Dict[str, Tuple[str, str]]], None],
+    now: datetime
+):
+    """
+    建立本批次新上傳物件的 Blob 記錄並增加所有版本的引用次數，將各項目指向實際的 Blob 物件。
+
+    上傳階段查到的 Blob 可能在寫入前被並行的刪除釋放 (物件已刪除)；這些內容以 restore 重新上傳，
+    新上傳的物件加入 uploaded，交易失敗時由呼叫端刪除。
+    """
+    by_hash = {}
+    for item in created:
+        by_hash.setdefault(item.content_hash, item)
+
+    def blob_row(item: BatchItem, object_name: str) -> dict:
+        return {
+            "hash_algorithm": HASH_ALGORITHM,
+            "content_hash": item.content_hash,
+            "bucket_name": BUCKET_NAME,
+            "object_name": object_name,
+            "size": item.size,
+            "ref_count": 0,
+            "created_at": now,
+        }
+
+    uploaded_names = set(uploaded)
+    rows = [blob_row(item, item.object_name) for item in by_hash.values() if item.object_name in uploaded_names]
+    for i in range(0, len(rows), LOOKUP_BATCH_SIZE):
+        _insert_ignore(db, Blob, rows[i:i + LOOKUP_BATCH_SIZE])
+
+    refs = Counter(item.content_hash for item in created)
+    blob_objects = _increment_blobs(db, refs)
+    missing = [content_hash for content_hash in refs if content_hash not in blob_objects]
+    attempts = 0
+    while missing:
+        if attempts == ACQUIRE_ATTEMPTS:
+            raise RuntimeError(f"{len(missing)} blobs were released concurrently {ACQUIRE_ATTEMPTS} times")
+        attempts += 1
+        print(f"{len(missing)} blobs were released during the batch, storing them again")
+        wanted = {
+            content_hash: (blob_object_name(HASH_ALGORITHM, content_hash), by_hash[content_hash].content_type)
+            for content_hash in missing
+        }
+        restore(wanted)
+        uploaded.extend(object_name for object_name, _ in wanted.values())
+        rows = [blob_row(by_hash[content_hash], wanted[content_hash][0]) for content_hash in missing]
+        for i in range(0, len(rows), LOOKUP_BATCH_SIZE):
+            _insert_ignore(db, Blob, rows[i:i + LOOKUP_BATCH_SIZE])
+        blob_objects.update(_increment_blobs(db, Counter({content_hash: refs[content_hash] for content_hash in missing})))
+        missing = [content_hash for content_hash in missing if content_hash not in blob_objects]
+
+    for item in created:
+        item.object_name = blob_objects[item.content_hash]
+
+
+def write_items(
+    db: Session,
+    items: List[BatchItem],
+    folder_id: Optional[int],
+    uploaded: List[str],
+    restore: Callable[[Dict[str, Tuple[str, str]]], None]
+):
+    """
+    寫入階段：以批次 INSERT / UPDATE 在單一交易中建立所有記錄 (呼叫端負責 commit)
+
+    只為本批次新上傳的物件建立 Blob 記錄，既有的 Blob 只增加引用次數；
+    上傳階段之後被並行刪除的 Blob 以 restore 重新上傳 (見 _acquire_blobs)。
+    """
+    pending = [item for item in items if item.status == "pending"]
+    if not pending:
+        return
+
+    folder_ids = _resolve_folders(db, folder_id, {item.path for item in pending if item.path})
+    for item in pending:
+        item.folder_id = folder_ids[item.path] if item.path else folder_id
+
+    # 依序決定每個項目為新檔案、新版本或與目前版本內容相同
+    existing = _find_existing(db, pending)
+    files = {}        # (folder_id, filename) -> 狀態
+    new_files = []    # 需新建的檔案 key (依 INSERT 順序)
+    for item in pending:
+        key = (item.folder_id, item.filename)
+        state = files.get(key)
+        if state is None:
+            record = existing.get(key)
+            current = record.current_version if record else None
+            state = files[key] = {
+                "file_id": record.id if record else None,
+                "count": record.version_count if record else 0,
+                "hash": (current.hash_algorithm, current.sha1_hash) if current else None,
+                "category": record.category if record else detect_category(item.content_type),
+            }
+            if record is None:
+                new_files.append(key)
+
+        if state["hash"] == (HASH_ALGORITHM, item.content_hash):
+            item.status = "duplicate"
+            item.detail = f"相同內容的檔案已存在 (版本 {state['count']})"
+            item.version_number = state["count"]
+            continue
+        state["count"] += 1
+        state["hash"] = (HASH_ALGORITHM, item.content_hash)
+        item.version_number = state["count"]
+        item.status = "created" if state["count"] == 1 else "versioned"
+
+    now = datetime.utcnow()
+    if new_files:
+        # RETURNING 的順序不保證與參數相同 (SQLite)，以 (folder_id, filename) 對應回各檔案
+        rows = db.execute(insert(FileRecord).returning(FileRecord.id, FileRecord.folder_id, FileRecord.filename), [
+            {"filename": name, "category": files[(fid, name)]["category"], "folder_id": fid, "created_at": now}
+            for fid, name in new_files
+        ])
+        for file_id, fid, name in rows:
+            files[(fid, name)]["file_id"] = file_id
+        search.index_files(db.connection(), [
+            SimpleNamespace(id=files[key]["file_id"], filename=key[1], tags=[]) for key in new_files
+        ])
+
+    for item in pending:
+        item.file_id = files[(item.folder_id, item.filename)]["file_id"]
+
+    created = [item for item in pending if item.status in ("created", "versioned")]
+    if not created:
+        return
+
+    _acquire_blobs(db, created, uploaded, restore, now)
+
+    rows = db.execute(insert(FileVersion).returning(FileVersion.id, FileVersion.file_id, FileVersion.version_number), [
+        {
+            "file_id": item.file_id,
+            "version_number": item.version_number,
+            "sha1_hash": item.content_hash,
+            "hash_algorithm": HASH_ALGORITHM,
+            "size": item.size,
+            "content_type": item.content_type,
+            "bucket_name": BUCKET_NAME,
+            "object_name": item.object_name,
+            "uploaded_at": now,
+        }
+        for item in created
+    ])
+    version_ids = {(file_id, version_number): version_id for version_id, file_id, version_number in rows}
+
+    # 每個檔案的目前版本指向批次中最後建立的版本
+    current = {}
+    for item in created:
+        current[item.file_id] = version_ids[(item.file_id, item.version_number)]
+    db.execute(update(FileRecord), [{"id": fid, "current_version_id": vid} for fid, vid in current.items()])
+    metadata_cache.invalidate_files(db, current)
+    derivatives.enqueue_thumbnails(db, [(item.object_name, item.content_type, item.size) for item in created])
+
+    # 批次 INSERT 不經過 ORM flush，需自行更新統計計數
+    delta = counters.StatsDelta()
+    for fid, name in new_files:
+        delta.add(files[(fid, name)]["category"], fid, files=1)
+    for item in created:
+        delta.add(files[(item.folder_id, item.filename)]["category"], item.folder_id, versions=1, size=item.size)
+    delta.apply(db.connection())
+
+
+def store_batch(files: List[UploadFile], archive: Optional[UploadFile], folder_id: Optional[int], db: Session) -> dict:
+    """批次匯入的阻塞部分；回傳每個項目的結果"""
+    if folder_id is not None and not db.query(Folder.id).filter(Folder.id == folder_id).first():
+        raise HTTPException(status_code=404, detail="Folder not found")
+
+    items, uploaded = upload_items(db, files, archive)
+
+    try:
+        write_items(db, items, folder_id, uploaded, lambda wanted: restore_contents(files, archive, wanted))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        discard_objects(db, uploaded)
+        raise HTTPException(status_code=500, detail=f"Failed to save batch: {e}")
+
+    # 只被判定為重複內容的項目引用、最終沒有版本使用的新物件
+    referenced = {item.object_name for item in items if item.status in ("created", "versioned")}
+    unused = [name for name in uploaded if name not in referenced]
+    if unused:
+        discard_objects(db, unused)
+
+    counts = Counter(item.status for item in items)
+    return {
+        "total": len(items),
+        "created": counts["created"],
+        "versioned": counts["versioned"],
+        "duplicate": counts["duplicate"],
+        "failed": counts["failed"],
+        "items": [item.to_dict() for item in items],
+    }
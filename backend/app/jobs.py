@@ -0,0 +1,361 @@
+"""
+背景工作佇列 (存放在應用程式的資料庫中，不需外部 broker)
+
+上傳後不需在請求中完成的處理 (延後的雜湊與去重、縮圖) 以工作的形式寫入 jobs 表，
+由 worker 執行緒認領執行：
+- 工作與產生它的資料 (例如檔案版本) 在同一個交易中寫入：交易 rollback 時工作一併消失，
+  commit 後才會被認領，不會處理到尚未存在的資料
+- 以 UPDATE ... WHERE status = 'queued' 認領，多個 worker 行程 (gunicorn) 共用同一個佇列不會重複執行
+- 執行中的工作帶有租約 (locked_until)；worker 行程中斷時租約逾期，工作重新被認領
+- 失敗的工作以指數退避重試，超過 max_attempts 次後標記為 failed，可由 POST /jobs/{id}/retry 重新排入
+- 成功的工作保留 JOB_RETENTION_DAYS 天供查詢後刪除
+
+工作處理函式以 @handler("類型") 註冊，接收 payload (dict)，回傳值 (可轉為 JSON) 記錄為結果；
+處理函式需可重複執行 (租約逾期或重試時同一個工作可能執行多次)。
+
+API 行程預設啟動 JOB_WORKERS 個 worker 執行緒；設為 0 時改以獨立行程執行：
+    python -m app.jobs --worker
+    python -m app.jobs --worker --drain   # 處理完目前到期的工作後結束
+"""
+import importlib
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from sqlalchemy import delete, event, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .models import Job
+
+# API 行程內的 worker 執行緒數；0 表示不在 API 行程執行 (改以 python -m app.jobs --worker 執行)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+# 第 n 次失敗後等待 JOB_RETRY_SECONDS * 2^(n-1) 秒再重試，最長 JOB_RETRY_MAX_SECONDS
+JOB_RETRY_SECONDS = float(os.getenv("JOB_RETRY_SECONDS", 5))
+JOB_RETRY_MAX_SECONDS = 3600
+# 沒有到期的工作時，worker 輪詢資料庫的間隔 (同一行程排入的工作會立即喚醒 worker)
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 2))
+# 執行中工作的租約；逾期未完成視為 worker 中斷，重新認領
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 600))
+# 成功的工作保留天數
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", 7))
+# 清除過期工作的間隔 (秒)
+JOB_PURGE_INTERVAL = 3600
+# 每次認領時考慮的候選工作數 (其他 worker 搶先認領時改試下一個)
+CLAIM_CANDIDATES = 10
+# 註冊工作處理函式的模組，worker 開始認領前載入
+HANDLER_MODULES = ("derivatives", "finalize")
+
+_WAKE_KEY = "jobs_enqueued"
+
+_handlers: Dict[str, Callable[[dict], Any]] = {}
+_wakeup = threading.Event()
+_stop = threading.Event()
+_threads: List[threading.Thread] = []
+_last_purge = 0.0
+_purge_lock = threading.Lock()
+
+
+def handler(job_type: str):
+    """註冊工作類型的處理函式"""
+    def register(fn: Callable[[dict], Any]):
+        _handlers[job_type] = fn
+        return fn
+    return register
+
+
+def load_handlers():
+    for name in HANDLER_MODULES:
+        importlib.import_module(f".{name}", __package__)
+
+
+# ========== 排入 ==========
+
+def _job_values(job_type: str, payload: dict, delay_seconds: float, max_attempts: Optional[int]) -> dict:
+    now = datetime.utcnow()
+    return {
+        "type": job_type,
+        "payload": json.dumps(payload),
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts or JOB_MAX_ATTEMPTS,
+        "run_after": now + timedelta(seconds=delay_seconds),
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def enqueue(db: Session, job_type: str, payload: dict, delay_seconds: float = 0,
+            max_attempts: Optional[int] = None) -> int:
+    """
+    在目前的交易中排入一個工作，回傳工作 id。
+
+    工作於交易 commit 後才可被認領；呼叫端負責 commit。
+    """
+    job_id = db.execute(
+        insert(Job).values(_job_values(job_type, payload, delay_seconds, max_attempts)).returning(Job.id)
+    ).scalar_one()
+    db.info[_WAKE_KEY] = True
+    return job_id
+
+
+def enqueue_many(db: Session, job_type: str, payloads: Iterable[dict]):
+    """批次排入多個相同類型的工作 (可在 ORM flush 事件中呼叫)"""
+    rows = [_job_values(job_type, payload, 0, None) for payload in payloads]
+    if rows:
+        db.execute(insert(Job), rows)
+        db.info[_WAKE_KEY] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _wake_workers(session: Session):
+    if session.info.pop(_WAKE_KEY, False):
+        _wakeup.set()
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_wakeup(session: Session):
+    session.info.pop(_WAKE_KEY, None)
+
+
+# ========== 認領與執行 ==========
+
+def retry_delay(attempts: int) -> float:
+    return min(JOB_RETRY_SECONDS * 2 ** max(attempts - 1, 0), JOB_RETRY_MAX_SECONDS)
+
+
+def claim(db: Session, worker: str) -> Optional[SimpleNamespace]:
+    """
+    認領一個到期的工作 (或租約逾期的執行中工作)；沒有時回傳 None。
+
+    回傳工作的快照並結束交易，執行處理函式期間不佔用資料庫交易。
+    """
+    now = datetime.utcnow()
+    runnable = or_(
+        (Job.status == "queued") & (Job.run_after <= now),
+        (Job.status == "running") & (Job.locked_until < now),
+    )
+    candidates = db.execute(
+        select(Job.id).where(runnable).order_by(Job.run_after, Job.id).limit(CLAIM_CANDIDATES)
+    ).scalars().all()
+    for job_id in candidates:
+        claimed = db.execute(
+            update(Job)
+            .where(Job.id == job_id, runnable)
+            .values(
+                status="running",
+                attempts=Job.attempts + 1,
+                locked_until=now + timedelta(seconds=JOB_LEASE_SECONDS),
+                worker=worker,
+                updated_at=now,
+            )
+        ).rowcount
+        if claimed:
+            job = db.get(Job, job_id)
+            snapshot = SimpleNamespace(
+                id=job.id, type=job.type, payload=job.payload, attempts=job.attempts,
+                max_attempts=job.max_attempts, worker=job.worker, last_error=job.last_error,
+            )
+            db.commit()
+            return snapshot
+        db.commit()
+    return None
+
+
+def _finish(db: Session, job: SimpleNamespace, values: dict) -> bool:
+    """更新執行結果；工作已被其他 worker 重新認領 (租約逾期) 時不覆寫"""
+    values["updated_at"] = datetime.utcnow()
+    updated = db.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.status == "running", Job.attempts == job.attempts, Job.worker == job.worker)
+        .values(locked_until=None, **values)
+    ).rowcount
+    db.commit()
+    return bool(updated)
+
+
+def execute(db: Session, job: SimpleNamespace) -> str:
+    """
+    執行已認領的工作並記錄結果。
+
+    Returns:
+        工作的最終狀態 (succeeded / queued 等待重試 / failed)
+    """
+    run = _handlers.get(job.type)
+    if run is None:
+        _finish(db, job, {"status": "failed", "last_error": f"Unknown job type: {job.type}",
+                          "finished_at": datetime.utcnow()})
+        return "failed"
+    if job.attempts > job.max_attempts:
+        # 前一次執行時 worker 中斷 (租約逾期) 且已用完重試次數
+        _finish(db, job, {"status": "failed", "last_error": job.last_error or "Worker lost",
+                          "finished_at": datetime.utcnow()})
+        return "failed"
+
+    try:
+        result = run(json.loads(job.payload))
+    except Exception as e:
+        db.rollback()
+        print(f"Job {job.id} ({job.type}) failed (attempt {job.attempts}/{job.max_attempts}): {e}")
+        error = str(e)[:1000]
+        if job.attempts >= job.max_attempts:
+            values = {"status": "failed", "last_error": error, "finished_at": datetime.utcnow()}
+        else:
+            values = {"status": "queued", "last_error": error,
+                      "run_after": datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))}
+        _finish(db, job, values)
+        return values["status"]
+
+    _finish(db, job, {"status": "succeeded", "result": json.dumps(result, default=str),
+                      "finished_at": datetime.utcnow()})
+    return "succeeded"
+
+
+def purge_finished(db: Session) -> int:
+    """刪除超過保留天數的成功工作 (失敗的工作保留，供查詢與重試)"""
+    cutoff = datetime.utcnow() - timedelta(days=JOB_RETENTION_DAYS)
+    deleted = db.execute(
+        delete(Job).where(Job.status == "succeeded", Job.finished_at < cutoff)
+    ).rowcount
+    db.commit()
+    return deleted
+
+
+def _maybe_purge(db: Session):
+    global _last_purge
+    with _purge_lock:
+        if time.monotonic() - _last_purge < JOB_PURGE_INTERVAL:
+            return
+        _last_purge = time.monotonic()
+    try:
+        deleted = purge_finished(db)
+        if deleted:
+            print(f"Purged {deleted} finished jobs")
+    except Exception as e:
+        db.rollback()
+        print(f"Job purge failed: {e}")
+
+
+def work(worker: str, drain: bool = False) -> int:
+    """
+    worker 迴圈：認領並執行工作，沒有到期的工作時等待喚醒或輪詢。
+
+    drain 為 True 時在沒有到期的工作時結束。回傳執行的工作數。
+    """
+    load_handlers()
+    processed = 0
+    while not _stop.is_set():
+        db = SessionLocal()
+        try:
+            _maybe_purge(db)
+            job = claim(db, worker)
+            if job is not None:
+                execute(db, job)
+                processed += 1
+                continue
+        except Exception as e:
+            db.rollback()
+            print(f"Error in job worker {worker}: {e}")
+        finally:
+            db.close()
+        if drain:
+            break
+        _wakeup.wait(JOB_POLL_SECONDS)
+        _wakeup.clear()
+    return processed
+
+
+def start_workers(count: int = JOB_WORKERS):
+    """在本行程啟動 worker 執行緒 (daemon，行程結束時不等待執行中的工作；中斷的工作於租約逾期後重新執行)"""
+    _stop.clear()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    for i in range(count):
+        thread = threading.Thread(target=work, args=(f"{prefix}:{i}",), name=f"jobs-{i}", daemon=True)
+        thread.start()
+        _threads.append(thread)
+
+
+def stop_workers(timeout: float = 5):
+    """通知 worker 執行緒在目前的工作完成後結束"""
+    _stop.set()
+    _wakeup.set()
+    for thread in _threads:
+        thread.join(timeout)
+    _threads.clear()
+
+
+# ========== 查詢 ==========
+
+def job_state(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "type": job.type,
+        "status": job.status,
+        "payload": json.loads(job.payload),
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "last_error": job.last_error,
+        "result": json.loads(job.result) if job.result else None,
+        "run_after": job.run_after,
+        "created_at": job.created_at,
+        "updated_at": job.updated_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def retry(db: Session, job_id: int) -> Optional[Job]:
+    """將失敗的工作重新排入 (重試次數歸零)；工作不存在或不是 failed 時回傳 None"""
+    now = datetime.utcnow()
+    updated = db.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "failed")
+        .values(status="queued", attempts=0, run_after=now, finished_at=None, updated_at=now)
+    ).rowcount
+    db.info[_WAKE_KEY] = True
+    db.commit()
+    return db.get(Job, job_id) if updated else None
+
+
+def queue_stats(db: Session) -> dict:
+    """各類型、各狀態的工作數，以及最早一個到期未執行工作的等待秒數"""
+    counts = {}
+    for job_type, status, count in db.query(Job.type, Job.status, func.count(Job.id)).group_by(Job.type, Job.status):
+        counts.setdefault(job_type, {})[status] = count
+    oldest = db.query(func.min(Job.run_after)).filter(Job.status == "queued").scalar()
+    lag = (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+    return {
+        "workers": len([thread for thread in _threads if thread.is_alive()]),
+        "types": counts,
+        "oldest_queued_seconds": round(max(lag, 0), 1),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 背景工作 worker")
+    parser.add_argument("--worker", action="store_true", help="執行工作")
+    parser.add_argument("--threads", type=int, default=max(JOB_WORKERS, 1), help="worker 執行緒數")
+    parser.add_argument("--drain", action="store_true", help="處理完目前到期的工作後結束")
+    args = parser.parse_args()
+
+    if args.worker:
+        # python -m 執行的是本模組的 __main__ 副本；處理函式註冊在 app.jobs 的登錄表
+        from app import jobs
+
+        if args.drain:
+            print(f"完成 {jobs.work(f'{socket.gethostname()}:{os.getpid()}', drain=True)} 個工作")
+        else:
+            jobs.start_workers(args.threads)
+            print(f"已啟動 {args.threads} 個 worker 執行緒 (Ctrl-C 結束)")
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                jobs.stop_workers()
+    else:
+        parser.print_help()
@@ -1,11 +1,19 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .database import engine, Base
 from .storage import init_bucket
-from .routers import files, folders, stats
+from .search import init_search_index
+from .counters import init_stats_counters
+from .gc import gc_loop, GC_INTERVAL_HOURS
+from .resumable import session_sweep_loop, UPLOAD_SWEEP_INTERVAL_MINUTES
+from .jobs import start_workers, stop_workers, JOB_WORKERS
+from .routers import files, folders, jobs, objects, stats, uploads
 
 # Create tables
 Base.metadata.create_all(bind=engine)
+init_search_index(engine)
+init_stats_counters(engine)
 
 app = FastAPI(title="DMS Backend")
 
@@ -15,16 +23,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Location", "Upload-Offset", "Upload-Length", "X-Next-Part"],
 )
 
 @app.on_event("startup")
 def startup_event():
-    # Ensure MinIO bucket exists
+    # Ensure the bucket (or local storage directory) exists
     try:
         init_bucket()
     except Exception as e:
-        print(f"Error initializing MinIO bucket: {e}")
+        print(f"Error initializing storage: {e}")
+
+_background_tasks = set()
+
+@app.on_event("startup")
+async def start_background_gc():
+    if GC_INTERVAL_HOURS > 0:
+        task = asyncio.create_task(gc_loop(GC_INTERVAL_HOURS))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+@app.on_event("startup")
+async def start_upload_session_sweep():
+    if UPLOAD_SWEEP_INTERVAL_MINUTES > 0:
+        task = asyncio.create_task(session_sweep_loop(UPLOAD_SWEEP_INTERVAL_MINUTES))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+@app.on_event("startup")
+def start_job_workers():
+    if JOB_WORKERS > 0:
+        start_workers(JOB_WORKERS)
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    stop_workers()
 
 app.include_router(files.router)
 app.include_router(folders.router)
 app.include_router(stats.router)
+app.include_router(uploads.router)
+app.include_router(objects.router)
+app.include_router(jobs.router)
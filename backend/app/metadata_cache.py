@@ -0,0 +1,187 @@
+"""
+檔案中繼資料快取 (下載、檔案資訊、分享連結使用)
+
+快取內容為檔案記錄與當前版本的快照 (dict)，以 file_id 為鍵：
+- 預設為行程內的 LRU 快取，最多 METADATA_CACHE_SIZE 筆，每筆 METADATA_CACHE_TTL_SECONDS 秒後過期
+- 設定 METADATA_CACHE_URL (redis://...) 時改用 Redis，多個 gunicorn worker 共用同一份快取與失效
+  (需安裝 redis 套件)
+
+改名、移動、新版本、還原、標籤變更及刪除於 ORM flush 時記錄受影響的檔案，交易 commit 後才失效，
+避免其他請求在 commit 前讀到舊資料並重新寫入快取。批次 SQL (批次匯入、資料夾刪除) 需自行呼叫
+invalidate_files。
+
+僅使用行程內快取時，其他 worker 的失效最多延遲 TTL 秒。
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .models import FileRecord, FileVersion
+
+# 行程內快取的筆數上限，0 表示停用快取
+METADATA_CACHE_SIZE = int(os.getenv("METADATA_CACHE_SIZE", 10000))
+METADATA_CACHE_TTL_SECONDS = float(os.getenv("METADATA_CACHE_TTL_SECONDS", 5))
+# 共用快取 (例: redis://localhost:6379/0)；未設定時使用行程內快取
+METADATA_CACHE_URL = os.getenv("METADATA_CACHE_URL", "")
+
+KEY_PREFIX = "dms:file:"
+# 快照中的日期時間欄位 (Redis 以 JSON 儲存，讀回時轉回 datetime)
+_DATETIME_FIELDS = ("uploaded_at",)
+_PENDING_KEY = "metadata_cache_file_ids"
+
+
+class LocalCache:
+    """執行緒安全的 LRU + TTL 快取"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, file_id: int) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(file_id)
+            if entry is None:
+                return None
+            expires, value = entry
+            if time.monotonic() >= expires:
+                del self.entries[file_id]
+                return None
+            self.entries.move_to_end(file_id)
+            return value
+
+    def set(self, file_id: int, value: dict):
+        with self.lock:
+            self.entries[file_id] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(file_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, file_ids: Iterable[int]):
+        with self.lock:
+            for file_id in file_ids:
+                self.entries.pop(file_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class RedisCache:
+    """Redis 共用快取；連線失敗時視為未命中，不影響請求"""
+
+    def __init__(self, url: str, ttl: float):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.ttl = max(1, int(ttl))
+
+    def get(self, file_id: int) -> Optional[dict]:
+        try:
+            raw = self.client.get(f"{KEY_PREFIX}{file_id}")
+        except Exception as e:
+            print(f"Metadata cache unavailable: {e}")
+            return None
+        return _decode(json.loads(raw)) if raw else None
+
+    def set(self, file_id: int, value: dict):
+        try:
+            self.client.setex(f"{KEY_PREFIX}{file_id}", self.ttl, json.dumps(value, default=_encode))
+        except Exception as e:
+            print(f"Metadata cache unavailable: {e}")
+
+    def delete(self, file_ids: Iterable[int]):
+        keys = [f"{KEY_PREFIX}{file_id}" for file_id in file_ids]
+        if not keys:
+            return
+        try:
+            self.client.delete(*keys)
+        except Exception as e:
+            print(f"Failed to invalidate metadata cache: {e}")
+
+    def clear(self):
+        try:
+            keys = list(self.client.scan_iter(f"{KEY_PREFIX}*"))
+            if keys:
+                self.client.delete(*keys)
+        except Exception as e:
+            print(f"Failed to clear metadata cache: {e}")
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _decode(snapshot: dict) -> dict:
+    for item in (snapshot, snapshot.get("current_version")):
+        for field in _DATETIME_FIELDS:
+            if item and item.get(field):
+                item[field] = datetime.fromisoformat(item[field])
+    return snapshot
+
+
+def _create_backend():
+    if METADATA_CACHE_URL:
+        return RedisCache(METADATA_CACHE_URL, METADATA_CACHE_TTL_SECONDS)
+    if METADATA_CACHE_SIZE > 0 and METADATA_CACHE_TTL_SECONDS > 0:
+        return LocalCache(METADATA_CACHE_SIZE, METADATA_CACHE_TTL_SECONDS)
+    return None
+
+
+backend = _create_backend()
+
+
+def get(file_id: int) -> Optional[dict]:
+    return backend.get(file_id) if backend is not None else None
+
+
+def put(file_id: int, snapshot: dict):
+    if backend is not None:
+        backend.set(file_id, snapshot)
+
+
+def clear():
+    if backend is not None:
+        backend.clear()
+
+
+def invalidate_files(db: Session, file_ids: Iterable[int]):
+    """記錄待失效的檔案，於交易 commit 後失效 (批次 SQL 修改檔案時呼叫)"""
+    db.info.setdefault(_PENDING_KEY, set()).update(file_ids)
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_changed_files(session: Session, flush_context):
+    """flush 後記錄新增、修改 (含標籤、當前版本) 或刪除的檔案與版本所屬的檔案"""
+    if backend is None:
+        return
+    file_ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, FileRecord):
+            file_ids.add(obj.id)
+        elif isinstance(obj, FileVersion):
+            file_ids.add(obj.file_id)
+    file_ids.discard(None)
+    if file_ids:
+        invalidate_files(session, file_ids)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_committed(session: Session):
+    file_ids = session.info.pop(_PENDING_KEY, None)
+    if file_ids and backend is not None:
+        backend.delete(file_ids)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_pending(session: Session):
+    session.info.pop(_PENDING_KEY, None)
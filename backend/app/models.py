@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Table
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, Boolean, String, DateTime, ForeignKey, Table, UniqueConstraint, Index, select, func
+from sqlalchemy.orm import relationship, column_property
 from datetime import datetime
 from .database import Base
 
@@ -19,24 +19,157 @@ class Folder(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    parent_id = Column(Integer, ForeignKey("folders.id"), nullable=True)
+    parent_id = Column(Integer, ForeignKey("folders.id"), nullable=True, index=True)
+    # 子樹統計 (含所有子資料夾)，隨檔案新增/刪除/移動沿祖先鏈遞增更新 (見 app/counters.py)
+    total_file_count = Column(BigInteger, default=0, nullable=False)
+    total_version_count = Column(BigInteger, default=0, nullable=False)
+    total_bytes = Column(BigInteger, default=0, nullable=False)
     
     files = relationship("FileRecord", back_populates="folder")
     subfolders = relationship("Folder", backref="parent", remote_side=[id])
 
 
+class Blob(Base):
+    """內容定址物件 - 以完整內容雜湊識別，可被多個檔案版本共用"""
+    __tablename__ = "blobs"
+    __table_args__ = (
+        UniqueConstraint("hash_algorithm", "content_hash", name="uq_blobs_hash"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    hash_algorithm = Column(String(16), nullable=False)
+    # 舊版取樣雜湊無法用於內容比對，遷移後為 NULL
+    content_hash = Column(String(128), nullable=True)
+    bucket_name = Column(String)
+    object_name = Column(String, unique=True, nullable=False)
+    size = Column(BigInteger)
+    ref_count = Column(Integer, default=0, nullable=False)  # 引用此物件的 FileVersion 數量
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class PendingDeletion(Base):
+    """待刪除物件 - MinIO 刪除失敗的物件，留待重試，避免成為無人知曉的孤兒物件"""
+    __tablename__ = "pending_deletions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    bucket_name = Column(String)
+    object_name = Column(String, unique=True, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Derivative(Base):
+    """衍生檔 (縮圖、預覽) - 依來源物件產生，相同內容的檔案與版本共用 (見 app/derivatives.py)"""
+    __tablename__ = "derivatives"
+    __table_args__ = (
+        UniqueConstraint("source_object", "kind", name="uq_derivatives_source_kind"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_object = Column(String, nullable=False)  # 來源物件 (Blob.object_name)
+    kind = Column(String(32), nullable=False)  # thumbnail-{尺寸}
+    object_name = Column(String, nullable=False)  # 衍生檔物件 (derivatives/...)
+    status = Column(String(16), default="pending", nullable=False)  # pending / processing / ready / failed / unsupported
+    size = Column(BigInteger, nullable=True)
+    content_type = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Job(Base):
+    """背景工作 - 上傳後的處理 (雜湊、去重、縮圖) 排入資料庫佇列，由 worker 執行緒認領 (見 app/jobs.py)"""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # worker 依 (status, run_after) 認領到期的工作
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    type = Column(String(32), nullable=False)  # finalize_upload / thumbnail
+    payload = Column(String, nullable=False)  # JSON
+    status = Column(String(16), default="queued", nullable=False)  # queued / running / succeeded / failed
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=5, nullable=False)
+    run_after = Column(DateTime, nullable=False)  # 排入或重試的時間
+    locked_until = Column(DateTime, nullable=True)  # 執行中的租約，逾期視為 worker 中斷
+    worker = Column(String, nullable=True)
+    last_error = Column(String, nullable=True)
+    result = Column(String, nullable=True)  # JSON
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class StatsCounter(Base):
+    """統計計數器 - 於寫入時遞增維護，/stats 不需掃描全表 (見 app/counters.py)"""
+    __tablename__ = "stats_counters"
+    __table_args__ = (
+        UniqueConstraint("scope", "key", name="uq_stats_counters_scope_key"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String(16), nullable=False)  # total / category / folder
+    key = Column(String, nullable=False)  # 分類名稱或資料夾 id ("0" 為根目錄)
+    file_count = Column(BigInteger, default=0, nullable=False)
+    version_count = Column(BigInteger, default=0, nullable=False)
+    total_bytes = Column(BigInteger, default=0, nullable=False)
+
+
+class UploadSession(Base):
+    """可續傳上傳工作階段 - 對應 MinIO 的 multipart upload，依序接收分段後組成檔案版本"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(32), primary_key=True)  # uuid4 hex，作為不可猜測的上傳網址
+    filename = Column(String, nullable=False)
+    content_type = Column(String)
+    folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True)
+    size = Column(BigInteger, nullable=False)  # 宣告的檔案總大小
+    object_name = Column(String, nullable=False)  # 暫存物件 (uploads/{id})
+    multipart_upload_id = Column(String, nullable=False)
+    received_bytes = Column(BigInteger, default=0, nullable=False)
+    next_part = Column(Integer, default=1, nullable=False)
+    status = Column(String(16), default="active", nullable=False)  # active / assembled
+    # 直接上傳：客戶端以預簽名網址將分段直接傳至 MinIO，不經過 API
+    direct = Column(Boolean, default=False, nullable=False)
+    expected_hash = Column(String(128), nullable=True)  # 客戶端宣告的內容雜湊，完成時驗證
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    parts = relationship("UploadPart", order_by="UploadPart.part_number", cascade="all, delete-orphan")
+
+
+class UploadPart(Base):
+    """已接收的分段 (multipart part)，完成上傳時依序組成物件"""
+    __tablename__ = "upload_parts"
+    __table_args__ = (
+        UniqueConstraint("session_id", "part_number", name="uq_upload_parts_number"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(String(32), ForeignKey("upload_sessions.id"), nullable=False, index=True)
+    part_number = Column(Integer, nullable=False)
+    etag = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
+
+
 class FileVersion(Base):
     """檔案版本 - 儲存每個版本的實際檔案資料"""
     __tablename__ = "file_versions"
 
     id = Column(Integer, primary_key=True, index=True)
-    file_id = Column(Integer, ForeignKey("file_records.id"), nullable=False)
+    file_id = Column(Integer, ForeignKey("file_records.id"), nullable=False, index=True)
     version_number = Column(Integer, default=1)
-    sha1_hash = Column(String(40), index=True)  # SHA1 produces 40 hex chars
-    size = Column(Integer)
+    # 內容雜湊 (hex)；欄位名稱沿用 sha1_hash 以維持 API 相容，實際演算法見 hash_algorithm
+    sha1_hash = Column(String(128), index=True)  # blake2b produces up to 128 hex chars
+    hash_algorithm = Column(String(16), default="sha1")  # sha1 / sha256 / blake2b / sha1-sampled
+    size = Column(BigInteger)
     content_type = Column(String)
     bucket_name = Column(String)
-    object_name = Column(String, unique=True)
+    object_name = Column(String, index=True)  # 對應 Blob.object_name，相同內容的版本共用
     uploaded_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationship back to FileRecord
@@ -46,15 +179,23 @@ class FileVersion(Base):
 class FileRecord(Base):
     """檔案記錄 - 代表邏輯檔案，可關聯多個版本"""
     __tablename__ = "file_records"
+    __table_args__ = (
+        # 支援 (created_at, id) 游標分頁
+        Index("ix_file_records_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
     category = Column(String, index=True)
-    folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True)
+    folder_id = Column(Integer, ForeignKey("folders.id"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # 指向當前版本 (使用 use_alter 避免循環依賴)
-    current_version_id = Column(Integer, ForeignKey("file_versions.id", use_alter=True), nullable=True)
+    current_version_id = Column(
+        Integer,
+        ForeignKey("file_versions.id", use_alter=True, name="fk_file_records_current_version_id"),
+        nullable=True
+    )
 
     # Relationships
     folder = relationship("Folder", back_populates="files")
@@ -64,6 +205,14 @@ class FileRecord(Base):
     # 當前版本快捷屬性
     current_version = relationship("FileVersion", foreign_keys=[current_version_id], post_update=True)
     
+    # 版本數量 (相關子查詢，隨檔案記錄一併載入，不需逐筆載入 versions)
+    version_count = column_property(
+        select(func.count(FileVersion.id))
+        .where(FileVersion.file_id == id)
+        .correlate_except(FileVersion)
+        .scalar_subquery()
+    )
+    
     # 向後相容的屬性 (從當前版本取得)
     @property
     def content_type(self):
@@ -0,0 +1,452 @@
+"""
+可續傳上傳 (分段上傳)
+
+大檔案以工作階段分段上傳，每個分段直接對應 MinIO multipart upload 的一個 part，
+連線中斷時只需重傳未完成的分段：
+1. POST /uploads 建立工作階段 (宣告檔名與總大小)，同時建立 multipart upload
+2. 依序 PUT /uploads/{id}/parts/{n} 上傳分段；中斷後以 HEAD /uploads/{id} 查詢已接收的位元組數與下一個分段編號
+3. POST /uploads/{id}/complete 組成物件並建立檔案版本
+
+內容雜湊隨分段遞增計算 (保存在行程記憶體中，不需在完成時重新讀取整個檔案)；
+hashlib 的狀態無法存入資料庫，分段若由不同的 worker 行程接收或行程重啟，完成時改為與延後處理的上傳相同：
+版本先指向組成的物件並立即回應，雜湊與去重由 finalize_upload 背景工作處理 (見 app/finalize.py)。
+
+直接上傳 (direct) 的工作階段改由 API 發出各分段的預簽名 PUT 網址，客戶端將分段直接傳至 MinIO，
+API 不經手任何上傳資料；完成時自 MinIO 列出已上傳的分段、核對大小並組成物件，雜湊、去重與宣告雜湊的
+驗證一律交由 finalize_upload 背景工作 (不在請求中讀回物件)。
+
+超過 UPLOAD_SESSION_TTL_HOURS 未收到分段的工作階段視為放棄，由過期清理中止其 multipart upload。
+"""
+import asyncio
+import math
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from .models import Folder, UploadSession, UploadPart
+from .storage import (
+    create_multipart_upload, upload_part, complete_multipart_upload, abort_multipart_upload,
+    list_uploaded_parts, list_objects, get_presigned_part_url, MIN_PART_SIZE
+)
+from .blobs import discard_objects, purge_objects
+from .utils import HASH_ALGORITHM, new_hasher
+
+# 工作階段在最後一次收到分段後的保留時間
+UPLOAD_SESSION_TTL_HOURS = float(os.getenv("UPLOAD_SESSION_TTL_HOURS", 24))
+# 建議的分段大小；檔案過大時自動放大，讓分段數不超過 S3 上限
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 16 * 1024 * 1024))
+# 單一分段的大小上限 (分段在記憶體中轉送至 MinIO)
+UPLOAD_MAX_CHUNK_SIZE = int(os.getenv("UPLOAD_MAX_CHUNK_SIZE", 64 * 1024 * 1024))
+# 過期清理的間隔 (分鐘)，0 表示停用 (仍會在 python -m app.gc 時執行)
+UPLOAD_SWEEP_INTERVAL_MINUTES = float(os.getenv("UPLOAD_SWEEP_INTERVAL_MINUTES", 60))
+# S3 單一 multipart upload 最多 10000 個 part
+MAX_PARTS = 10000
+# 直接上傳的預簽名網址有效時間 (分鐘)
+UPLOAD_URL_EXPIRY_MINUTES = float(os.getenv("UPLOAD_URL_EXPIRY_MINUTES", 60))
+# 建立直接上傳工作階段時一併簽發的分段網址數，其餘分段另行索取
+PRESIGN_BATCH_SIZE = 100
+# 組成後、建立 Blob 前的暫存物件前綴
+UPLOAD_STAGING_PREFIX = "uploads/"
+
+# 遞增雜湊 {session_id: (已雜湊的位元組數, hashlib 物件)}
+_hashers: Dict[str, Tuple[int, object]] = {}
+_hashers_lock = threading.Lock()
+
+
+def chunk_size_for(size: int) -> int:
+    """建議的分段大小 (MiB 對齊)"""
+    minimum = math.ceil(size / MAX_PARTS / (1024 * 1024)) * 1024 * 1024
+    return max(UPLOAD_CHUNK_SIZE, MIN_PART_SIZE, minimum)
+
+
+def part_count_for(size: int) -> int:
+    return math.ceil(size / chunk_size_for(size))
+
+
+def session_state(session: UploadSession) -> dict:
+    return {
+        "id": session.id,
+        "filename": session.filename,
+        "size": session.size,
+        "offset": session.received_bytes,
+        "next_part": session.next_part,
+        "chunk_size": chunk_size_for(session.size),
+        "status": session.status,
+        "expires_at": session.expires_at,
+        "direct": session.direct,
+        "part_count": part_count_for(session.size),
+    }
+
+
+def create_session(
+    db: Session,
+    filename: str,
+    size: int,
+    content_type: Optional[str],
+    folder_id: Optional[int],
+    direct: bool = False,
+    content_hash: Optional[str] = None
+) -> dict:
+    """建立工作階段與對應的 multipart upload；直接上傳時一併回傳前幾個分段的預簽名網址"""
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Size must be positive; use POST /upload for empty files")
+    if chunk_size_for(size) > UPLOAD_MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=400, detail=f"File too large (max {MAX_PARTS * UPLOAD_MAX_CHUNK_SIZE} bytes)")
+    if folder_id is not None and db.query(Folder.id).filter(Folder.id == folder_id).first() is None:
+        raise HTTPException(status_code=404, detail="Folder not found")
+
+    session_id = uuid.uuid4().hex
+    object_name = f"{UPLOAD_STAGING_PREFIX}{session_id}"
+    content_type = content_type or "application/octet-stream"
+    try:
+        upload_id = create_multipart_upload(object_name, content_type)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to start upload: {str(e)}")
+
+    now = datetime.utcnow()
+    session = UploadSession(
+        id=session_id,
+        filename=filename,
+        content_type=content_type,
+        folder_id=folder_id,
+        size=size,
+        object_name=object_name,
+        multipart_upload_id=upload_id,
+        received_bytes=0,
+        next_part=1,
+        status="active",
+        direct=direct,
+        expected_hash=content_hash.lower() if content_hash else None,
+        created_at=now,
+        updated_at=now,
+        expires_at=now + timedelta(hours=UPLOAD_SESSION_TTL_HOURS),
+    )
+    db.add(session)
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        abort_multipart_upload(object_name, upload_id)
+        raise
+    state = session_state(session)
+    if direct:
+        count = min(state["part_count"], PRESIGN_BATCH_SIZE)
+        state["part_urls"] = [presign_part(session, number) for number in range(1, count + 1)]
+    else:
+        with _hashers_lock:
+            _hashers[session_id] = (0, new_hasher(HASH_ALGORITHM))
+    return state
+
+
+def get_session(db: Session, session_id: str) -> UploadSession:
+    session = db.query(UploadSession).filter(UploadSession.id == session_id).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session.expires_at < datetime.utcnow():
+        raise HTTPException(status_code=410, detail="Upload session expired")
+    return session
+
+
+def presign_part(session: UploadSession, part_number: int) -> str:
+    return get_presigned_part_url(
+        session.object_name, session.multipart_upload_id, part_number,
+        timedelta(minutes=UPLOAD_URL_EXPIRY_MINUTES)
+    )
+
+
+def part_upload_url(db: Session, session_id: str, part_number: int) -> dict:
+    """
+    簽發直接上傳分段的網址 (網址過期或超過建立時簽發的數量時使用)。
+
+    客戶端持續索取網址即表示仍在上傳，工作階段的期限隨之延長。
+    """
+    session = get_session(db, session_id)
+    if not session.direct or session.status != "active":
+        raise HTTPException(status_code=409, detail="Not an active direct upload session")
+    if not 1 <= part_number <= min(MAX_PARTS, part_count_for(session.size)):
+        raise HTTPException(status_code=400, detail="Invalid part number")
+    now = datetime.utcnow()
+    session.updated_at = now
+    session.expires_at = now + timedelta(hours=UPLOAD_SESSION_TTL_HOURS)
+    db.commit()
+    return {
+        "url": presign_part(session, part_number),
+        "expires_at": now + timedelta(minutes=UPLOAD_URL_EXPIRY_MINUTES),
+    }
+
+
+def sync_direct_parts(db: Session, session: UploadSession):
+    """
+    以 MinIO 上實際存在的分段更新直接上傳的進度 (編號需從 1 連續)。
+
+    received_bytes 為連續分段的總大小，客戶端中斷後可由 next_part 繼續。
+    """
+    if not session.direct or session.status != "active":
+        return
+    received, next_part, parts = 0, 1, []
+    for number, etag, size in list_uploaded_parts(session.object_name, session.multipart_upload_id):
+        if number != next_part:
+            break
+        parts.append(UploadPart(session_id=session.id, part_number=number, etag=etag, size=size))
+        received += size
+        next_part += 1
+    if next_part != session.next_part or received != session.received_bytes:
+        db.query(UploadPart).filter(UploadPart.session_id == session.id).delete(synchronize_session=False)
+        db.add_all(parts)
+        session.received_bytes = received
+        session.next_part = next_part
+        db.commit()
+
+
+def load_session_state(db: Session, session_id: str) -> dict:
+    session = get_session(db, session_id)
+    sync_direct_parts(db, session)
+    return session_state(session)
+
+
+def _next_hasher(session_id: str, offset: int, data: bytes):
+    """接續 offset 之前的雜湊狀態；狀態不在此行程 (或不連續) 時回傳 None"""
+    with _hashers_lock:
+        entry = _hashers.get(session_id)
+    if entry is None or entry[0] != offset:
+        return None
+    hasher = entry[1].copy()
+    hasher.update(data)
+    return hasher
+
+
+def write_part(
+    db: Session,
+    session_id: str,
+    part_number: int,
+    data: bytes,
+    offset: Optional[int] = None
+) -> dict:
+    """
+    上傳一個分段 (對應 multipart 的 part_number)。
+
+    分段必須依序上傳 (part_number 等於 next_part)，除最後一段外不得小於 5 MB。
+    回應遺失時重送同一分段會得到 409，客戶端應以 HEAD 查詢 offset 後繼續。
+    """
+    session = get_session(db, session_id)
+    if session.status != "active":
+        raise HTTPException(status_code=409, detail="Upload session is already complete")
+    if session.direct:
+        raise HTTPException(status_code=409, detail="Direct upload session: upload parts to the presigned URLs")
+    if offset is not None and offset != session.received_bytes:
+        raise HTTPException(status_code=409, detail=f"Offset mismatch: {session.received_bytes} bytes received")
+    if part_number != session.next_part:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Expected part {session.next_part} (offset {session.received_bytes})"
+        )
+
+    length = len(data)
+    remaining = session.size - session.received_bytes
+    if length == 0 or length > remaining:
+        raise HTTPException(status_code=400, detail=f"Chunk size must be between 1 and {remaining} bytes")
+    if length < MIN_PART_SIZE and length != remaining:
+        raise HTTPException(status_code=400, detail=f"Chunks must be at least {MIN_PART_SIZE} bytes except the last one")
+    if part_number > MAX_PARTS:
+        raise HTTPException(status_code=400, detail=f"Too many parts (max {MAX_PARTS})")
+
+    received = session.received_bytes
+    try:
+        etag = upload_part(session.object_name, session.multipart_upload_id, part_number, data)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to upload part: {str(e)}")
+    hasher = _next_hasher(session_id, received, data)
+
+    # 以 next_part 作為樂觀鎖，並行上傳同一分段時只有一個請求成功
+    now = datetime.utcnow()
+    advanced = db.query(UploadSession).filter(
+        UploadSession.id == session_id,
+        UploadSession.next_part == part_number
+    ).update({
+        UploadSession.received_bytes: UploadSession.received_bytes + length,
+        UploadSession.next_part: UploadSession.next_part + 1,
+        UploadSession.updated_at: now,
+        UploadSession.expires_at: now + timedelta(hours=UPLOAD_SESSION_TTL_HOURS),
+    }, synchronize_session=False)
+    if not advanced:
+        db.rollback()
+        raise HTTPException(status_code=409, detail=f"Part {part_number} was uploaded by another request")
+    db.add(UploadPart(session_id=session_id, part_number=part_number, etag=etag, size=length))
+    db.commit()
+
+    with _hashers_lock:
+        if hasher is None:
+            _hashers.pop(session_id, None)
+        else:
+            _hashers[session_id] = (received + length, hasher)
+    return session_state(session)
+
+
+def assemble_session(db: Session, session: UploadSession) -> Optional[str]:
+    """
+    將已接收的分段組成暫存物件，回傳內容雜湊；遞增雜湊的狀態不在此行程時回傳 None。
+
+    組成後狀態為 assembled；後續建立版本失敗時可再次呼叫完成，不需重新上傳。
+    直接上傳的分段大小由 MinIO 的分段清單核對；分段不經過 API，一律回傳 None。
+    """
+    if session.status == "active":
+        sync_direct_parts(db, session)
+        if session.received_bytes != session.size:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload incomplete: {session.received_bytes} of {session.size} bytes received"
+            )
+        session_id, object_name = session.id, session.object_name
+        try:
+            complete_multipart_upload(
+                object_name, session.multipart_upload_id,
+                [(part.part_number, part.etag) for part in session.parts]
+            )
+        except Exception as e:
+            db.rollback()
+            # 並行的完成請求已組成 (multipart upload 已不存在，狀態可能尚未 commit)，或工作階段已被刪除
+            check_session_active(db, session_id)
+            if any(obj.object_name == object_name for obj in list_objects(object_name)):
+                raise HTTPException(status_code=409, detail="Upload session is already being completed")
+            raise HTTPException(status_code=500, detail=f"Failed to assemble upload: {str(e)}")
+        assembled = db.query(UploadSession).filter(
+            UploadSession.id == session_id,
+            UploadSession.status == "active"
+        ).update({UploadSession.status: "assembled"}, synchronize_session=False)
+        db.commit()
+        try:
+            # commit 使屬性過期，立即重新載入 (之後即使被刪除也不再查詢)
+            db.refresh(session)
+        except InvalidRequestError:
+            # 組成期間工作階段已被刪除 (取消、過期、目標資料夾被遞迴刪除或並行完成)：刪除組成的物件；
+            # 並行完成的延後處理版本指向此物件，已被引用時保留
+            forget_session(session_id)
+            discard_objects(db, [object_name])
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        if not assembled:
+            raise HTTPException(status_code=409, detail="Upload session is already being completed")
+
+    with _hashers_lock:
+        entry = _hashers.get(session.id)
+    if entry is not None and entry[0] == session.size:
+        return entry[1].hexdigest()
+    return None
+
+
+def check_session_active(db: Session, session_id: str):
+    """工作階段已被刪除時回傳 404，已由其他請求組成時回傳 409"""
+    status = db.query(UploadSession.status).filter(UploadSession.id == session_id).scalar()
+    if status is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if status != "active":
+        raise HTTPException(status_code=409, detail="Upload session is already being completed")
+
+
+def claim_session(db: Session, session_id: str):
+    """
+    在建立版本的交易中刪除工作階段與分段記錄 (呼叫端負責 commit)。
+
+    並行完成同一工作階段時只有一個請求刪除成功並建立版本，其餘回傳 409：
+    PostgreSQL 上其餘請求的 DELETE 等待第一個交易結束後不再符合，SQLite 的寫入本就依序進行。
+    """
+    bulk = {"synchronize_session": False}
+    db.execute(delete(UploadPart).where(UploadPart.session_id == session_id), execution_options=bulk)
+    claimed = db.execute(
+        delete(UploadSession).where(UploadSession.id == session_id), execution_options=bulk
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Upload session is already being completed")
+
+
+def forget_session(session_id: str):
+    with _hashers_lock:
+        _hashers.pop(session_id, None)
+
+
+def discard_session(db: Session, session: UploadSession):
+    """刪除工作階段：中止 multipart upload (或刪除已組成的暫存物件)"""
+    released = [(session.id, session.object_name, session.multipart_upload_id, session.status)]
+    db.delete(session)
+    db.commit()
+    release_session_storage(db, released)
+
+
+def remove_folder_sessions(db: Session, folder_ids) -> List[tuple]:
+    """
+    刪除目標資料夾在 folder_ids (id 清單或子查詢) 之內的工作階段與分段記錄 (呼叫端負責 commit)。
+
+    資料夾被刪除後，這些工作階段已無法完成。
+
+    Returns:
+        被刪除的工作階段 (id, 暫存物件, multipart upload id, 狀態)，commit 後交給 release_session_storage
+    """
+    sessions = [tuple(row) for row in db.execute(
+        select(UploadSession.id, UploadSession.object_name, UploadSession.multipart_upload_id, UploadSession.status)
+        .where(UploadSession.folder_id.in_(folder_ids))
+    )]
+    session_ids = [session[0] for session in sessions]
+    if session_ids:
+        bulk = {"synchronize_session": False}
+        db.execute(delete(UploadPart).where(UploadPart.session_id.in_(session_ids)), execution_options=bulk)
+        db.execute(delete(UploadSession).where(UploadSession.id.in_(session_ids)), execution_options=bulk)
+    return sessions
+
+
+def release_session_storage(db: Session, sessions: List[tuple]):
+    """記錄刪除並 commit 後，中止未組成的 multipart upload，並刪除已組成的暫存物件"""
+    assembled = []
+    for session_id, object_name, upload_id, status in sessions:
+        forget_session(session_id)
+        if status != "active":
+            assembled.append(object_name)
+            continue
+        try:
+            abort_multipart_upload(object_name, upload_id)
+        except Exception as e:
+            # 已不存在或暫時失敗；未中止的分段可由 bucket 生命週期規則清除
+            print(f"Failed to abort multipart upload {upload_id}: {e}")
+    if assembled:
+        purge_objects(db, assembled)
+
+
+def expire_sessions(db: Session) -> Dict[str, int]:
+    """清除過期 (被放棄) 的工作階段"""
+    stats = {"expired": 0}
+    while True:
+        expired = db.query(UploadSession).filter(
+            UploadSession.expires_at < datetime.utcnow()
+        ).order_by(UploadSession.expires_at).limit(100).all()
+        if not expired:
+            break
+        for session in expired:
+            discard_session(db, session)
+        stats["expired"] += len(expired)
+    return stats
+
+
+def sweep_sessions() -> Dict[str, int]:
+    db = SessionLocal()
+    try:
+        return expire_sessions(db)
+    finally:
+        db.close()
+
+
+async def session_sweep_loop(interval_minutes: float = UPLOAD_SWEEP_INTERVAL_MINUTES):
+    """背景定期清除過期的工作階段"""
+    while True:
+        await asyncio.sleep(interval_minutes * 60)
+        try:
+            result = await asyncio.to_thread(sweep_sessions)
+            if result["expired"]:
+                print(f"Expired upload sessions: {result}")
+        except Exception as e:
+            print(f"Upload session sweep failed: {e}")
@@ -1,21 +1,48 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form
-from fastapi.responses import StreamingResponse
-from typing import List
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form, Query, Request
+from fastapi.responses import FileResponse as FileDownload, JSONResponse, Response, StreamingResponse
+from types import SimpleNamespace
+from typing import List, Optional
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, joinedload, selectinload
 from ..database import get_db
 from ..models import FileRecord, FileVersion, Tag
-from ..storage import upload_file_to_minio, download_file_from_minio, BUCKET_NAME
-from ..schemas import FileUpdate, FileResponse, TagCreate, ShareResponse, FileVersionResponse
-from ..utils import calculate_sha1
-from datetime import datetime
-import uuid
-import io
+from ..storage import (
+    download_file_from_minio, get_share_url, local_object_path, upload_file_to_minio,
+    run_storage, stream_object, backend as storage_backend, BUCKET_NAME
+)
+from ..blobs import acquire_blob, release_blobs, purge_objects, discard_objects
+from .. import archive, derivatives, finalize, jobs, metadata_cache, search
+from ..schemas import (
+    FileUpdate, FileResponse, TagCreate, ShareResponse, FileVersionResponse, BatchUploadResponse,
+    BatchDownloadRequest
+)
+from ..ingest import store_batch
+from ..utils import (
+    HASH_ALGORITHM, SUPPORTED_HASH_ALGORITHMS, hash_stream, detect_category,
+    parse_byte_range, etag_matches, http_date, parse_http_date,
+    encode_cursor, decode_cursor
+)
+from datetime import datetime, timedelta
 
 router = APIRouter()
 
+# /history 與 /search 單頁回傳筆數上限
+MAX_PAGE_SIZE = 500
 
-def build_file_response(db_file: FileRecord) -> dict:
-    """構建包含版本資訊的檔案回應"""
+# 分享連結有效時數上限 (S3 預簽名網址最長 7 天)
+MAX_SHARE_HOURS = 7 * 24
+
+
+def with_file_details(query):
+    """預先載入 build_file_response 所需的關聯，讓列表查詢的次數固定，不隨筆數增加"""
+    return query.options(
+        joinedload(FileRecord.current_version),
+        selectinload(FileRecord.tags)
+    )
+
+
+def build_file_response(db_file: FileRecord, version_count: Optional[int] = None) -> dict:
+    """構建包含版本資訊的檔案回應 (version_count 可由呼叫端提供，省略時使用查詢結果)"""
     return {
         "id": db_file.id,
         "filename": db_file.filename,
@@ -25,149 +52,384 @@ def build_file_response(db_file: FileRecord) -> dict:
         "uploaded_at": db_file.uploaded_at,
         "folder_id": db_file.folder_id,
         "tags": db_file.tags,
-        "version_count": len(db_file.versions),
+        "version_count": db_file.version_count if version_count is None else version_count,
         "current_version": db_file.current_version
     }
 
 
-@router.post("/upload", response_model=FileResponse)
-def upload_file(file: UploadFile = File(...), folder_id: int = Form(None), db: Session = Depends(get_db)):
-    # Read file content
-    content = file.file.read()
-    size = len(content)
-    file_obj = io.BytesIO(content)
-    
-    # Calculate SHA1 hash
-    sha1_hash = calculate_sha1(content, size)
-    
-    # Generate unique object name
-    object_name = f"{uuid.uuid4()}-{file.filename}"
-    
-    # Determine Category
-    mime = file.content_type
-    if mime.startswith("image/"):
-        category = "image"
-    elif mime.startswith("video/"):
-        category = "video"
-    elif mime.startswith("audio/"):
-        category = "audio"
-    elif mime.startswith("text/") or "pdf" in mime or "msword" in mime or "officedocument" in mime:
-        category = "document"
-    elif "zip" in mime or "tar" in mime or "7z" in mime:
-        category = "archive"
-    else:
-        category = "other"
+def version_snapshot(version: FileVersion) -> dict:
+    return {
+        "id": version.id,
+        "version_number": version.version_number,
+        "sha1_hash": version.sha1_hash,
+        "hash_algorithm": version.hash_algorithm,
+        "size": version.size,
+        "content_type": version.content_type,
+        "uploaded_at": version.uploaded_at,
+        "object_name": version.object_name,
+    }
 
-    # Check for existing file with same filename in same folder
-    existing_file = db.query(FileRecord).filter(
-        FileRecord.filename == file.filename,
+
+def load_file_snapshot(db: Session, file_id: int) -> dict:
+    """
+    檔案及當前版本的中繼資料快照 (經 metadata_cache 快取)。
+
+    Raises:
+        HTTPException 404: 檔案不存在
+    """
+    snapshot = metadata_cache.get(file_id)
+    if snapshot is not None:
+        return snapshot
+
+    db_file = with_file_details(db.query(FileRecord)).filter(FileRecord.id == file_id).first()
+    if not db_file:
+        raise HTTPException(status_code=404, detail="File not found")
+    snapshot = build_file_response(db_file)
+    snapshot["tags"] = [{"id": tag.id, "name": tag.name} for tag in db_file.tags]
+    if db_file.current_version:
+        snapshot["current_version"] = version_snapshot(db_file.current_version)
+    metadata_cache.put(file_id, snapshot)
+    return snapshot
+
+
+def find_upload_target(db: Session, filename: str, folder_id: Optional[int], content_hash: Optional[str]) -> Optional[FileRecord]:
+    """
+    查詢同資料夾中的同名檔案 (新內容將成為其新版本)。
+
+    Raises:
+        HTTPException 409: 內容與當前版本相同 (content_hash 為 None 時不檢查)
+    """
+    existing_file = with_file_details(db.query(FileRecord)).filter(
+        FileRecord.filename == filename,
         FileRecord.folder_id == folder_id
     ).first()
     
-    if existing_file:
-        # Check if content is identical (SHA1 match)
-        if existing_file.current_version and existing_file.current_version.sha1_hash == sha1_hash:
+    # Check if content is identical; hashes from different algorithms
+    # (e.g. legacy sampled SHA1) cannot be compared and never count as a match
+    if content_hash and existing_file and existing_file.current_version:
+        current = existing_file.current_version
+        if current.hash_algorithm == HASH_ALGORITHM and current.sha1_hash == content_hash:
             raise HTTPException(
                 status_code=409, 
-                detail=f"相同內容的檔案已存在 (版本 {existing_file.current_version.version_number})"
+                detail=f"相同內容的檔案已存在 (版本 {current.version_number})"
             )
-        
-        # Create new version
-        new_version_number = len(existing_file.versions) + 1
-        
-        # Upload to MinIO
-        try:
-            file_obj.seek(0)
-            upload_file_to_minio(file_obj, size, object_name, file.content_type)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to upload to storage: {str(e)}")
-        
-        # Create FileVersion record
+    return existing_file
+
+
+def save_version(
+    db: Session,
+    existing_file: Optional[FileRecord],
+    filename: str,
+    content_type: str,
+    folder_id: Optional[int],
+    content_hash: Optional[str],
+    size: int,
+    object_name: str,
+    created: bool,
+    expected_hash: Optional[str] = None
+) -> FileResponse:
+    """
+    以單一交易寫入檔案記錄、版本與 current_version 指標 (Blob 需已由 acquire_blob 取得)。
+
+    content_hash 為 None 時為延後處理的上傳：版本暫時指向上傳的物件，並在同一交易中排入
+    finalize_upload 工作 (見 app/finalize.py)；expected_hash 為客戶端宣告的雜湊，由該工作驗證。
+
+    失敗時 rollback；若物件是本次新建立的則立即刪除，不會留下指向不存在物件的版本。
+    """
+    try:
+        if existing_file:
+            # Create new version
+            db_file = existing_file
+            version_number = existing_file.version_count + 1
+        else:
+            # New file - create FileRecord and first FileVersion
+            db_file = FileRecord(
+                filename=filename,
+                category=detect_category(content_type),
+                folder_id=folder_id,
+                tags=[]
+            )
+            db.add(db_file)
+            version_number = 1
+
         new_version = FileVersion(
-            file_id=existing_file.id,
-            version_number=new_version_number,
-            sha1_hash=sha1_hash,
+            file=db_file,
+            version_number=version_number,
+            sha1_hash=content_hash,
+            hash_algorithm=HASH_ALGORITHM,
             size=size,
-            content_type=file.content_type,
+            content_type=content_type,
             bucket_name=BUCKET_NAME,
-            object_name=object_name
+            object_name=object_name,
+            uploaded_at=datetime.utcnow()
         )
-        db.add(new_version)
-        db.commit()
-        
-        # Update current version pointer
-        existing_file.current_version_id = new_version.id
-        db.commit()
-        db.refresh(existing_file)
-        
-        return build_file_response(existing_file)
-    
-    else:
-        # New file - create FileRecord and first FileVersion
-        
-        # Upload to MinIO first
-        try:
-            file_obj.seek(0)
-            upload_file_to_minio(file_obj, size, object_name, file.content_type)
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to upload to storage: {str(e)}")
-        
-        # Create FileRecord
-        db_file = FileRecord(
-            filename=file.filename,
-            category=category,
-            folder_id=folder_id
+        # post_update: 記錄、版本與指標在同一次 flush 中寫入
+        db_file.current_version = new_version
+        db.flush()
+        if content_hash is None:
+            payload = {"object_name": object_name}
+            if expected_hash:
+                payload["expected_hash"] = expected_hash
+            jobs.enqueue(db, finalize.FINALIZE_UPLOAD_JOB, payload)
+
+        # commit 會使物件過期，先組好回應，避免序列化時再查詢資料庫
+        response = FileResponse.model_validate(
+            build_file_response(db_file, version_count=version_number), from_attributes=True
         )
-        db.add(db_file)
         db.commit()
-        db.refresh(db_file)
-        
-        # Create first FileVersion
-        first_version = FileVersion(
-            file_id=db_file.id,
-            version_number=1,
-            sha1_hash=sha1_hash,
-            size=size,
-            content_type=file.content_type,
-            bucket_name=BUCKET_NAME,
-            object_name=object_name
-        )
-        db.add(first_version)
-        db.commit()
-        
-        # Set current version
-        db_file.current_version_id = first_version.id
-        db.commit()
-        db.refresh(db_file)
-        
-        return build_file_response(db_file)
+    except Exception as e:
+        db.rollback()
+        if created:
+            # 物件是本次上傳的且沒有版本引用 (並行上傳相同內容者除外)，立即刪除
+            discard_objects(db, [object_name])
+        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
 
+    return response
 
-@router.get("/download/{file_id}")
-def download_file(file_id: int, db: Session = Depends(get_db)):
-    db_file = db.query(FileRecord).filter(FileRecord.id == file_id).first()
-    if not db_file:
-        raise HTTPException(status_code=404, detail="File not found")
+
+def store_upload(file: UploadFile, folder_id: Optional[int], db: Session) -> FileResponse:
+    """
+    上傳檔案的阻塞部分 (雜湊、寫入 MinIO、建立版本記錄)
+
+    先寫入物件，再以單一交易寫入檔案記錄、版本與 current_version 指標：
+    任何一步失敗時最多留下未被引用的物件 (立即刪除，或由 GC 回收)，
+    不會留下指向不存在物件的版本。
+    """
+    if finalize.UPLOAD_DEFERRED_PROCESSING:
+        return store_upload_deferred(file, folder_id, db)
+
+    # UploadFile is spooled to disk by Starlette; hash it there in chunks so
+    # content that is already stored never has to be sent to MinIO again
+    content_hash, size = hash_stream(file.file, HASH_ALGORITHM)
     
-    if not db_file.current_version:
+    existing_file = find_upload_target(db, file.filename, folder_id, content_hash)
+    
+    # Store the content once; identical blobs are shared across files and versions
+    try:
+        blob, created = acquire_blob(db, HASH_ALGORITHM, content_hash, size, file.content_type, file.file)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to upload to storage: {str(e)}")
+    
+    # rollback 會使 blob 過期，先記下物件名稱
+    return save_version(
+        db, existing_file, file.filename, file.content_type, folder_id,
+        content_hash, size, blob.object_name, created
+    )
+
+
+def store_upload_deferred(file: UploadFile, folder_id: Optional[int], db: Session) -> FileResponse:
+    """
+    延後處理的上傳：只讀取一次暫存檔寫入 MinIO 即建立版本，雜湊與去重由 finalize_upload 工作完成
+    """
+    file.file.seek(0, 2)
+    size = file.file.tell()
+    file.file.seek(0)
+
+    existing_file = find_upload_target(db, file.filename, folder_id, None)
+    object_name = finalize.deferred_object_name()
+    try:
+        upload_file_to_minio(file.file, size, object_name, file.content_type)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to upload to storage: {str(e)}")
+
+    return save_version(
+        db, existing_file, file.filename, file.content_type, folder_id,
+        None, size, object_name, True
+    )
+
+
+@router.post("/upload", response_model=FileResponse)
+async def upload_file(file: UploadFile = File(...), folder_id: int = Form(None), db: Session = Depends(get_db)):
+    # The request body has already been received asynchronously; hashing, the
+    # MinIO PUT and the DB writes block, so run them on the storage executor
+    return await run_storage(store_upload, file, folder_id, db)
+
+
+@router.post("/upload/batch", response_model=BatchUploadResponse)
+async def upload_batch(
+    files: List[UploadFile] = File(None),
+    archive_file: UploadFile = File(None, alias="archive"),
+    folder_id: int = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    批次上傳多個檔案 (files) 或一個 zip / tar 壓縮檔 (archive)。
+
+    壓縮檔內的目錄會建立為 folder_id 下的子資料夾；回傳每個項目的結果。
+    """
+    if not files and archive_file is None:
+        raise HTTPException(status_code=400, detail="Provide files or an archive")
+    return await run_storage(store_batch, files or [], archive_file, folder_id, db)
+
+
+def get_current_version(file_id: int, db: Session):
+    """查詢檔案及其當前版本 (版本為快照，欄位與 FileVersion 相同)"""
+    snapshot = load_file_snapshot(db, file_id)
+    if not snapshot["current_version"]:
         raise HTTPException(status_code=404, detail="No version found for this file")
-        
+    
+    return snapshot["filename"], SimpleNamespace(**snapshot["current_version"])
+
+
+def version_etag(version: FileVersion) -> str:
+    """
+    以內容雜湊作為強 ETag；舊版取樣雜湊無法唯一識別內容，只能作為弱 ETag。
+    延後處理的上傳尚未計算雜湊時以版本 id 作為弱 ETag。
+    """
+    if not version.sha1_hash:
+        return f'W/"{version.id}"'
+    if version.hash_algorithm in SUPPORTED_HASH_ALGORITHMS:
+        return f'"{version.sha1_hash}"'
+    return f'W/"{version.id}-{version.sha1_hash}"'
+
+
+async def build_download_response(request: Request, filename: str, version: FileVersion):
+    """
+    建立版本下載回應，支援條件式 GET (If-None-Match / If-Modified-Since) 與單一 Range 請求。
+
+    條件符合時直接回傳 304，不存取 MinIO；Range 請求轉為 MinIO 的區段讀取並回傳 206。
+    """
+    etag = version_etag(version)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(version.uploaded_at),
+        "Accept-Ranges": "bytes",
+    }
+    
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = parse_http_date(request.headers.get("if-modified-since", ""))
+    if if_none_match is not None:
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since and version.uploaded_at.replace(microsecond=0) <= if_modified_since:
+        return Response(status_code=304, headers=headers)
+    
+    size = version.size or 0
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range: only honour the Range when the client's copy is still current
+    if range_header and (if_range is None or etag_matches(if_range, etag, weak=False)
+                         or parse_http_date(if_range) == version.uploaded_at.replace(microsecond=0)):
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+    
+    headers["Content-Disposition"] = f"attachment; filename={filename}"
+    
+    # 本機後端：直接傳送檔案 (Range 由 FileResponse 依同樣的 ETag / Last-Modified 處理)
+    path = await run_storage(local_object_path, version.object_name) if storage_backend.local_files else None
+    if path:
+        return FileDownload(path, media_type=version.content_type, headers=headers)
+    
+    if byte_range:
+        start, end = byte_range
+        offset, length = start, end - start + 1
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    else:
+        offset, length = 0, 0
+        status_code = 200
+    headers["Content-Length"] = str(length or size)
+    
     try:
-        response = download_file_from_minio(db_file.current_version.object_name)
-        
-        return StreamingResponse(
-            response,
-            media_type=db_file.current_version.content_type,
-            headers={"Content-Disposition": f"attachment; filename={db_file.filename}"}
-        )
+        response = await run_storage(download_file_from_minio, version.object_name, offset, length)
     except Exception as e:
         print(f"Error downloading: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to download file or file not found in storage")
+    
+    return StreamingResponse(
+        stream_object(response),
+        status_code=status_code,
+        media_type=version.content_type,
+        headers=headers
+    )
+
+
+@router.post("/download/batch")
+def download_batch(request: BatchDownloadRequest, db: Session = Depends(get_db)):
+    """以 ZIP 串流下載多個檔案 (當前版本) 與資料夾"""
+    if not request.file_ids and not request.folder_ids:
+        raise HTTPException(status_code=400, detail="No files or folders specified")
+    entries = archive.batch_entries(db, request.file_ids, request.folder_ids)
+    filename = archive.safe_name(request.filename or "download.zip")
+    if not filename.lower().endswith(".zip"):
+        filename += ".zip"
+    return StreamingResponse(
+        archive.stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": archive.content_disposition(filename)}
+    )
+
+
+@router.get("/download/{file_id}")
+async def download_file(file_id: int, request: Request, db: Session = Depends(get_db)):
+    filename, version = await run_storage(get_current_version, file_id, db)
+    return await build_download_response(request, filename, version)
+
+
+def _parse_cursor(cursor: str, by_rank: bool) -> tuple:
+    """解碼游標為 (排序值, 檔案 id)；任何格式錯誤都回傳 400"""
+    try:
+        sort_value, file_id = decode_cursor(cursor, 2)
+        if not isinstance(file_id, int) or isinstance(file_id, bool) or not 0 <= file_id < 2 ** 63:
+            raise ValueError("Invalid file id")
+        if by_rank:
+            if not isinstance(sort_value, (int, float)) or isinstance(sort_value, bool):
+                raise ValueError("Invalid rank")
+            return float(sort_value), file_id
+        if not isinstance(sort_value, str):
+            raise ValueError("Invalid timestamp")
+        return datetime.fromisoformat(sort_value), file_id
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate_files(query, cursor: Optional[str], limit: int, response: Response, rank=None, skip: int = 0) -> List[FileRecord]:
+    """
+    游標分頁。預設依 (created_at, id) 由新到舊排序；指定 rank 欄位 (全文檢索相關度，
+    數值越小越相關) 時改依 (rank, id) 排序。
+
+    不論翻到第幾頁都只掃描所需的筆數；若還有下一頁，游標放在 X-Next-Cursor 回應標頭。
+    skip 為舊版的位移分頁 (已棄用)，只在未帶游標時使用。
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        sort_value, file_id = _parse_cursor(cursor, rank is not None)
+        if rank is None:
+            query = query.filter(tuple_(FileRecord.created_at, FileRecord.id) < tuple_(sort_value, file_id))
+        else:
+            query = query.filter(tuple_(rank, FileRecord.id) > tuple_(sort_value, file_id))
+    offset = skip if not cursor and skip else None
+    
+    if rank is None:
+        files = query.order_by(FileRecord.created_at.desc(), FileRecord.id.desc()).offset(offset).limit(limit + 1).all()
+        ranks = None
+    else:
+        rows = query.add_columns(rank).order_by(rank, FileRecord.id).offset(offset).limit(limit + 1).all()
+        files = [row[0] for row in rows]
+        ranks = [row[1] for row in rows]
+    
+    if len(files) > limit:
+        files = files[:limit]
+        last = files[-1]
+        sort_value = last.created_at.isoformat() if ranks is None else ranks[limit - 1]
+        response.headers["X-Next-Cursor"] = encode_cursor(sort_value, last.id)
+    return files
 
 
 @router.get("/history", response_model=List[FileResponse])
-def get_upload_history(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    files = db.query(FileRecord).order_by(FileRecord.created_at.desc()).offset(skip).limit(limit).all()
+def get_upload_history(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    skip: int = Query(0, ge=0, deprecated=True),
+    db: Session = Depends(get_db)
+):
+    files = paginate_files(with_file_details(db.query(FileRecord)), cursor, limit, response, skip=skip)
     return [build_file_response(f) for f in files]
 
 
@@ -177,17 +439,17 @@ def delete_file(file_id: int, db: Session = Depends(get_db)):
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Delete all versions from MinIO
-    from ..storage import delete_file_from_minio
+    # Delete all versions; blobs shared with other files stay in MinIO
+    object_names = [version.object_name for version in db_file.versions]
     for version in db_file.versions:
-        try:
-            delete_file_from_minio(version.object_name)
-        except Exception as e:
-            print(f"Error removing version {version.version_number} from storage: {e}")
         db.delete(version)
     
     db.delete(db_file)
+    orphaned = release_blobs(db, object_names)
     db.commit()
+    
+    # Remove unreferenced objects only after the commit succeeded; failures are queued for retry
+    purge_objects(db, orphaned)
     return {"message": "File and all versions deleted successfully"}
 
 
@@ -209,10 +471,51 @@ def update_file_metadata(file_id: int, file_update: FileUpdate, db: Session = De
 
 @router.get("/files/{file_id}/info", response_model=FileResponse)
 def get_file_info(file_id: int, db: Session = Depends(get_db)):
-    db_file = db.query(FileRecord).filter(FileRecord.id == file_id).first()
-    if not db_file:
-        raise HTTPException(status_code=404, detail="File not found")
-    return build_file_response(db_file)
+    return load_file_snapshot(db, file_id)
+
+
+def load_thumbnail(file_id: int, db: Session):
+    _, version = get_current_version(file_id, db)
+    return version, derivatives.get_thumbnail(db, version)
+
+
+def thumbnail_pending() -> JSONResponse:
+    return JSONResponse(
+        status_code=202, content={"status": "pending"},
+        headers={"Retry-After": "2", "Cache-Control": "no-store"}
+    )
+
+
+@router.get("/files/{file_id}/thumbnail")
+async def get_thumbnail(file_id: int, request: Request, v: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    目前版本的縮圖 (JPEG，長邊 THUMBNAIL_SIZE 像素)。
+
+    網址帶有目前版本的內容雜湊 (?v={sha1_hash}) 時內容不會改變，回應可長期快取；
+    未帶或已不是目前版本時需以 ETag 重新驗證。尚未產生時回傳 202 與 Retry-After，
+    不支援的類型或產生失敗時回傳 404。
+    """
+    version, thumbnail = await run_storage(load_thumbnail, file_id, db)
+    if thumbnail is None or thumbnail["status"] in ("failed", "unsupported"):
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+    if thumbnail["status"] != "ready":
+        return thumbnail_pending()
+
+    etag = f'"thumbnail-{thumbnail["id"]}"'
+    if v is not None and v == version.sha1_hash:
+        cache_control = f"public, max-age={derivatives.THUMBNAIL_CACHE_SECONDS}, immutable"
+    else:
+        cache_control = "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+
+    data = await run_storage(derivatives.read_thumbnail, thumbnail["object_name"])
+    if data is None:
+        # 縮圖物件遺失，重新產生
+        await run_storage(derivatives.reset_thumbnail, db, version)
+        return thumbnail_pending()
+    return Response(data, media_type="image/jpeg", headers=headers)
 
 
 # ========== 版本管理 API ==========
@@ -227,9 +530,8 @@ def list_versions(file_id: int, db: Session = Depends(get_db)):
     return db_file.versions
 
 
-@router.get("/files/{file_id}/versions/{version_id}/download")
-def download_version(file_id: int, version_id: int, db: Session = Depends(get_db)):
-    """下載特定版本"""
+def get_version(file_id: int, version_id: int, db: Session):
+    """查詢檔案的特定版本"""
     version = db.query(FileVersion).filter(
         FileVersion.id == version_id,
         FileVersion.file_id == file_id
@@ -239,16 +541,14 @@ def download_version(file_id: int, version_id: int, db: Session = Depends(get_db
         raise HTTPException(status_code=404, detail="Version not found")
     
     db_file = db.query(FileRecord).filter(FileRecord.id == file_id).first()
-    
-    try:
-        response = download_file_from_minio(version.object_name)
-        return StreamingResponse(
-            response,
-            media_type=version.content_type,
-            headers={"Content-Disposition": f"attachment; filename={db_file.filename}"}
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to download version: {str(e)}")
+    return db_file.filename, version
+
+
+@router.get("/files/{file_id}/versions/{version_id}/download")
+async def download_version(file_id: int, version_id: int, request: Request, db: Session = Depends(get_db)):
+    """下載特定版本"""
+    filename, version = await run_storage(get_version, file_id, version_id, db)
+    return await build_download_response(request, filename, version)
 
 
 @router.delete("/files/{file_id}/versions/{version_id}")
@@ -258,7 +558,7 @@ def delete_version(file_id: int, version_id: int, db: Session = Depends(get_db))
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
     
-    if len(db_file.versions) <= 1:
+    if db_file.version_count <= 1:
         raise HTTPException(status_code=400, detail="無法刪除最後一個版本，請改用刪除檔案功能")
     
     version = db.query(FileVersion).filter(
@@ -276,16 +576,13 @@ def delete_version(file_id: int, version_id: int, db: Session = Depends(get_db))
         db_file.current_version_id = other_versions[-1].id
         db.commit()
     
-    # Delete from MinIO
-    from ..storage import delete_file_from_minio
-    try:
-        delete_file_from_minio(version.object_name)
-    except Exception as e:
-        print(f"Error removing version from storage: {e}")
-    
     db.delete(version)
+    orphaned = release_blobs(db, [version.object_name])
     db.commit()
     
+    # Delete from MinIO only if no other version still references the blob
+    purge_objects(db, orphaned)
+    
     return {"message": f"版本 {version.version_number} 已刪除"}
 
 
@@ -314,10 +611,17 @@ def restore_version(file_id: int, version_id: int, db: Session = Depends(get_db)
 # ========== 現有 API ==========
 
 @router.get("/search", response_model=List[FileResponse])
-def search_files(q: str = None, category: str = None, tag: str = None, start_date: datetime = None, end_date: datetime = None, db: Session = Depends(get_db)):
-    query = db.query(FileRecord)
+def search_files(response: Response, q: str = None, category: str = None, tag: str = None, start_date: datetime = None, end_date: datetime = None, cursor: Optional[str] = None, limit: int = 100, skip: int = Query(0, ge=0, deprecated=True), db: Session = Depends(get_db)):
+    query = with_file_details(db.query(FileRecord))
+    rank = None
     if q:
-        query = query.filter(FileRecord.filename.contains(q))
+        matches = search.match_subquery(q) if search.FTS_ENABLED else None
+        if matches is not None:
+            # Full-text index on filename and tags, ordered by relevance
+            query = query.join(matches, matches.c.file_id == FileRecord.id)
+            rank = matches.c.rank
+        else:
+            query = query.filter(FileRecord.filename.contains(q))
     if category:
         query = query.filter(FileRecord.category == category)
     if tag:
@@ -327,7 +631,7 @@ def search_files(q: str = None, category: str = None, tag: str = None, start_dat
     if end_date:
         query = query.filter(FileRecord.created_at <= end_date)
     
-    results = query.all()
+    results = paginate_files(query, cursor, limit, response, rank=rank, skip=skip)
     return [build_file_response(f) for f in results]
 
 
@@ -366,21 +670,18 @@ def remove_tag(file_id: int, tag_name: str, db: Session = Depends(get_db)):
     return {"message": "Tag removed", "tags": [t.name for t in db_file.tags]}
 
 
-@router.get("/files/{file_id}/share", response_model=ShareResponse)
-def share_file(file_id: int, hours: int = 1, db: Session = Depends(get_db)):
-    db_file = db.query(FileRecord).filter(FileRecord.id == file_id).first()
-    if not db_file:
-        raise HTTPException(status_code=404, detail="File not found")
-    
-    if not db_file.current_version:
+def create_share_url(file_id: int, hours: int, db: Session) -> dict:
+    """產生當前版本的預簽名下載連結"""
+    if not 1 <= hours <= MAX_SHARE_HOURS:
+        raise HTTPException(status_code=400, detail=f"hours must be between 1 and {MAX_SHARE_HOURS}")
+    snapshot = load_file_snapshot(db, file_id)
+    if not snapshot["current_version"]:
         raise HTTPException(status_code=404, detail="No version found for this file")
-        
-    from ..storage import get_presigned_url
-    from datetime import timedelta, datetime
-    
-    expires_in = timedelta(hours=hours)
-    url = get_presigned_url(db_file.current_version.object_name, expires=expires_in)
-    expires_at = datetime.utcnow() + expires_in
     
+    url, expires_at = get_share_url(snapshot["current_version"]["object_name"], timedelta(hours=hours))
     return {"url": url, "expires_at": expires_at}
 
+
+@router.get("/files/{file_id}/share", response_model=ShareResponse)
+async def share_file(file_id: int, hours: int = 1, db: Session = Depends(get_db)):
+    return await run_storage(create_share_url, file_id, hours, db)
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import delete, select, update
 from sqlalchemy.orm import Session
 from ..database import get_db
-from ..models import Folder, FileRecord
-from ..schemas import FolderCreate, FolderResponse, FolderContentsResponse
-from typing import List
+from ..models import Folder, FileRecord, FileVersion, file_tags
+from ..schemas import FolderCreate, FolderResponse, FolderContentsResponse, FolderTreeNode
+from ..blobs import release_blobs, purge_objects
+from ..resumable import remove_folder_sessions, release_session_storage
+from .. import archive, counters, metadata_cache, search
+from ..folder_tree import load_tree, subtree_ids
+from .files import with_file_details, build_file_response
+from typing import List, Optional, Tuple
 
 router = APIRouter()
 
@@ -27,13 +34,40 @@ def list_folders(parent_id: int = None, db: Session = Depends(get_db)):
     folders = db.query(Folder).filter(filter_spec).all()
     return folders
 
+# 需宣告在 /folders/{folder_id} 之前，否則 "tree" 會被當成 folder_id
+@router.get("/folders/tree", response_model=List[FolderTreeNode])
+def get_folder_tree(
+    root_id: Optional[int] = None,
+    max_depth: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_db)
+):
+    """以單一遞迴查詢取得整棵資料夾樹 (root_id 省略時為所有頂層資料夾)"""
+    if root_id is not None and not db.query(Folder.id).filter(Folder.id == root_id).first():
+        raise HTTPException(status_code=404, detail="Folder not found")
+    return load_tree(db, root_id, max_depth)
+
+@router.get("/folders/{folder_id}/archive")
+def download_folder_archive(folder_id: int, db: Session = Depends(get_db)):
+    """以 ZIP 串流下載資料夾 (含所有子資料夾) 內各檔案的當前版本；0 為根目錄"""
+    entries = archive.folder_entries(db, folder_id)
+    name = db.query(Folder.name).filter(Folder.id == folder_id).scalar() if folder_id else "Root"
+    return StreamingResponse(
+        archive.stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": archive.content_disposition(f"{archive.safe_name(name)}.zip")}
+    )
+
 @router.get("/folders/{folder_id}", response_model=FolderContentsResponse)
 def get_folder_contents(folder_id: int, db: Session = Depends(get_db)):
     if folder_id == 0:
-        # Root Folder
-        db_folder = Folder(id=0, name="Root", parent_id=None) # Virtual object
+        # Root Folder (virtual); its subtree totals are the system-wide totals
+        totals = counters.get_total_counters(db)
+        db_folder = Folder(
+            id=0, name="Root", parent_id=None, total_file_count=totals["file_count"],
+            total_version_count=totals["version_count"], total_bytes=totals["total_bytes"]
+        )
         sub_folders = db.query(Folder).filter(Folder.parent_id == None).all()
-        files = db.query(FileRecord).filter(FileRecord.folder_id == None).all()
+        files = with_file_details(db.query(FileRecord)).filter(FileRecord.folder_id == None).all()
     else:
         # Standard Folder
         db_folder = db.query(Folder).filter(Folder.id == folder_id).first()
@@ -42,59 +76,81 @@ def get_folder_contents(folder_id: int, db: Session = Depends(get_db)):
         # Subfolders
         sub_folders = db.query(Folder).filter(Folder.parent_id == folder_id).all()
         # Files
-        files = db.query(FileRecord).filter(FileRecord.folder_id == folder_id).all() # Accessing relationship ideally, but query works too
+        files = with_file_details(db.query(FileRecord)).filter(FileRecord.folder_id == folder_id).all()
     
     return {
         "id": db_folder.id,
         "name": db_folder.name,
         "parent_id": db_folder.parent_id,
+        "total_file_count": db_folder.total_file_count,
+        "total_version_count": db_folder.total_version_count,
+        "total_bytes": db_folder.total_bytes,
         "sub_folders": sub_folders,
-        "files": files
+        "files": [build_file_response(f) for f in files]
     }
 
-def delete_folder_contents(folder_id: int, db: Session):
-    """刪除資料夾內所有內容 (檔案及子資料夾)"""
-    from ..storage import delete_file_from_minio
-    from ..models import FileVersion
-    
-    # 1. Delete all files in this folder
-    files = db.query(FileRecord).filter(FileRecord.folder_id == folder_id).all()
-    for file in files:
-        # First, delete all versions from MinIO and database
-        for version in file.versions:
-            try:
-                delete_file_from_minio(version.object_name)
-            except Exception:
-                pass  # Continue deletion even if storage fails
-            db.delete(version)
-        
-        # Then delete the file record
-        db.delete(file)
-    
-    # 2. Recursively delete subfolders
-    subfolders = db.query(Folder).filter(Folder.parent_id == folder_id).all()
-    for subfolder in subfolders:
-        delete_folder_contents(subfolder.id, db)
-        db.delete(subfolder)
+def delete_folder_tree(folder_id: int, db: Session) -> Tuple[List[str], List[tuple]]:
+    """
+    以批次 SQL 刪除資料夾子樹 (含資料夾本身) 的所有檔案、版本、上傳工作階段及資料夾
+
+    每個資料表只執行一次 DELETE ... WHERE ... IN (子樹)，不論檔案數量多寡。
+
+    Returns:
+        (已無引用的物件名稱，commit 後由呼叫端以 purge_objects 刪除；
+         被刪除的上傳工作階段，commit 後由呼叫端以 release_session_storage 清除暫存資料)
+    """
+    folder_ids = subtree_ids(folder_id)
+    file_ids = select(FileRecord.id).where(FileRecord.folder_id.in_(folder_ids))
+    bulk = {"synchronize_session": False}
+
+    # SQLite (pysqlite) 只在 INSERT/UPDATE/DELETE 開頭的陳述式前開始交易，WITH 開頭的子樹陳述式不會：
+    # 先以不改變內容的 UPDATE 更新根資料夾以開始交易並取得寫入鎖，整棵子樹才在同一交易中刪除
+    db.query(Folder).filter(Folder.id == folder_id).update({Folder.id: Folder.id}, synchronize_session=False)
+    # PostgreSQL：同樣鎖定整棵子樹的資料夾列，等待正在完成上傳 (check_target_folder) 的交易 commit，
+    # 之後的查詢與 DELETE 才看得到其新建的檔案；鎖定順序與完成上傳相同 (資料夾 -> 工作階段)，不會死結
+    db.execute(update(Folder).where(Folder.id.in_(folder_ids)).values(id=Folder.id), execution_options=bulk)
+
+    object_names = list(db.execute(
+        select(FileVersion.object_name).where(FileVersion.file_id.in_(file_ids))
+    ).scalars())
+    # 與上傳相同，先更新 blobs 再更新 stats_counters，PostgreSQL 上並行上傳相同內容時不會死結
+    orphaned = release_blobs(db, object_names)
+
+    metadata_cache.invalidate_files(db, db.execute(file_ids).scalars())
+    search.remove_from_index(db.connection(), file_ids)
+    counters.remove_files(db, FileRecord.folder_id.in_(folder_ids))
+    # 先解除 current_version 指向，版本才能在檔案記錄之前刪除
+    db.execute(
+        update(FileRecord).where(FileRecord.folder_id.in_(folder_ids)).values(current_version_id=None),
+        execution_options=bulk
+    )
+    db.execute(delete(file_tags).where(file_tags.c.file_id.in_(file_ids)))
+    db.execute(delete(FileVersion).where(FileVersion.file_id.in_(file_ids)), execution_options=bulk)
+    db.execute(delete(FileRecord).where(FileRecord.folder_id.in_(folder_ids)), execution_options=bulk)
+    # 目標為子樹內資料夾的上傳工作階段已無法完成 (upload_sessions.folder_id 外鍵)
+    sessions = remove_folder_sessions(db, folder_ids)
+    # 同一陳述式刪除整棵子樹，不違反 parent_id 外鍵
+    db.execute(delete(Folder).where(Folder.id.in_(folder_ids)), execution_options=bulk)
+
+    return orphaned, sessions
 
 @router.delete("/folders/{folder_id}")
 def delete_folder(folder_id: int, recursive: bool = False, db: Session = Depends(get_db)):
     db_folder = db.query(Folder).filter(Folder.id == folder_id).first()
     if not db_folder:
         raise HTTPException(status_code=404, detail="Folder not found")
-    
+
     # Check contents
-    subfolders = db.query(Folder).filter(Folder.parent_id == folder_id).all()
-    files = db.query(FileRecord).filter(FileRecord.folder_id == folder_id).all()
-    
-    has_contents = len(subfolders) > 0 or len(files) > 0
-    
-    if has_contents:
-        if not recursive:
-            raise HTTPException(status_code=400, detail="Folder is not empty. Use recursive=true to delete.")
-        else:
-            delete_folder_contents(folder_id, db)
-    
-    db.delete(db_folder)
+    has_subfolders = db.query(Folder.id).filter(Folder.parent_id == folder_id).first() is not None
+    has_files = db.query(FileRecord.id).filter(FileRecord.folder_id == folder_id).first() is not None
+
+    if (has_subfolders or has_files) and not recursive:
+        raise HTTPException(status_code=400, detail="Folder is not empty. Use recursive=true to delete.")
+
+    orphaned, sessions = delete_folder_tree(folder_id, db)
     db.commit()
+
+    # Remove blobs that are no longer referenced by any version; failures are queued for retry
+    purge_objects(db, orphaned)
+    release_session_storage(db, sessions)
     return {"message": "Folder deleted successfully"}
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..models import Job
+from ..schemas import JobResponse
+from .. import jobs
+
+router = APIRouter()
+
+# 單次列出的工作數上限
+MAX_JOBS_PAGE_SIZE = 500
+
+
+@router.get("/jobs", response_model=List[JobResponse])
+def list_jobs(status: Optional[str] = None, type: Optional[str] = None, limit: int = 100, db: Session = Depends(get_db)):
+    """列出背景工作 (由新到舊)，可依狀態 (queued / running / succeeded / failed) 與類型篩選"""
+    query = db.query(Job)
+    if status:
+        query = query.filter(Job.status == status)
+    if type:
+        query = query.filter(Job.type == type)
+    limit = max(1, min(limit, MAX_JOBS_PAGE_SIZE))
+    return [jobs.job_state(job) for job in query.order_by(Job.id.desc()).limit(limit)]
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+def get_job(job_id: int, db: Session = Depends(get_db)):
+    job = db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.job_state(job)
+
+
+@router.post("/jobs/{job_id}/retry", response_model=JobResponse)
+def retry_job(job_id: int, db: Session = Depends(get_db)):
+    """重新排入失敗的工作 (重試次數歸零)"""
+    job = jobs.retry(db, job_id)
+    if job is None:
+        if db.get(Job, job_id) is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail="Only failed jobs can be retried")
+    return jobs.job_state(job)
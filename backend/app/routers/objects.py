@@ -0,0 +1,55 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse as FileDownload, Response, StreamingResponse
+from typing import Optional
+from .. import storage
+from ..storage import run_storage, stream_object, local_object_path, download_file_from_minio, upload_part
+from ..storage.signed import SignedUrls
+from ..resumable import UPLOAD_MAX_CHUNK_SIZE
+
+router = APIRouter()
+
+
+def verify_signature(
+    method: str, object_name: str, expires: int, signature: str,
+    upload_id: Optional[str] = None, part_number: Optional[int] = None
+):
+    """
+    本機與記憶體後端的限時網址 (分享連結、直接上傳分段) 由此路由提供；MinIO 後端回傳 404。
+
+    Raises:
+        HTTPException 403: 簽名錯誤或已過期
+    """
+    if not isinstance(storage.backend, SignedUrls):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not storage.backend.verify_url(method, object_name, expires, signature, upload_id, part_number):
+        raise HTTPException(status_code=403, detail="Invalid or expired signature")
+
+
+@router.get("/objects/{object_name:path}")
+async def get_signed_object(object_name: str, expires: int, signature: str):
+    """以限時網址下載物件 (本機後端直接傳送檔案，支援 Range)"""
+    verify_signature("GET", object_name, expires, signature)
+    path = await run_storage(local_object_path, object_name) if storage.backend.local_files else None
+    if path:
+        return FileDownload(path, media_type="application/octet-stream")
+    try:
+        response = await run_storage(download_file_from_minio, object_name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Object not found")
+    return StreamingResponse(stream_object(response), media_type="application/octet-stream")
+
+
+@router.put("/objects/{object_name:path}")
+async def put_signed_part(object_name: str, request: Request, expires: int, signature: str, uploadId: str, partNumber: int):
+    """以預簽名網址上傳 multipart 分段 (直接上傳)，回應 ETag 標頭"""
+    verify_signature("PUT", object_name, expires, signature, uploadId, partNumber)
+    data = bytearray()
+    async for chunk in request.stream():
+        data.extend(chunk)
+        if len(data) > UPLOAD_MAX_CHUNK_SIZE:
+            raise HTTPException(status_code=413, detail=f"Chunk too large (max {UPLOAD_MAX_CHUNK_SIZE} bytes)")
+    try:
+        etag = await run_storage(upload_part, object_name, uploadId, partNumber, bytes(data))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="No such upload")
+    return Response(headers={"ETag": f'"{etag}"'})
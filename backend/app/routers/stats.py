@@ -1,30 +1,48 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from ..database import get_db
-from ..models import FileRecord, FileVersion
-from ..schemas import SystemStats
+from ..models import Folder
+from ..schemas import SystemStats, FolderStats
+from ..counters import get_system_counters, get_folder_counters
+from ..storage import transfer_stats
+from ..jobs import queue_stats
 
 router = APIRouter()
 
 @router.get("/stats", response_model=SystemStats)
 def get_system_stats(db: Session = Depends(get_db)):
-    total_files = db.query(FileRecord).count()
-    
-    # Query size from FileVersion table (size was moved there for versioning)
-    total_size = db.query(func.sum(FileVersion.size)).scalar() or 0
-    
-    # Category breakdown
-    categories = db.query(FileRecord.category, func.count(FileRecord.id)).group_by(FileRecord.category).all()
-    category_stats = {cat: count for cat, count in categories}
+    # Precomputed counters maintained on every write (see app/counters.py),
+    # so this reads a handful of rows regardless of catalogue size
+    stats = get_system_counters(db)
     
     # Placeholder for storage usage (assuming 1GB limit for demo)
-    usage_percent = (total_size / (1024 * 1024 * 1024)) * 100
+    usage_percent = (stats["total_size_bytes"] / (1024 * 1024 * 1024)) * 100
     
     return {
-        "total_files": total_files,
-        "total_size_bytes": total_size,
+        **stats,
         "storage_usage_percent": round(usage_percent, 2),
-        "categories": category_stats
     }
 
+@router.get("/stats/folders/{folder_id}", response_model=FolderStats)
+def get_folder_stats(folder_id: int, db: Session = Depends(get_db)):
+    """資料夾直接包含的檔案數、版本數與大小 (folder_id = 0 為根目錄)"""
+    if folder_id != 0 and not db.query(Folder.id).filter(Folder.id == folder_id).first():
+        raise HTTPException(status_code=404, detail="Folder not found")
+    return get_folder_counters(db, folder_id or None)
+
+
+@router.get("/stats/storage")
+def get_storage_stats():
+    """
+    儲存傳輸統計：各操作的次數、失敗數、位元組數、平均耗時與傳輸速率，
+    以及 MinIO 連線池設定、新建 / 丟棄的連線數與重試次數。
+
+    統計為處理此請求的 worker 行程自啟動以來的累計值。
+    """
+    return transfer_stats()
+
+
+@router.get("/stats/jobs")
+def get_job_stats(db: Session = Depends(get_db)):
+    """背景工作佇列：各類型、各狀態的工作數，最早一個到期未執行工作的等待秒數，以及本行程的 worker 執行緒數"""
+    return queue_stats(db)
@@ -0,0 +1,171 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.orm import Session
+from ..database import get_db
+from ..models import Folder
+from ..storage import run_storage
+from ..blobs import acquire_staged_blob, purge_objects
+from ..resumable import (
+    create_session, get_session, load_session_state, write_part, part_upload_url,
+    assemble_session, claim_session, discard_session, forget_session, UPLOAD_MAX_CHUNK_SIZE
+)
+from ..schemas import FileResponse, ShareResponse, UploadSessionCreate, UploadSessionResponse
+from ..utils import HASH_ALGORITHM
+from .files import find_upload_target, save_version
+
+router = APIRouter()
+
+
+def session_headers(state: dict) -> dict:
+    """tus 風格的進度標頭"""
+    return {
+        "Upload-Offset": str(state["offset"]),
+        "Upload-Length": str(state["size"]),
+        "X-Next-Part": str(state["next_part"]),
+    }
+
+
+@router.post("/uploads", response_model=UploadSessionResponse, status_code=201)
+async def start_upload(payload: UploadSessionCreate, response: Response, db: Session = Depends(get_db)):
+    """建立可續傳上傳工作階段 (direct=true 時回傳分段的預簽名網址，由客戶端直接上傳至 MinIO)"""
+    state = await run_storage(
+        create_session, db, payload.filename, payload.size, payload.content_type, payload.folder_id,
+        payload.direct, payload.content_hash
+    )
+    response.headers["Location"] = f"/uploads/{state['id']}"
+    return state
+
+
+@router.head("/uploads/{session_id}")
+async def upload_offset(session_id: str, db: Session = Depends(get_db)):
+    """查詢已接收的位元組數 (Upload-Offset) 與下一個分段編號 (X-Next-Part)"""
+    state = await run_storage(load_session_state, db, session_id)
+    return Response(headers=session_headers(state))
+
+
+@router.get("/uploads/{session_id}", response_model=UploadSessionResponse)
+async def get_upload(session_id: str, response: Response, db: Session = Depends(get_db)):
+    state = await run_storage(load_session_state, db, session_id)
+    response.headers.update(session_headers(state))
+    return state
+
+
+@router.get("/uploads/{session_id}/parts/{part_number}/url", response_model=ShareResponse)
+async def get_part_url(session_id: str, part_number: int, db: Session = Depends(get_db)):
+    """直接上傳：簽發單一分段的預簽名 PUT 網址"""
+    return await run_storage(part_upload_url, db, session_id, part_number)
+
+
+@router.put("/uploads/{session_id}/parts/{part_number}", response_model=UploadSessionResponse)
+async def put_part(session_id: str, part_number: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    """
+    上傳一個分段，請求本文即為分段內容。
+
+    可附帶 Upload-Offset 標頭，與伺服器已接收的位元組數不符時回傳 409。
+    """
+    content_length = request.headers.get("content-length")
+    if content_length is not None and not content_length.strip().isdigit():
+        raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+    if int(content_length or 0) > UPLOAD_MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=413, detail=f"Chunk too large (max {UPLOAD_MAX_CHUNK_SIZE} bytes)")
+    data = bytearray()
+    async for chunk in request.stream():
+        data.extend(chunk)
+        if len(data) > UPLOAD_MAX_CHUNK_SIZE:
+            raise HTTPException(status_code=413, detail=f"Chunk too large (max {UPLOAD_MAX_CHUNK_SIZE} bytes)")
+
+    offset_header = request.headers.get("upload-offset")
+    offset = int(offset_header) if offset_header and offset_header.isdigit() else None
+    state = await run_storage(write_part, db, session_id, part_number, bytes(data), offset)
+    response.headers.update(session_headers(state))
+    return state
+
+
+def check_target_folder(db: Session, session):
+    """
+    工作階段建立後目標資料夾可能已被刪除 (SQLite 未強制外鍵)：刪除工作階段並回傳 404。
+
+    以不改變內容的 UPDATE 鎖定資料夾列 (SQLite 則取得寫入鎖) 直到版本寫入 commit，
+    期間遞迴刪除資料夾會等待，之後一併刪除新建的檔案。
+    """
+    if session.folder_id is None:
+        return
+    locked = db.query(Folder).filter(Folder.id == session.folder_id).update(
+        {Folder.id: Folder.id}, synchronize_session=False
+    )
+    if not locked:
+        discard_session(db, session)
+        raise HTTPException(status_code=404, detail="Folder not found")
+
+
+def finish_upload_deferred(db: Session, session) -> FileResponse:
+    """
+    內容雜湊不在此行程時：版本先指向組成的物件，雜湊、去重與宣告雜湊的驗證由 finalize_upload 工作處理。
+
+    與延後處理的上傳相同 (見 app/finalize.py)，不在請求中讀回整個物件。
+    """
+    session_id = session.id
+    filename, content_type, folder_id = session.filename, session.content_type, session.folder_id
+    size, staged_object, expected_hash = session.size, session.object_name, session.expected_hash
+    check_target_folder(db, session)
+    existing_file = find_upload_target(db, filename, folder_id, None)
+
+    # 工作階段與版本在同一交易中刪除/建立；失敗時保留工作階段與物件，可再次完成
+    claim_session(db, session_id)
+    response = save_version(
+        db, existing_file, filename, content_type, folder_id,
+        None, size, staged_object, False, expected_hash=expected_hash
+    )
+    forget_session(session_id)
+    return response
+
+
+def finish_upload(session_id: str, db: Session) -> FileResponse:
+    """組成物件並建立檔案版本 (與 POST /upload 相同的版本控管規則)"""
+    session = get_session(db, session_id)
+    content_hash = assemble_session(db, session)
+    if content_hash is None:
+        return finish_upload_deferred(db, session)
+    if session.expected_hash and session.expected_hash != content_hash:
+        discard_session(db, session)
+        raise HTTPException(status_code=400, detail="Content hash mismatch")
+    filename, content_type, folder_id = session.filename, session.content_type, session.folder_id
+    size, staged_object = session.size, session.object_name
+    check_target_folder(db, session)
+
+    try:
+        existing_file = find_upload_target(db, filename, folder_id, content_hash)
+    except HTTPException:
+        # 內容與當前版本相同，工作階段不再需要
+        discard_session(db, session)
+        raise
+
+    # 工作階段與版本在同一交易中刪除/建立；失敗時保留工作階段，可再次完成
+    claim_session(db, session_id)
+
+    # 已有相同內容時不複製，只增加引用
+    try:
+        blob, created = acquire_staged_blob(db, HASH_ALGORITHM, content_hash, size, content_type, staged_object)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to store upload: {str(e)}")
+
+    response = save_version(
+        db, existing_file, filename, content_type, folder_id,
+        content_hash, size, blob.object_name, created
+    )
+    forget_session(session_id)
+    purge_objects(db, [staged_object])
+    return response
+
+
+@router.post("/uploads/{session_id}/complete", response_model=FileResponse)
+async def complete_upload(session_id: str, db: Session = Depends(get_db)):
+    return await run_storage(finish_upload, session_id, db)
+
+
+@router.delete("/uploads/{session_id}")
+async def cancel_upload(session_id: str, db: Session = Depends(get_db)):
+    """取消上傳並中止 multipart upload"""
+    session = await run_storage(get_session, db, session_id)
+    await run_storage(discard_session, db, session)
+    return {"message": "Upload cancelled"}
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Optional, List
 from datetime import datetime
 
 class FolderCreate(BaseModel):
@@ -10,11 +10,26 @@ class FolderResponse(BaseModel):
     id: int
     name: str
     parent_id: Optional[int]
+    # 子樹統計 (含所有子資料夾)
+    total_file_count: int = 0
+    total_version_count: int = 0
+    total_bytes: int = 0
 
     class Config:
         from_attributes = True
 
 
+class FolderTreeNode(BaseModel):
+    id: int
+    name: str
+    parent_id: Optional[int]
+    depth: int
+    total_file_count: int = 0
+    total_version_count: int = 0
+    total_bytes: int = 0
+    children: List["FolderTreeNode"] = []
+
+
 class TagResponse(BaseModel):
     id: int
     name: str
@@ -31,6 +46,7 @@ class FileVersionResponse(BaseModel):
     id: int
     version_number: int
     sha1_hash: Optional[str] = None
+    hash_algorithm: Optional[str] = None
     size: int
     content_type: str
     uploaded_at: datetime
@@ -57,6 +73,51 @@ class FileResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class BatchUploadItem(BaseModel):
+    """批次上傳的單一項目結果"""
+    filename: str
+    path: Optional[str] = None  # 壓縮檔內的目錄
+    status: str  # created / versioned / duplicate / failed
+    file_id: Optional[int] = None
+    version_number: Optional[int] = None
+    size: int = 0
+    detail: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    total: int
+    created: int
+    versioned: int
+    duplicate: int
+    failed: int
+    items: List[BatchUploadItem] = []
+
+class BatchDownloadRequest(BaseModel):
+    file_ids: List[int] = []
+    folder_ids: List[int] = []  # 每個資料夾在壓縮檔內成為一個目錄 (含所有子資料夾)
+    filename: Optional[str] = None  # 下載的檔名，預設 download.zip
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+    content_type: Optional[str] = None
+    folder_id: Optional[int] = None
+    direct: bool = False  # 以預簽名網址直接上傳至 MinIO
+    content_hash: Optional[str] = None  # 預期的內容雜湊 (HASH_ALGORITHM)，完成時驗證
+
+class UploadSessionResponse(BaseModel):
+    """可續傳上傳工作階段狀態"""
+    id: str
+    filename: str
+    size: int
+    offset: int  # 已接收的位元組數
+    next_part: int
+    chunk_size: int  # 建議的分段大小
+    status: str
+    expires_at: datetime
+    direct: bool = False
+    part_count: int = 0  # 以 chunk_size 切分時的分段數
+    part_urls: List[str] = []  # 直接上傳：前幾個分段的預簽名 PUT 網址 (僅建立時回傳)
+
 class FileUpdate(BaseModel):
     filename: Optional[str] = None
     folder_id: Optional[int] = None
@@ -65,6 +126,9 @@ class FolderContentsResponse(BaseModel):
     id: int
     name: str
     parent_id: Optional[int]
+    total_file_count: int = 0
+    total_version_count: int = 0
+    total_bytes: int = 0
     sub_folders: List[FolderResponse] = []
     files: List[FileResponse] = []
 
@@ -80,3 +144,26 @@ class SystemStats(BaseModel):
     total_size_bytes: int
     storage_usage_percent: float = 0.0
     categories: dict
+    total_versions: int = 0
+    category_sizes: dict = {}
+
+class FolderStats(BaseModel):
+    folder_id: int
+    file_count: int
+    version_count: int
+    total_bytes: int
+
+class JobResponse(BaseModel):
+    """背景工作狀態"""
+    id: int
+    type: str
+    status: str  # queued / running / succeeded / failed
+    payload: dict = {}
+    attempts: int = 0
+    max_attempts: int = 0
+    last_error: Optional[str] = None
+    result: Optional[Any] = None
+    run_after: datetime
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
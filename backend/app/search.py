@@ -0,0 +1,198 @@
+"""
+檔名與標籤的全文檢索索引 (SQLite FTS5)
+
+file_search 虛擬表的 rowid 即 file_records.id，於 ORM flush 時同步更新。
+FTS5 的 unicode61 斷詞器會把連續的中日韓文字視為單一詞，因此寫入與查詢前
+先將每個 CJK 字元切開，查詢時以相鄰字元組成片語比對，英數詞則做前綴比對。
+
+使用方式 (重建索引)：
+    python -m app.search --rebuild
+"""
+import re
+from typing import Optional
+from sqlalchemy import event, inspect, text, column, literal_column, select, table, Select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, selectinload
+from .database import SessionLocal
+from .models import FileRecord
+
+FTS_TABLE = "file_search"
+REBUILD_BATCH_SIZE = 1000
+
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+# 連續的 CJK 字元，或不含 CJK 與底線的英數字詞 (與 unicode61 的分詞規則一致)
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+
+# init_search_index 確認 FTS5 可用後才啟用；其他資料庫退回 LIKE 搜尋
+FTS_ENABLED = False
+
+_fts = table(FTS_TABLE, column("rowid"), column("filename"), column("tags"))
+
+
+def segment_text(value: str) -> str:
+    """將文字轉為索引用的詞序列，CJK 字元逐字切開"""
+    tokens = []
+    for token in _TOKEN_RE.findall(value.lower()):
+        if re.match(rf"[{_CJK}]", token):
+            tokens.extend(token)
+        else:
+            tokens.append(token)
+    return " ".join(tokens)
+
+
+def build_match_query(q: str) -> Optional[str]:
+    """
+    將使用者輸入轉為 FTS5 MATCH 運算式：所有詞都需符合 (AND)。
+
+    - CJK 字串：相鄰字元組成片語，例如 "台北" -> "台 北"
+    - 英數詞：前綴比對，例如 rep -> "rep"*
+    """
+    parts = []
+    for token in _TOKEN_RE.findall(q.lower()):
+        if re.match(rf"[{_CJK}]", token):
+            parts.append('"' + " ".join(token) + '"')
+        else:
+            parts.append(f'"{token}"*')
+    return " ".join(parts) or None
+
+
+def init_search_index(engine: Engine):
+    """建立 FTS5 虛擬表；首次建立時從 file_records 回填索引"""
+    global FTS_ENABLED
+    if engine.dialect.name != "sqlite":
+        return
+
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+            {"name": FTS_TABLE}
+        ).first()
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(filename, tags, tokenize='unicode61 remove_diacritics 2')"
+            ))
+        except Exception as e:
+            print(f"FTS5 unavailable, falling back to LIKE search: {e}")
+            return
+    FTS_ENABLED = True
+
+    if not exists:
+        db = SessionLocal()
+        try:
+            rebuild_search_index(db)
+        finally:
+            db.close()
+
+
+def _index_rows(files) -> list:
+    return [
+        {
+            "rowid": f.id,
+            "filename": segment_text(f.filename or ""),
+            "tags": segment_text(" ".join(t.name for t in f.tags)),
+        }
+        for f in files
+    ]
+
+
+def index_files(connection, files):
+    """寫入或更新檔案的索引列"""
+    if not FTS_ENABLED:
+        return
+    rows = _index_rows(files)
+    if rows:
+        remove_from_index(connection, [row["rowid"] for row in rows])
+        connection.execute(_fts.insert(), rows)
+
+
+def remove_from_index(connection, file_ids):
+    """
+    移除檔案的索引列 (批次 SQL 刪除檔案時需自行呼叫)
+
+    file_ids 可為 id 清單或 select(FileRecord.id) 子查詢
+    """
+    if not FTS_ENABLED:
+        return
+    if isinstance(file_ids, Select):
+        connection.execute(_fts.delete().where(_fts.c.rowid.in_(file_ids)))
+    elif file_ids:
+        connection.execute(_fts.delete().where(_fts.c.rowid.in_(list(file_ids))))
+
+
+def rebuild_search_index(db: Session):
+    """清空並依 file_records 重建整個索引"""
+    connection = db.connection()
+    connection.execute(_fts.delete())
+    last_id = 0
+    while True:
+        files = db.query(FileRecord).options(selectinload(FileRecord.tags)).filter(
+            FileRecord.id > last_id
+        ).order_by(FileRecord.id).limit(REBUILD_BATCH_SIZE).all()
+        if not files:
+            break
+        connection.execute(_fts.insert(), _index_rows(files))
+        last_id = files[-1].id
+        db.expunge_all()
+    db.commit()
+
+
+def match_subquery(q: str):
+    """
+    符合查詢的檔案及相關度 (bm25，數值越小越相關)。
+
+    Returns:
+        子查詢 (欄位 file_id, rank)；查詢沒有可用的詞時回傳 None
+    """
+    match = build_match_query(q)
+    if match is None:
+        return None
+    return (
+        select(_fts.c.rowid.label("file_id"), literal_column(f"bm25({FTS_TABLE})").label("rank"))
+        .select_from(_fts)
+        .where(literal_column(FTS_TABLE).op("MATCH")(match))
+        .subquery()
+    )
+
+
+def _needs_reindex(obj: FileRecord) -> bool:
+    state = inspect(obj)
+    return state.attrs.filename.history.has_changes() or state.attrs.tags.history.has_changes()
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _sync_search_index(session: Session, flush_context):
+    """flush 後同步新增、改名、標籤變更及刪除的檔案"""
+    if not FTS_ENABLED:
+        return
+    changed = [
+        obj for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, FileRecord) and (obj in session.new or _needs_reindex(obj))
+    ]
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, FileRecord)]
+    if not changed and not deleted:
+        return
+    connection = session.connection()
+    remove_from_index(connection, deleted)
+    index_files(connection, changed)
+
+
+if __name__ == "__main__":
+    import argparse
+    from .database import engine
+
+    parser = argparse.ArgumentParser(description="DMS 全文檢索索引工具")
+    parser.add_argument("--rebuild", action="store_true", help="重建整個索引")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        init_search_index(engine)
+        if FTS_ENABLED:
+            session = SessionLocal()
+            try:
+                rebuild_search_index(session)
+            finally:
+                session.close()
+            print("[完成] 索引已重建")
+    else:
+        parser.print_help()
@@ -0,0 +1,259 @@
+"""
+物件儲存
+
+依 STORAGE_BACKEND 選擇後端 (base.StorageBackend 的實作)：
+- minio (預設)：MinIO / S3 相容服務
+- local：本機檔案系統，下載以 FileResponse 直接傳送檔案
+- memory：行程內記憶體 (測試與開發用)
+
+其餘程式只使用本模組的函式；本機與記憶體後端的限時網址由 API 的 /objects 路由提供。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import asyncio
+import os
+import secrets
+import time
+from .base import ObjectInfo, StorageBackend
+from .metrics import transfer_metrics
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "minio")
+
+MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "localhost:9000")
+MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "admin")
+MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "password")
+BUCKET_NAME = os.getenv("BUCKET_NAME", "dms-files")
+MINIO_SECURE = os.getenv("MINIO_SECURE", "false").lower() in ("1", "true", "yes")
+
+# 串流上傳時每個 multipart part 的大小 (MinIO 最小 5 MB)
+# 單一上傳請求的記憶體用量上限約為 part 大小 x (平行上傳數 + 1)
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", 10 * 1024 * 1024))
+
+# S3 multipart 的單一 part 大小下限 (最後一個 part 除外)
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# 下載串流時每次從 MinIO 讀取的區塊大小
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 256 * 1024))
+
+# 儲存操作專用的執行緒池，與 AnyIO 預設執行緒池分開，避免大量傳輸耗盡其執行緒
+STORAGE_MAX_WORKERS = int(os.getenv("STORAGE_MAX_WORKERS", 32))
+# 同時等待儲存執行緒的操作上限；超過時呼叫端在事件迴圈中等待 (backpressure)
+STORAGE_MAX_PENDING = int(os.getenv("STORAGE_MAX_PENDING", 1024))
+
+# 批次刪除時最多同時送出的 DeleteObjects 請求數 (每批最多 1000 個物件)
+STORAGE_DELETE_CONCURRENCY = int(os.getenv("STORAGE_DELETE_CONCURRENCY", 4))
+
+# MinIO 連線池：每個 worker 行程保留的連線數 (預設與儲存執行緒數相同)、逾時 (秒)
+# 與暫時性錯誤 (5xx、連線中斷) 的重試次數及退避基數 (秒)
+MINIO_POOL_SIZE = int(os.getenv("MINIO_POOL_SIZE", STORAGE_MAX_WORKERS))
+MINIO_CONNECT_TIMEOUT = float(os.getenv("MINIO_CONNECT_TIMEOUT", 10))
+MINIO_READ_TIMEOUT = float(os.getenv("MINIO_READ_TIMEOUT", 60))
+MINIO_MAX_RETRIES = int(os.getenv("MINIO_MAX_RETRIES", 5))
+MINIO_RETRY_BACKOFF = float(os.getenv("MINIO_RETRY_BACKOFF", 0.2))
+# 單一串流上傳同時上傳的 part 數 (各自佔用一條連線)
+MINIO_PARALLEL_UPLOADS = int(os.getenv("MINIO_PARALLEL_UPLOADS", 3))
+
+# 分享網址的簽名時間對齊此時間窗 (分鐘)，同一時間窗內重複分享得到相同網址；0 表示每次重新簽名
+SHARE_URL_WINDOW_MINUTES = int(os.getenv("SHARE_URL_WINDOW_MINUTES", 15))
+SHARE_URL_CACHE_SIZE = int(os.getenv("SHARE_URL_CACHE_SIZE", 4096))
+# S3 預簽名網址的有效時間上限
+MAX_PRESIGNED_EXPIRY = timedelta(days=7)
+
+# 本機後端的根目錄
+LOCAL_STORAGE_PATH = os.getenv("LOCAL_STORAGE_PATH", "./storage")
+# 本機與記憶體後端的限時網址：API 對外的網址與簽章金鑰
+# (未設定金鑰時，本機後端在根目錄產生 .url-secret，供所有 worker 共用)
+STORAGE_PUBLIC_URL = os.getenv("STORAGE_PUBLIC_URL", "http://localhost:8000")
+STORAGE_URL_SECRET = os.getenv("STORAGE_URL_SECRET", "")
+
+
+def _local_url_secret(root: str) -> bytes:
+    if STORAGE_URL_SECRET:
+        return STORAGE_URL_SECRET.encode()
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, ".url-secret")
+    if not os.path.exists(path):
+        # 寫完整後才以 link 放上，同時啟動的 worker 不會讀到空檔案；已存在時沿用
+        temp_path = f"{path}.{os.getpid()}"
+        with open(temp_path, "w") as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(temp_path)
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+def create_backend(name: str = STORAGE_BACKEND) -> StorageBackend:
+    if name in ("minio", "s3"):
+        from .s3 import S3Backend, create_pool_manager
+        http_client = create_pool_manager(
+            MINIO_POOL_SIZE, MINIO_CONNECT_TIMEOUT, MINIO_READ_TIMEOUT,
+            MINIO_MAX_RETRIES, MINIO_RETRY_BACKOFF
+        )
+        return S3Backend(
+            MINIO_ENDPOINT, MINIO_ACCESS_KEY, MINIO_SECRET_KEY, BUCKET_NAME,
+            UPLOAD_PART_SIZE, STORAGE_DELETE_CONCURRENCY, secure=MINIO_SECURE,
+            parallel_uploads=MINIO_PARALLEL_UPLOADS, http_client=http_client
+        )
+    if name == "local":
+        from .local import LocalBackend
+        return LocalBackend(LOCAL_STORAGE_PATH, _local_url_secret(LOCAL_STORAGE_PATH), STORAGE_PUBLIC_URL)
+    if name == "memory":
+        from .memory import MemoryBackend
+        secret = STORAGE_URL_SECRET.encode() if STORAGE_URL_SECRET else secrets.token_bytes(32)
+        return MemoryBackend(secret, STORAGE_PUBLIC_URL)
+    raise ValueError(f"Unknown STORAGE_BACKEND: {name}")
+
+
+backend = create_backend()
+
+_executor = ThreadPoolExecutor(max_workers=STORAGE_MAX_WORKERS, thread_name_prefix="storage")
+_pending: Optional[asyncio.Semaphore] = None
+
+def init_bucket():
+    backend.ensure_bucket()
+
+def upload_file_to_minio(file_data: BinaryIO, size: int, object_name: str, content_type: str):
+    """以串流方式寫入物件；size 為 -1 時表示長度未知 (MinIO 改用 multipart 分段上傳)"""
+    with transfer_metrics.track("put_object") as op:
+        start = file_data.tell() if size < 0 else 0
+        backend.put_object(object_name, file_data, size, content_type)
+        op["bytes"] = size if size >= 0 else file_data.tell() - start
+
+# 可續傳上傳逐段呼叫的 multipart API
+
+def create_multipart_upload(object_name: str, content_type: str) -> str:
+    """建立 multipart upload，回傳 upload_id"""
+    return backend.create_multipart_upload(object_name, content_type)
+
+def upload_part(object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+    """上傳單一 part，回傳 ETag"""
+    with transfer_metrics.track("upload_part", len(data)):
+        return backend.upload_part(object_name, upload_id, part_number, data)
+
+def complete_multipart_upload(object_name: str, upload_id: str, parts: List[Tuple[int, str]]):
+    """依 (part_number, etag) 組成完整物件"""
+    with transfer_metrics.track("complete_multipart_upload"):
+        backend.complete_multipart_upload(object_name, upload_id, parts)
+
+def abort_multipart_upload(object_name: str, upload_id: str):
+    backend.abort_multipart_upload(object_name, upload_id)
+
+def list_uploaded_parts(object_name: str, upload_id: str) -> List[Tuple[int, str, int]]:
+    """已上傳的 part (part_number, etag, size)，依編號排列"""
+    return backend.list_parts(object_name, upload_id)
+
+def get_presigned_part_url(object_name: str, upload_id: str, part_number: int, expires: timedelta) -> str:
+    """讓客戶端直接上傳單一 part 的預簽名 PUT 網址"""
+    return backend.presigned_url("PUT", object_name, expires, upload_id=upload_id, part_number=part_number)
+
+def copy_object_in_bucket(source: str, target: str, content_type: str):
+    """伺服器端複製物件，資料不經過 API"""
+    with transfer_metrics.track("copy_object"):
+        backend.copy_object(source, target, content_type)
+
+def delete_objects_from_minio(object_names: List[str]) -> Dict[str, str]:
+    """
+    批次刪除物件 (MinIO 以 DeleteObjects 每批 1000 個，最多同時送出 STORAGE_DELETE_CONCURRENCY 個批次)。
+
+    Returns:
+        刪除失敗的物件 {object_name: 錯誤訊息}
+    """
+    with transfer_metrics.track("delete_objects"):
+        try:
+            failures = backend.delete_objects(object_names)
+        except Exception as e:
+            failures = {name: str(e) for name in object_names}
+    if failures:
+        transfer_metrics.incr("delete_failures", len(failures))
+    return failures
+
+def list_objects(prefix: Optional[str] = None) -> Iterator[ObjectInfo]:
+    """遞迴列出物件 (串流，不一次載入全部)"""
+    return backend.list_objects(prefix)
+
+def download_file_from_minio(object_name: str, offset: int = 0, length: int = 0):
+    """取得物件串流；指定 offset/length 時只讀取該區段 (讀取的位元組數由 stream_object 計入)"""
+    with transfer_metrics.track("get_object"):
+        return backend.get_object(object_name, offset=offset, length=length)
+
+def local_object_path(object_name: str) -> Optional[str]:
+    """物件的本機檔案路徑 (僅本機後端，backend.local_files 為 True)，可直接以 FileResponse 傳送"""
+    return backend.local_path(object_name)
+
+def get_presigned_url(object_name: str, expires: timedelta = timedelta(hours=1)):
+    return backend.presigned_url("GET", object_name, expires)
+
+@lru_cache(maxsize=SHARE_URL_CACHE_SIZE)
+def _presign_in_window(object_name: str, window_start: int, seconds: int) -> str:
+    return backend.presigned_url(
+        "GET", object_name, timedelta(seconds=seconds),
+        request_date=datetime.fromtimestamp(window_start, timezone.utc)
+    )
+
+def get_share_url(object_name: str, expires: timedelta) -> Tuple[str, datetime]:
+    """
+    分享用的預簽名下載網址及其到期時間 (UTC)。
+
+    簽名時間對齊 SHARE_URL_WINDOW_MINUTES 的時間窗起點，有效時間再延長一個時間窗，
+    因此同一時間窗內分享同一物件會得到相同的網址 (瀏覽器與 CDN 可快取)，且仍至少有效 expires
+    (受 7 天上限限制)。網址在行程內快取，不需每次重新計算簽名。
+    """
+    window = SHARE_URL_WINDOW_MINUTES * 60
+    if window <= 0:
+        return get_presigned_url(object_name, expires), datetime.utcnow() + expires
+    now = int(time.time())
+    window_start = now - now % window
+    seconds = int(min(expires + timedelta(seconds=window), MAX_PRESIGNED_EXPIRY).total_seconds())
+    url = _presign_in_window(object_name, window_start, seconds)
+    return url, datetime.utcfromtimestamp(window_start + seconds)
+
+
+def transfer_stats() -> dict:
+    """目前 worker 行程的儲存傳輸統計與連線設定"""
+    stats = {"backend": STORAGE_BACKEND, "max_workers": STORAGE_MAX_WORKERS}
+    if STORAGE_BACKEND in ("minio", "s3"):
+        stats["pool"] = {
+            "pool_size": MINIO_POOL_SIZE,
+            "connect_timeout": MINIO_CONNECT_TIMEOUT,
+            "read_timeout": MINIO_READ_TIMEOUT,
+            "max_retries": MINIO_MAX_RETRIES,
+            "retry_backoff": MINIO_RETRY_BACKOFF,
+            "part_size": UPLOAD_PART_SIZE,
+            "parallel_uploads": MINIO_PARALLEL_UPLOADS,
+        }
+    return {**stats, **transfer_metrics.snapshot()}
+
+
+async def run_storage(func, *args, **kwargs):
+    """在儲存執行緒池中執行阻塞的儲存操作 (MinIO 呼叫及其前後的資料庫查詢)"""
+    global _pending
+    if _pending is None:
+        _pending = asyncio.Semaphore(STORAGE_MAX_PENDING)
+    async with _pending:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+async def stream_object(response, chunk_size: int = DOWNLOAD_CHUNK_SIZE):
+    """
+    非同步逐塊讀取物件內容 (download_file_from_minio 的回傳值)。
+
+    每次只在讀取一個區塊時佔用儲存執行緒，等待慢速客戶端接收資料時不佔用任何執行緒。
+    """
+    try:
+        while True:
+            start = time.perf_counter()
+            chunk = await run_storage(response.read, chunk_size)
+            transfer_metrics.add_bytes("get_object", len(chunk), time.perf_counter() - start)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        response.close()
+        response.release_conn()
@@ -0,0 +1,129 @@
+"""
+儲存後端介面
+
+每個驅動程式 (s3 / local / memory) 實作 StorageBackend；app.storage 依 STORAGE_BACKEND
+選擇其中一個，其餘程式只透過 app.storage 的函式存取物件。
+"""
+import io
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class ObjectInfo:
+    """物件清單的項目 (欄位名稱與 minio 的 Object 相同)"""
+    object_name: str
+    size: int
+    last_modified: Optional[datetime]
+    is_dir: bool = False
+
+
+class ObjectReader:
+    """
+    物件內容的讀取器，提供與 urllib3 回應相同的 read / stream / close / release_conn，
+    呼叫端不需區分後端。limit 為最多讀取的位元組數 (None 表示讀到結尾)。
+    """
+
+    def __init__(self, source: BinaryIO, limit: Optional[int] = None):
+        self.source = source
+        self.remaining = limit
+
+    def read(self, amt: int = -1) -> bytes:
+        if self.remaining is not None:
+            if self.remaining <= 0:
+                return b""
+            amt = self.remaining if amt is None or amt < 0 else min(amt, self.remaining)
+        data = self.source.read(amt)
+        if self.remaining is not None:
+            self.remaining -= len(data)
+        return data
+
+    def stream(self, amt: int = 64 * 1024) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(amt)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.source.close()
+
+    def release_conn(self):
+        pass
+
+
+def open_range(source: BinaryIO, offset: int = 0, length: int = 0) -> ObjectReader:
+    """自 offset 起讀取 length 位元組 (0 表示讀到結尾)"""
+    if offset:
+        source.seek(offset, io.SEEK_SET)
+    return ObjectReader(source, length or None)
+
+
+class StorageBackend(ABC):
+    """
+    儲存後端介面。
+
+    multipart 相關方法對應 S3 的 CreateMultipartUpload / UploadPart / CompleteMultipartUpload，
+    presigned_url 產生可直接存取物件 (GET) 或上傳分段 (PUT) 的限時網址。
+    所有方法 (local_path 除外) 皆為抽象方法，缺少任何一個的後端在建立實例時即失敗。
+    """
+
+    # 物件是否為本機檔案 (local_path 可用)
+    local_files = False
+
+    @abstractmethod
+    def ensure_bucket(self):
+        ...
+
+    @abstractmethod
+    def put_object(self, object_name: str, data: BinaryIO, size: int, content_type: str):
+        """串流寫入物件；size 為 -1 時表示長度未知"""
+
+    @abstractmethod
+    def get_object(self, object_name: str, offset: int = 0, length: int = 0):
+        """讀取物件 (或區段)，回傳具 read / stream / close / release_conn 的讀取器"""
+
+    def local_path(self, object_name: str) -> Optional[str]:
+        """物件在本機檔案系統上的路徑 (可直接以 sendfile 傳送)；非本機後端回傳 None"""
+        return None
+
+    @abstractmethod
+    def copy_object(self, source: str, target: str, content_type: str):
+        ...
+
+    @abstractmethod
+    def delete_objects(self, object_names: List[str]) -> Dict[str, str]:
+        """刪除物件 (不存在視為成功)，回傳失敗的物件 {object_name: 錯誤訊息}"""
+
+    @abstractmethod
+    def list_objects(self, prefix: Optional[str] = None) -> Iterator[ObjectInfo]:
+        """遞迴列出物件 (不含 multipart 的暫存分段)"""
+
+    @abstractmethod
+    def create_multipart_upload(self, object_name: str, content_type: str) -> str:
+        ...
+
+    @abstractmethod
+    def upload_part(self, object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """上傳單一分段，回傳 ETag"""
+
+    @abstractmethod
+    def complete_multipart_upload(self, object_name: str, upload_id: str, parts: List[Tuple[int, str]]):
+        ...
+
+    @abstractmethod
+    def abort_multipart_upload(self, object_name: str, upload_id: str):
+        ...
+
+    @abstractmethod
+    def list_parts(self, object_name: str, upload_id: str) -> List[Tuple[int, str, int]]:
+        """已上傳的分段 (part_number, etag, size)，依編號排列"""
+
+    @abstractmethod
+    def presigned_url(
+        self, method: str, object_name: str, expires: timedelta,
+        request_date: Optional[datetime] = None, upload_id: Optional[str] = None, part_number: Optional[int] = None
+    ) -> str:
+        ...
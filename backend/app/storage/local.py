@@ -0,0 +1,223 @@
+"""
+本機檔案系統儲存後端 (單機、邊緣部署)
+
+物件以其名稱作為相對路徑存放於根目錄下；寫入先寫到 .tmp/ 再以 os.replace 原子地換上，
+讀取端不會看到寫到一半的檔案。資料以 os.sendfile / os.write 直接在檔案描述子之間搬移，
+不經過 Python 層的緩衝區：
+- 上傳：一般檔案以 sendfile 複製，BytesIO 以 getbuffer() 的 memoryview 直接 os.write；
+  上傳暫存檔 (SpooledTemporaryFile) 以 read() 分塊串流，不強制寫入磁碟
+- 下載：提供 local_path，由 API 以 FileResponse 傳送
+- 伺服器端複製：hard link (物件寫入後不再修改)
+
+multipart 分段存放於 .multipart/{upload_id}/，完成時依序以 sendfile 串接。
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import uuid
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from .base import ObjectInfo, StorageBackend, open_range
+from .signed import SignedUrls
+
+TMP_DIR = ".tmp"
+MULTIPART_DIR = ".multipart"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _write_all(fd: int, data) -> None:
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _sendfile_all(out_fd: int, in_fd: int, offset: int, count: Optional[int]) -> int:
+    """自 in_fd 的 offset 起複製 count 位元組 (None 表示到結尾)，回傳複製的位元組數"""
+    copied = 0
+    while count is None or copied < count:
+        chunk = COPY_CHUNK_SIZE if count is None else min(COPY_CHUNK_SIZE, count - copied)
+        sent = os.sendfile(out_fd, in_fd, offset + copied, chunk)
+        if sent == 0:
+            break
+        copied += sent
+    return copied
+
+
+def _file_descriptor(data: BinaryIO) -> Optional[int]:
+    """
+    可供 sendfile 的檔案描述子。
+
+    SpooledTemporaryFile 的 fileno() 會先將記憶體中的內容寫入磁碟 (rollover)，一律改以 read() 串流。
+    """
+    if isinstance(data, tempfile.SpooledTemporaryFile):
+        return None
+    try:
+        return data.fileno()
+    except (AttributeError, io.UnsupportedOperation):
+        return None
+
+
+class LocalBackend(SignedUrls, StorageBackend):
+    local_files = True
+
+    def __init__(self, root: str, secret: bytes, public_url: str):
+        SignedUrls.__init__(self, secret, public_url)
+        self.root = os.path.abspath(root)
+
+    def _path(self, object_name: str) -> str:
+        parts = object_name.split("/")
+        if any(part in ("", ".", "..") for part in parts) or parts[0].startswith("."):
+            raise ValueError(f"Invalid object name: {object_name}")
+        return os.path.join(self.root, *parts)
+
+    def _temp_file(self) -> Tuple[int, str]:
+        return tempfile.mkstemp(dir=os.path.join(self.root, TMP_DIR))
+
+    def _commit(self, temp_path: str, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+
+    def ensure_bucket(self):
+        os.makedirs(os.path.join(self.root, TMP_DIR), exist_ok=True)
+        os.makedirs(os.path.join(self.root, MULTIPART_DIR), exist_ok=True)
+
+    def put_object(self, object_name: str, data: BinaryIO, size: int, content_type: str):
+        path = self._path(object_name)
+        count = size if size >= 0 else None
+        fd, temp_path = self._temp_file()
+        try:
+            in_fd = _file_descriptor(data)
+            if isinstance(data, io.BytesIO):
+                position = data.tell()
+                with data.getbuffer() as buffer:
+                    end = len(buffer) if count is None else min(len(buffer), position + count)
+                    _write_all(fd, buffer[position:end])
+                data.seek(end)
+            elif in_fd is not None:
+                position = data.tell()
+                data.seek(position + _sendfile_all(fd, in_fd, position, count))
+            else:
+                remaining = count
+                while remaining is None or remaining > 0:
+                    chunk = data.read(COPY_CHUNK_SIZE if remaining is None else min(COPY_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    _write_all(fd, chunk)
+                    if remaining is not None:
+                        remaining -= len(chunk)
+            os.close(fd)
+            fd = None
+            self._commit(temp_path, path)
+        except BaseException:
+            if fd is not None:
+                os.close(fd)
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    def get_object(self, object_name: str, offset: int = 0, length: int = 0):
+        return open_range(open(self._path(object_name), "rb"), offset, length)
+
+    def local_path(self, object_name: str) -> Optional[str]:
+        path = self._path(object_name)
+        return path if os.path.isfile(path) else None
+
+    def copy_object(self, source: str, target: str, content_type: str):
+        source_path, target_path = self._path(source), self._path(target)
+        temp_path = os.path.join(self.root, TMP_DIR, uuid.uuid4().hex)
+        try:
+            os.link(source_path, temp_path)
+        except OSError:
+            # 不支援 hard link 的檔案系統；shutil 在 Linux 上以 sendfile 複製
+            shutil.copyfile(source_path, temp_path)
+        self._commit(temp_path, target_path)
+
+    def delete_objects(self, object_names: List[str]) -> Dict[str, str]:
+        failures = {}
+        for name in object_names:
+            try:
+                os.unlink(self._path(name))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                failures[name] = str(e)
+        return failures
+
+    def list_objects(self, prefix: Optional[str] = None) -> Iterator[ObjectInfo]:
+        prefix = prefix or ""
+        # 從前綴所在的最深目錄開始走訪
+        start = os.path.join(self.root, *prefix.split("/")[:-1])
+        for directory, dirnames, filenames in os.walk(start):
+            if directory == self.root:
+                dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+            relative = os.path.relpath(directory, self.root).replace(os.sep, "/")
+            for filename in filenames:
+                name = filename if relative == "." else f"{relative}/{filename}"
+                if not name.startswith(prefix) or name.startswith("."):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(directory, filename))
+                except FileNotFoundError:
+                    continue
+                yield ObjectInfo(name, stat.st_size, datetime.fromtimestamp(stat.st_mtime, timezone.utc))
+
+    def _upload_dir(self, upload_id: str) -> str:
+        if not upload_id.isalnum():
+            raise ValueError(f"Invalid upload id: {upload_id}")
+        return os.path.join(self.root, MULTIPART_DIR, upload_id)
+
+    def create_multipart_upload(self, object_name: str, content_type: str) -> str:
+        self._path(object_name)
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._upload_dir(upload_id))
+        return upload_id
+
+    def upload_part(self, object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+        """分段檔名為 {part_number}.{etag}，重新上傳同一分段時取代舊檔"""
+        directory = self._upload_dir(upload_id)
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"No such upload: {upload_id}")
+        etag = hashlib.md5(data, usedforsecurity=False).hexdigest()
+        fd, temp_path = self._temp_file()
+        try:
+            _write_all(fd, data)
+        finally:
+            os.close(fd)
+        os.replace(temp_path, os.path.join(directory, f"{part_number:05d}.{etag}"))
+        for name in os.listdir(directory):
+            if name.startswith(f"{part_number:05d}.") and name != f"{part_number:05d}.{etag}":
+                os.unlink(os.path.join(directory, name))
+        return etag
+
+    def complete_multipart_upload(self, object_name: str, upload_id: str, parts: List[Tuple[int, str]]):
+        directory = self._upload_dir(upload_id)
+        fd, temp_path = self._temp_file()
+        try:
+            for part_number, etag in parts:
+                part_path = os.path.join(directory, f"{part_number:05d}.{etag.strip(chr(34))}")
+                with open(part_path, "rb") as part:
+                    _sendfile_all(fd, part.fileno(), 0, None)
+            os.close(fd)
+            fd = None
+            self._commit(temp_path, self._path(object_name))
+        except BaseException:
+            if fd is not None:
+                os.close(fd)
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        shutil.rmtree(directory, ignore_errors=True)
+
+    def abort_multipart_upload(self, object_name: str, upload_id: str):
+        shutil.rmtree(self._upload_dir(upload_id), ignore_errors=True)
+
+    def list_parts(self, object_name: str, upload_id: str) -> List[Tuple[int, str, int]]:
+        directory = self._upload_dir(upload_id)
+        parts = []
+        for name in os.listdir(directory):
+            number, _, etag = name.partition(".")
+            parts.append((int(number), etag, os.path.getsize(os.path.join(directory, name))))
+        return sorted(parts)
@@ -0,0 +1,92 @@
+"""
+記憶體儲存後端 (測試與開發用，不需啟動 MinIO)
+
+物件只存在於目前的行程中，重新啟動或多個 worker 之間不共享。
+"""
+import hashlib
+import io
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from .base import ObjectInfo, StorageBackend, open_range
+from .signed import SignedUrls
+
+
+class MemoryBackend(SignedUrls, StorageBackend):
+
+    def __init__(self, secret: bytes, public_url: str):
+        SignedUrls.__init__(self, secret, public_url)
+        self.objects: Dict[str, Tuple[bytes, datetime]] = {}
+        self.uploads: Dict[str, Dict[int, Tuple[str, bytes]]] = {}
+        self.lock = threading.Lock()
+
+    def _store(self, object_name: str, data: bytes):
+        with self.lock:
+            self.objects[object_name] = (data, datetime.now(timezone.utc))
+
+    def _load(self, object_name: str) -> bytes:
+        with self.lock:
+            if object_name not in self.objects:
+                raise FileNotFoundError(f"No such object: {object_name}")
+            return self.objects[object_name][0]
+
+    def ensure_bucket(self):
+        pass
+
+    def put_object(self, object_name: str, data: BinaryIO, size: int, content_type: str):
+        self._store(object_name, data.read() if size < 0 else data.read(size))
+
+    def get_object(self, object_name: str, offset: int = 0, length: int = 0):
+        return open_range(io.BytesIO(self._load(object_name)), offset, length)
+
+    def copy_object(self, source: str, target: str, content_type: str):
+        self._store(target, self._load(source))
+
+    def delete_objects(self, object_names: List[str]) -> Dict[str, str]:
+        with self.lock:
+            for name in object_names:
+                self.objects.pop(name, None)
+        return {}
+
+    def list_objects(self, prefix: Optional[str] = None) -> Iterator[ObjectInfo]:
+        with self.lock:
+            items = sorted(self.objects.items())
+        for name, (data, modified) in items:
+            if name.startswith(prefix or ""):
+                yield ObjectInfo(name, len(data), modified)
+
+    def create_multipart_upload(self, object_name: str, content_type: str) -> str:
+        upload_id = uuid.uuid4().hex
+        with self.lock:
+            self.uploads[upload_id] = {}
+        return upload_id
+
+    def upload_part(self, object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+        etag = hashlib.md5(data, usedforsecurity=False).hexdigest()
+        with self.lock:
+            if upload_id not in self.uploads:
+                raise FileNotFoundError(f"No such upload: {upload_id}")
+            self.uploads[upload_id][part_number] = (etag, bytes(data))
+        return etag
+
+    def complete_multipart_upload(self, object_name: str, upload_id: str, parts: List[Tuple[int, str]]):
+        with self.lock:
+            uploaded = self.uploads[upload_id]
+            chunks = []
+            for part_number, etag in parts:
+                stored_etag, data = uploaded[part_number]
+                if stored_etag != etag.strip('"'):
+                    raise ValueError(f"ETag mismatch for part {part_number}")
+                chunks.append(data)
+            del self.uploads[upload_id]
+        self._store(object_name, b"".join(chunks))
+
+    def abort_multipart_upload(self, object_name: str, upload_id: str):
+        with self.lock:
+            self.uploads.pop(upload_id, None)
+
+    def list_parts(self, object_name: str, upload_id: str) -> List[Tuple[int, str, int]]:
+        with self.lock:
+            uploaded = self.uploads[upload_id]
+            return sorted((number, etag, len(data)) for number, (etag, data) in uploaded.items())
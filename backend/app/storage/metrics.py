@@ -0,0 +1,76 @@
+"""
+儲存傳輸統計 (每個 worker 行程各自累計，重新啟動後歸零)
+
+每種操作記錄次數、失敗數、傳輸位元組數與累計耗時；MinIO 後端另外記錄連線池的
+新建連線數、連線池已滿而丟棄的連線數與重試次數，用來調整 MINIO_POOL_SIZE 等設定：
+- 新建連線數持續增加、或有丟棄的連線：連線池小於同時傳輸數，連線無法重複使用
+- 重試次數增加：儲存服務有暫時性錯誤 (5xx、連線中斷)
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class TransferMetrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.operations = defaultdict(lambda: {"count": 0, "errors": 0, "bytes": 0, "seconds": 0.0})
+            self.counters = defaultdict(int)
+            self.started_at = time.time()
+
+    @contextmanager
+    def track(self, operation: str, size: int = 0):
+        """記錄一次操作的耗時；成功時計入 size 位元組 (事先不知道時，呼叫端可設定 yield 的 op["bytes"])"""
+        op = {"bytes": size}
+        start = time.perf_counter()
+        failed = True
+        try:
+            yield op
+            failed = False
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                stats = self.operations[operation]
+                stats["count"] += 1
+                stats["seconds"] += elapsed
+                if failed:
+                    stats["errors"] += 1
+                else:
+                    stats["bytes"] += op["bytes"]
+
+    def add_bytes(self, operation: str, size: int, seconds: float = 0.0):
+        """串流讀取的位元組數與耗時 (不增加操作次數)"""
+        with self.lock:
+            stats = self.operations[operation]
+            stats["bytes"] += size
+            stats["seconds"] += seconds
+
+    def incr(self, name: str, amount: int = 1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            operations = {}
+            for name, stats in sorted(self.operations.items()):
+                seconds = stats["seconds"]
+                operations[name] = {
+                    **stats,
+                    "seconds": round(seconds, 3),
+                    "avg_ms": round(seconds * 1000 / stats["count"], 2) if stats["count"] else None,
+                    "mb_per_s": round(stats["bytes"] / seconds / 1e6, 1) if stats["bytes"] and seconds else None,
+                }
+            return {
+                "uptime_seconds": round(time.time() - self.started_at, 1),
+                "operations": operations,
+                **dict(self.counters),
+            }
+
+
+transfer_metrics = TransferMetrics()
@@ -0,0 +1,253 @@
+"""
+MinIO / S3 相容儲存後端
+
+minio 預設的 urllib3 連線池只保留 10 條連線、逾時 5 分鐘；同時傳輸數超過連線池大小時，
+多出的連線用完即關閉，每次請求都要重新建立 TCP 連線。此處改用 create_pool_manager
+建立的連線池 (大小配合儲存執行緒數)，並記錄新建連線、丟棄連線與重試次數 (見 metrics.py)。
+"""
+import inspect
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+import certifi
+import urllib3
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util import Retry, Timeout
+import minio
+from minio import Minio
+from minio.commonconfig import ComposeSource
+from minio.datatypes import Part
+from minio.deleteobjects import DeleteObject
+from .base import ObjectInfo, StorageBackend
+from .metrics import transfer_metrics
+
+# S3 DeleteObjects 每次請求最多 1000 個物件
+DELETE_BATCH_SIZE = 1000
+
+# 暫時性錯誤：重試時以指數退避等待 (backoff x 2^n 秒)
+RETRY_STATUS_CODES = [500, 502, 503, 504]
+
+# TCP keep-alive：閒置連線定期探測，及早發現被中斷的連線，避免傳輸卡住直到讀取逾時
+KEEPALIVE_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+for _name, _value in (("TCP_KEEPIDLE", 60), ("TCP_KEEPINTVL", 10), ("TCP_KEEPCNT", 5)):
+    if hasattr(socket, _name):
+        KEEPALIVE_SOCKET_OPTIONS.append((socket.IPPROTO_TCP, getattr(socket, _name), _value))
+
+
+class CountingRetry(Retry):
+    """每次重試 (含連線錯誤與 5xx 回應) 計入 metrics"""
+
+    def increment(self, *args, **kwargs):
+        transfer_metrics.incr("retries")
+        return super().increment(*args, **kwargs)
+
+
+class _CountingPool:
+    """記錄新建連線數，以及連線池已滿、用完即關閉的連線數"""
+
+    def _new_conn(self):
+        transfer_metrics.incr("connections_opened")
+        return super()._new_conn()
+
+    def _put_conn(self, conn):
+        if conn is not None and self.pool is not None and self.pool.full():
+            transfer_metrics.incr("connections_discarded")
+        super()._put_conn(conn)
+
+
+class CountingHTTPConnectionPool(_CountingPool, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(_CountingPool, HTTPSConnectionPool):
+    pass
+
+
+def create_pool_manager(
+    pool_size: int, connect_timeout: float, read_timeout: float,
+    max_retries: int, retry_backoff: float, cert_check: bool = True
+) -> urllib3.PoolManager:
+    """
+    MinIO 用的 urllib3 連線池。
+
+    pool_size 為每個主機保留的連線數，應不小於同時進行的儲存操作數；
+    超過時仍會建立新連線 (不阻塞)，但用完即關閉。
+    """
+    manager = urllib3.PoolManager(
+        maxsize=pool_size,
+        block=False,
+        timeout=Timeout(connect=connect_timeout, read=read_timeout),
+        retries=CountingRetry(
+            total=max_retries, backoff_factor=retry_backoff, status_forcelist=RETRY_STATUS_CODES
+        ),
+        socket_options=HTTPConnection.default_socket_options + KEEPALIVE_SOCKET_OPTIONS,
+        cert_reqs="CERT_REQUIRED" if cert_check else "CERT_NONE",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+    )
+    manager.pool_classes_by_scheme = {"http": CountingHTTPConnectionPool, "https": CountingHTTPSConnectionPool}
+    return manager
+
+
+# 可續傳上傳使用的 minio 私有方法及其參數 (以關鍵字傳入)
+MULTIPART_API = {
+    "_create_multipart_upload": ("bucket_name", "object_name", "headers"),
+    "_upload_part": ("bucket_name", "object_name", "data", "headers", "upload_id", "part_number"),
+    "_complete_multipart_upload": ("bucket_name", "object_name", "upload_id", "parts"),
+    "_abort_multipart_upload": ("bucket_name", "object_name", "upload_id"),
+    "_list_parts": ("bucket_name", "object_name", "upload_id", "part_number_marker"),
+}
+
+
+def check_multipart_api(client_class=Minio):
+    """確認 minio 仍提供 MULTIPART_API 中的方法與參數；不符時 (例如升級 minio 後) 拋出 RuntimeError"""
+    problems = []
+    for name, params in MULTIPART_API.items():
+        method = getattr(client_class, name, None)
+        if method is None:
+            problems.append(f"{name} is missing")
+            continue
+        missing = [param for param in params if param not in inspect.signature(method).parameters]
+        if missing:
+            problems.append(f"{name} has no parameter {', '.join(missing)}")
+    if problems:
+        raise RuntimeError(f"Unsupported minio version {minio.__version__}: {'; '.join(problems)}")
+
+
+class MinioMultipart:
+    """
+    逐段的 multipart upload 操作 (可續傳上傳)。
+
+    minio 未公開分段上傳的個別 API (put_object 內部使用)，私有方法只在此類別中呼叫；
+    requirements.txt 將 minio 限制在已測試的版本，建立時以 check_multipart_api 檢查，
+    不相容時在啟動時失敗，而不是在上傳途中出錯。
+    """
+
+    def __init__(self, client: Minio, bucket: str):
+        check_multipart_api(type(client))
+        self.client = client
+        self.bucket = bucket
+
+    def create(self, object_name: str, content_type: str) -> str:
+        return self.client._create_multipart_upload(
+            bucket_name=self.bucket, object_name=object_name,
+            headers={"Content-Type": content_type or "application/octet-stream"}
+        )
+
+    def upload_part(self, object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+        return self.client._upload_part(
+            bucket_name=self.bucket, object_name=object_name, data=data, headers=None,
+            upload_id=upload_id, part_number=part_number
+        )
+
+    def complete(self, object_name: str, upload_id: str, parts: List[Tuple[int, str]]):
+        self.client._complete_multipart_upload(
+            bucket_name=self.bucket, object_name=object_name, upload_id=upload_id,
+            parts=[Part(number, etag) for number, etag in parts]
+        )
+
+    def abort(self, object_name: str, upload_id: str):
+        self.client._abort_multipart_upload(bucket_name=self.bucket, object_name=object_name, upload_id=upload_id)
+
+    def list_parts(self, object_name: str, upload_id: str) -> List[Tuple[int, str, int]]:
+        """(分段編號, ETag, 大小)，依序走訪所有頁"""
+        parts, marker = [], None
+        while True:
+            result = self.client._list_parts(
+                bucket_name=self.bucket, object_name=object_name, upload_id=upload_id, part_number_marker=marker
+            )
+            parts.extend((part.part_number, part.etag, part.size or 0) for part in result.parts)
+            if not result.is_truncated:
+                return parts
+            marker = result.next_part_number_marker
+
+
+class S3Backend(StorageBackend):
+
+    def __init__(
+        self, endpoint: str, access_key: str, secret_key: str, bucket: str,
+        part_size: int, delete_concurrency: int, secure: bool = False,
+        parallel_uploads: int = 3, http_client: Optional[urllib3.PoolManager] = None
+    ):
+        self.client = Minio(
+            endpoint, access_key=access_key, secret_key=secret_key, secure=secure, http_client=http_client
+        )
+        self.bucket = bucket
+        self.multipart = MinioMultipart(self.client, bucket)
+        self.part_size = part_size
+        self.parallel_uploads = parallel_uploads
+        self.delete_concurrency = delete_concurrency
+
+    def ensure_bucket(self):
+        if not self.client.bucket_exists(self.bucket):
+            self.client.make_bucket(self.bucket)
+
+    def put_object(self, object_name: str, data: BinaryIO, size: int, content_type: str):
+        self.client.put_object(
+            self.bucket, object_name, data, length=size,
+            content_type=content_type, part_size=self.part_size,
+            num_parallel_uploads=self.parallel_uploads
+        )
+
+    def get_object(self, object_name: str, offset: int = 0, length: int = 0):
+        """Range 請求只讀取指定區段；回傳 urllib3 回應"""
+        return self.client.get_object(self.bucket, object_name, offset=offset, length=length)
+
+    def copy_object(self, source: str, target: str, content_type: str):
+        """伺服器端複製，資料不經過 API；超過 5 GB 時自動改用分段複製"""
+        self.client.compose_object(
+            self.bucket, target, [ComposeSource(self.bucket, source)],
+            metadata={"Content-Type": content_type or "application/octet-stream"}
+        )
+
+    def _delete_batch(self, object_names: List[str]) -> Dict[str, str]:
+        failures = {}
+        try:
+            # remove_objects 為延遲執行，需走訪回傳的錯誤才會實際送出請求
+            for error in self.client.remove_objects(self.bucket, (DeleteObject(name) for name in object_names)):
+                failures[error.name] = f"{error.code}: {error.message}"
+        except Exception as e:
+            failures.update({name: str(e) for name in object_names})
+        return failures
+
+    def delete_objects(self, object_names: List[str]) -> Dict[str, str]:
+        """以 DeleteObjects 批次刪除，最多同時送出 delete_concurrency 個批次"""
+        batches = [object_names[i:i + DELETE_BATCH_SIZE] for i in range(0, len(object_names), DELETE_BATCH_SIZE)]
+        if not batches:
+            return {}
+        failures = {}
+        with ThreadPoolExecutor(max_workers=min(self.delete_concurrency, len(batches))) as pool:
+            for batch_failures in pool.map(self._delete_batch, batches):
+                failures.update(batch_failures)
+        return failures
+
+    def list_objects(self, prefix: Optional[str] = None) -> Iterator[ObjectInfo]:
+        for obj in self.client.list_objects(self.bucket, prefix=prefix, recursive=True):
+            yield ObjectInfo(obj.object_name, obj.size or 0, obj.last_modified, obj.is_dir)
+
+    def create_multipart_upload(self, object_name: str, content_type: str) -> str:
+        return self.multipart.create(object_name, content_type)
+
+    def upload_part(self, object_name: str, upload_id: str, part_number: int, data: bytes) -> str:
+        return self.multipart.upload_part(object_name, upload_id, part_number, data)
+
+    def complete_multipart_upload(self, object_name: str, upload_id: str, parts: List[Tuple[int, str]]):
+        self.multipart.complete(object_name, upload_id, parts)
+
+    def abort_multipart_upload(self, object_name: str, upload_id: str):
+        self.multipart.abort(object_name, upload_id)
+
+    def list_parts(self, object_name: str, upload_id: str) -> List[Tuple[int, str, int]]:
+        return self.multipart.list_parts(object_name, upload_id)
+
+    def presigned_url(
+        self, method: str, object_name: str, expires: timedelta,
+        request_date: Optional[datetime] = None, upload_id: Optional[str] = None, part_number: Optional[int] = None
+    ) -> str:
+        extra = {"partNumber": str(part_number), "uploadId": upload_id} if upload_id else None
+        return self.client.get_presigned_url(
+            method, self.bucket, object_name, expires=expires,
+            request_date=request_date, extra_query_params=extra
+        )
@@ -0,0 +1,49 @@
+"""
+由 API 自行提供的限時網址 (本機與記憶體後端沒有 S3 的預簽名網址)
+
+網址指向 GET/PUT /objects/{object_name}，以 HMAC-SHA256 簽署方法、物件名稱、到期時間
+與分段參數；簽名時間相同時產生相同的網址 (分享網址的時間窗對齊依賴此特性)。
+"""
+import hashlib
+import hmac
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import quote, urlencode
+
+
+class SignedUrls:
+
+    def __init__(self, secret: bytes, public_url: str):
+        self.secret = secret
+        self.public_url = public_url.rstrip("/")
+
+    def _signature(self, method: str, object_name: str, expires_at: int, upload_id: str, part_number: str) -> str:
+        message = "\n".join((method, object_name, str(expires_at), upload_id, part_number))
+        return hmac.new(self.secret, message.encode(), hashlib.sha256).hexdigest()
+
+    def presigned_url(
+        self, method: str, object_name: str, expires: timedelta,
+        request_date: Optional[datetime] = None, upload_id: Optional[str] = None, part_number: Optional[int] = None
+    ) -> str:
+        signed_at = request_date.timestamp() if request_date else time.time()
+        expires_at = int(signed_at + expires.total_seconds())
+        params = {"expires": expires_at}
+        if upload_id:
+            params.update(uploadId=upload_id, partNumber=part_number)
+        params["signature"] = self._signature(
+            method, object_name, expires_at, upload_id or "", str(part_number) if upload_id else ""
+        )
+        return f"{self.public_url}/objects/{quote(object_name)}?{urlencode(params)}"
+
+    def verify_url(
+        self, method: str, object_name: str, expires_at: int, signature: str,
+        upload_id: Optional[str] = None, part_number: Optional[int] = None
+    ) -> bool:
+        """簽名正確且未過期"""
+        if expires_at < time.time():
+            return False
+        expected = self._signature(
+            method, object_name, expires_at, upload_id or "", str(part_number) if upload_id else ""
+        )
+        return hmac.compare_digest(expected, signature)
@@ -1,45 +1,187 @@
 """
 DMS 工具函數
 """
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+import base64
 import hashlib
+import json
+import os
 
-# 當檔案大於此閾值時，使用快速 SHA1 計算
-LARGE_FILE_THRESHOLD = 10 * 1024 * 1024  # 10 MB
-CHUNK_SIZE = 1 * 1024 * 1024  # 1 MB
+# 新上傳檔案使用的雜湊演算法 (完整內容計算)
+HASH_ALGORITHM = os.getenv("HASH_ALGORITHM", "sha1")
+SUPPORTED_HASH_ALGORITHMS = ("sha1", "sha256", "blake2b")
 
+# 舊版 calculate_sha1 對大於 10MB 的檔案只取樣前/中/後各 1MB，
+# 這類雜湊以此標記區分，無法與完整內容雜湊比對，需重新計算後才能升級
+SAMPLED_HASH_ALGORITHM = "sha1-sampled"
 
-def calculate_sha1(content: bytes, size: int) -> str:
+# 串流讀取檔案計算雜湊時的區塊大小
+HASH_CHUNK_SIZE = 1 * 1024 * 1024  # 1 MB
+
+
+def new_hasher(algorithm: str = HASH_ALGORITHM):
+    """建立指定演算法的 hashlib 物件"""
+    if algorithm not in SUPPORTED_HASH_ALGORITHMS:
+        raise ValueError(f"Unsupported hash algorithm: {algorithm}")
+    return hashlib.new(algorithm)
+
+
+class HashingReader:
+    """
+    包裝檔案物件，於每次 read() 時同步更新雜湊並累計已讀取的位元組數。
+
+    讓上傳能以固定大小的區塊串流至 MinIO，同時計算完整內容的雜湊，
+    不需將整個檔案載入記憶體，也不需額外讀取一次檔案。
+    """
+
+    def __init__(self, fileobj, algorithm: str = HASH_ALGORITHM):
+        self._fileobj = fileobj
+        self._hasher = new_hasher(algorithm)
+        self.algorithm = algorithm
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._fileobj.read(size)
+        if chunk:
+            self._hasher.update(chunk)
+            self.size += len(chunk)
+        return chunk
+
+    def hexdigest(self) -> str:
+        return self._hasher.hexdigest()
+
+
+def hash_stream(fileobj, algorithm: str = HASH_ALGORITHM) -> tuple:
     """
-    計算檔案 SHA1。
-    
-    - 小檔案 (<=10MB)：完整內容計算
-    - 大檔案 (>10MB)：取前/中/後各 1MB 計算，避免長時間運算
-    
-    Args:
-        content: 檔案內容
-        size: 檔案大小 (bytes)
-        
+    以固定區塊讀取檔案物件計算完整內容雜湊，完成後將讀取位置移回開頭。
+
     Returns:
-        SHA1 雜湊值 (hex string, 40 characters)
-    """
-    if size <= LARGE_FILE_THRESHOLD:
-        # 小檔案：完整計算
-        return hashlib.sha1(content).hexdigest()
-    
-    # 大檔案：取樣計算 (前/中/後各 1MB)
-    hasher = hashlib.sha1()
-    
-    # 前 1MB
-    hasher.update(content[:CHUNK_SIZE])
-    
-    # 中間 1MB
-    mid_start = (size // 2) - (CHUNK_SIZE // 2)
-    hasher.update(content[mid_start:mid_start + CHUNK_SIZE])
-    
-    # 後 1MB
-    hasher.update(content[-CHUNK_SIZE:])
-    
-    # 加入檔案大小作為額外熵，降低碰撞機率
-    hasher.update(str(size).encode())
-    
-    return hasher.hexdigest()
+        (雜湊值 hex string, 檔案大小 bytes)
+    """
+    reader = HashingReader(fileobj, algorithm)
+    while reader.read(HASH_CHUNK_SIZE):
+        pass
+    fileobj.seek(0)
+    return reader.hexdigest(), reader.size
+
+
+def detect_category(mime: Optional[str]) -> str:
+    """依 MIME 類型決定檔案分類"""
+    mime = mime or ""
+    if mime.startswith("image/"):
+        return "image"
+    elif mime.startswith("video/"):
+        return "video"
+    elif mime.startswith("audio/"):
+        return "audio"
+    elif mime.startswith("text/") or "pdf" in mime or "msword" in mime or "officedocument" in mime:
+        return "document"
+    elif "zip" in mime or "tar" in mime or "7z" in mime:
+        return "archive"
+    return "other"
+
+
+def get_stream_size(fileobj) -> int:
+    """取得可 seek 之檔案物件的大小，並將讀取位置移回開頭"""
+    fileobj.seek(0, 2)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    return size
+
+
+def parse_byte_range(range_header: str, size: int):
+    """
+    解析 HTTP Range 標頭 (僅支援單一 bytes 範圍)。
+
+    Returns:
+        (start, end) 含首尾的位元組位置；格式不支援或多段範圍時回傳 None (回傳完整內容)
+
+    Raises:
+        ValueError: 範圍無法滿足 (應回傳 416)
+    """
+    unit, _, spec = range_header.partition("=")
+    start_text, sep, end_text = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or "," in spec or not sep:
+        return None
+    if not (start_text.isdigit() or start_text == "") or not (end_text.isdigit() or end_text == ""):
+        return None
+
+    if start_text == "":
+        # bytes=-N: 最後 N 個位元組
+        if not end_text:
+            return None
+        if int(end_text) == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - int(end_text), 0), size - 1
+
+    start = int(start_text)
+    if end_text and int(end_text) < start:
+        return None
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    end = int(end_text) if end_text else size - 1
+    return start, min(end, size - 1)
+
+
+def etag_matches(header: str, etag: str, weak: bool = True) -> bool:
+    """
+    比對 If-None-Match / If-Range 標頭中的 ETag 清單。
+
+    weak=True 為弱比對 (忽略 W/ 前綴，用於 If-None-Match)；
+    weak=False 為強比對 (弱 ETag 一律不符，用於 If-Range)。
+    """
+    if header.strip() == "*":
+        return True
+    if not weak and etag.startswith("W/"):
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if weak:
+            if candidate.removeprefix("W/") == etag.removeprefix("W/"):
+                return True
+        elif candidate == etag:
+            return True
+    return False
+
+
+def http_date(value: datetime) -> str:
+    """將 UTC datetime (可為 naive) 格式化為 HTTP 日期標頭"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def parse_http_date(value: str) -> Optional[datetime]:
+    """解析 HTTP 日期標頭，回傳 naive UTC datetime；格式錯誤時回傳 None"""
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def encode_cursor(*values) -> str:
+    """將分頁游標的排序鍵編碼為不透明字串"""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """
+    解碼 encode_cursor 產生的游標 (size 為排序鍵的個數)。
+
+    Raises:
+        ValueError: 游標格式錯誤 (無法解碼，或不是 size 個值的陣列)
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError("Invalid cursor")
+    return values
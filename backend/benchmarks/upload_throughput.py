@@ -0,0 +1,75 @@
+"""
+上傳吞吐量基準測試
+
+透過 POST /upload 上傳大量內容互不相同的小檔案，統計每秒上傳數。
+前半為新檔案 (建立檔案記錄 + 第一個版本)，後半以相同檔名上傳新內容 (建立新版本)。
+需可連線的 MinIO (或 S3 相容服務)，並使用獨立的資料庫。
+
+使用方式：
+    DATABASE_URL=sqlite:///./bench_upload.db python -m benchmarks.upload_throughput --uploads 500
+    DATABASE_URL=sqlite:///./bench_upload.db python -m benchmarks.upload_throughput --uploads 500 --threads 4
+
+注意：會清空 DATABASE_URL 指向的資料庫中的 DMS 資料表，請勿指向正式資料庫！
+"""
+
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.database import Base, engine
+from app.main import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DMS 上傳吞吐量基準測試")
+    parser.add_argument("--uploads", type=int, default=500, help="上傳次數")
+    parser.add_argument("--size", type=int, default=4096, help="每個檔案的大小 (bytes)")
+    parser.add_argument("--threads", type=int, default=1, help="同時上傳的執行緒數")
+    args = parser.parse_args()
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    stats = {"statements": 0, "commits": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_statement(*_):
+        stats["statements"] += 1
+
+    @event.listens_for(engine, "commit")
+    def count_commit(*_):
+        stats["commits"] += 1
+
+    half = args.uploads // 2
+    padding = os.urandom(max(args.size - 32, 0))
+
+    with TestClient(app) as client:
+        def upload(i: int):
+            # 後半以相同檔名上傳，建立第二個版本
+            name = f"bench-{i % half if half else i}.bin"
+            content = uuid.uuid4().hex.encode() + padding
+            response = client.post("/upload", files={"file": (name, content, "application/octet-stream")})
+            return response.status_code
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as pool:
+            codes = list(pool.map(upload, range(args.uploads)))
+        elapsed = time.perf_counter() - start
+
+    ok = codes.count(200)
+    print(f"uploads: {ok}/{args.uploads} ok, size: {args.size} bytes, threads: {args.threads}")
+    print(f"statements/upload: {stats['statements'] / args.uploads:.1f}, commits/upload: {stats['commits'] / args.uploads:.1f}")
+    print(f"elapsed: {elapsed:.2f}s, throughput: {ok / elapsed:.1f} uploads/s")
+
+
+if __name__ == "__main__":
+    main()
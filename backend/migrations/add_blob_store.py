@@ -0,0 +1,191 @@
+"""
+資料庫遷移腳本：內容定址 Blob 儲存
+
+此腳本將：
+1. 建立 blobs 表 (內容雜湊 -> MinIO 物件，含引用計數)
+2. 重建 file_versions 表，移除 object_name 的唯一限制 (相同內容的版本共用物件)
+3. 為既有的每個 MinIO 物件建立 Blob 記錄
+
+既有物件保留原本的 uuid 名稱；取樣雜湊 (sha1-sampled) 無法用於內容比對，
+其 content_hash 設為 NULL，不會被新上傳重複使用。
+
+使用方式：
+    python -m migrations.add_blob_store --check
+    python -m migrations.add_blob_store --migrate
+
+注意：請先執行 add_hash_algorithm 遷移，並備份資料庫！
+"""
+
+import sqlite3
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_PATH = "./dms.db"
+
+
+def migrate():
+    """執行遷移"""
+
+    if not os.path.exists(DATABASE_PATH):
+        print(f"[錯誤] 資料庫不存在: {DATABASE_PATH}")
+        print("如果是全新安裝，請直接啟動應用程式，SQLAlchemy 會自動建立新結構。")
+        return False
+
+    # 備份資料庫
+    backup_path = DATABASE_PATH + ".backup"
+    print(f"[1/4] 備份資料庫到 {backup_path}...")
+    import shutil
+    shutil.copy(DATABASE_PATH, backup_path)
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='blobs'")
+        if cursor.fetchone():
+            print("[資訊] blobs 表已存在，跳過遷移。")
+            return True
+
+        cursor.execute("PRAGMA table_info(file_versions)")
+        if 'hash_algorithm' not in [row[1] for row in cursor.fetchall()]:
+            print("[錯誤] 請先執行 python -m migrations.add_hash_algorithm --migrate")
+            return False
+
+        print("[2/4] 建立 blobs 表...")
+        cursor.execute("""
+            CREATE TABLE blobs (
+                id INTEGER PRIMARY KEY,
+                hash_algorithm VARCHAR(16) NOT NULL,
+                content_hash VARCHAR(128),
+                bucket_name VARCHAR,
+                object_name VARCHAR NOT NULL UNIQUE,
+                size INTEGER,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                created_at DATETIME,
+                CONSTRAINT uq_blobs_hash UNIQUE (hash_algorithm, content_hash)
+            )
+        """)
+        cursor.execute("CREATE INDEX ix_blobs_id ON blobs(id)")
+
+        print("[3/4] 重建 file_versions 表 (移除 object_name 唯一限制)...")
+        cursor.execute("""
+            CREATE TABLE file_versions_new (
+                id INTEGER PRIMARY KEY,
+                file_id INTEGER NOT NULL,
+                version_number INTEGER DEFAULT 1,
+                sha1_hash VARCHAR(128),
+                hash_algorithm VARCHAR(16),
+                size INTEGER,
+                content_type VARCHAR,
+                bucket_name VARCHAR,
+                object_name VARCHAR,
+                uploaded_at DATETIME,
+                FOREIGN KEY (file_id) REFERENCES file_records(id)
+            )
+        """)
+        cursor.execute("""
+            INSERT INTO file_versions_new
+            (id, file_id, version_number, sha1_hash, hash_algorithm, size, content_type, bucket_name, object_name, uploaded_at)
+            SELECT id, file_id, version_number, sha1_hash, hash_algorithm, size, content_type, bucket_name, object_name, uploaded_at
+            FROM file_versions
+        """)
+        cursor.execute("DROP TABLE file_versions")
+        cursor.execute("ALTER TABLE file_versions_new RENAME TO file_versions")
+        cursor.execute("CREATE INDEX ix_file_versions_id ON file_versions(id)")
+        cursor.execute("CREATE INDEX ix_file_versions_sha1_hash ON file_versions(sha1_hash)")
+        cursor.execute("CREATE INDEX ix_file_versions_file_id ON file_versions(file_id)")
+        cursor.execute("CREATE INDEX ix_file_versions_object_name ON file_versions(object_name)")
+
+        print("[4/4] 為既有物件建立 Blob 記錄...")
+        cursor.execute("""
+            SELECT object_name, MIN(bucket_name) AS bucket_name, MIN(size) AS size,
+                   MIN(hash_algorithm) AS hash_algorithm, MIN(sha1_hash) AS sha1_hash,
+                   MIN(uploaded_at) AS uploaded_at, COUNT(*) AS ref_count
+            FROM file_versions
+            WHERE object_name IS NOT NULL
+            GROUP BY object_name
+        """)
+        seen_hashes = set()
+        blob_data = []
+        for row in cursor.fetchall():
+            content_hash = None
+            key = (row['hash_algorithm'], row['sha1_hash'])
+            # 只有完整內容雜湊可作為內容定址的鍵，且每個雜湊只能對應一個物件
+            if row['hash_algorithm'] != 'sha1-sampled' and key not in seen_hashes:
+                content_hash = row['sha1_hash']
+                seen_hashes.add(key)
+            blob_data.append((
+                row['hash_algorithm'] or 'sha1-sampled',
+                content_hash,
+                row['bucket_name'],
+                row['object_name'],
+                row['size'],
+                row['ref_count'],
+                row['uploaded_at']
+            ))
+
+        cursor.executemany("""
+            INSERT INTO blobs
+            (hash_algorithm, content_hash, bucket_name, object_name, size, ref_count, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, blob_data)
+
+        conn.commit()
+        print("\n[成功] 遷移完成！")
+        print(f"  - 建立了 {len(blob_data)} 筆 Blob 記錄")
+        print(f"\n備份檔案保存於: {backup_path}")
+
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"\n[錯誤] 遷移失敗: {e}")
+        print("資料庫已回滾，請檢查錯誤後重試。")
+        return False
+
+    finally:
+        conn.close()
+
+
+def check_migration_status():
+    """檢查遷移狀態"""
+    if not os.path.exists(DATABASE_PATH):
+        print(f"資料庫不存在: {DATABASE_PATH}")
+        return
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='blobs'")
+    has_blobs = cursor.fetchone() is not None
+
+    conn.close()
+
+    print("=== 遷移狀態 ===")
+    print(f"blobs 表: {'✓ 存在' if has_blobs else '✗ 不存在'}")
+
+    if has_blobs:
+        print("\n狀態: 已完成遷移")
+    else:
+        print("\n狀態: 需要執行遷移")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 資料庫遷移工具 - Blob 儲存")
+    parser.add_argument("--check", action="store_true", help="檢查遷移狀態")
+    parser.add_argument("--migrate", action="store_true", help="執行遷移")
+
+    args = parser.parse_args()
+
+    if args.check:
+        check_migration_status()
+    elif args.migrate:
+        migrate()
+    else:
+        parser.print_help()
@@ -0,0 +1,101 @@
+"""
+資料庫遷移腳本：直接上傳 (預簽名網址)
+
+此腳本將：
+1. 在 upload_sessions 表新增 direct 欄位 (客戶端以預簽名網址直接上傳至 MinIO)
+2. 在 upload_sessions 表新增 expected_hash 欄位 (客戶端宣告的內容雜湊)
+
+需先執行 add_upload_sessions 遷移。
+
+使用方式：
+    python -m migrations.add_direct_uploads --check
+    python -m migrations.add_direct_uploads --migrate
+"""
+
+import sqlite3
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_PATH = "./dms.db"
+COLUMNS = {
+    "direct": "BOOLEAN NOT NULL DEFAULT 0",
+    "expected_hash": "VARCHAR(128)",
+}
+
+
+def get_columns(cursor):
+    cursor.execute("PRAGMA table_info(upload_sessions)")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def migrate():
+    """執行遷移"""
+
+    if not os.path.exists(DATABASE_PATH):
+        print(f"[錯誤] 資料庫不存在: {DATABASE_PATH}")
+        print("如果是全新安裝，請直接啟動應用程式，SQLAlchemy 會自動建立新結構。")
+        return False
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        columns = get_columns(cursor)
+        if not columns:
+            print("[錯誤] upload_sessions 表不存在，請先執行 add_upload_sessions 遷移")
+            return False
+
+        for i, (name, definition) in enumerate(COLUMNS.items(), start=1):
+            print(f"[{i}/{len(COLUMNS)}] 新增 {name} 欄位...")
+            if name in columns:
+                print(f"[資訊] {name} 欄位已存在，跳過。")
+                continue
+            cursor.execute(f"ALTER TABLE upload_sessions ADD COLUMN {name} {definition}")
+
+        conn.commit()
+        print("\n[成功] 遷移完成！")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"\n[錯誤] 遷移失敗: {e}")
+        return False
+
+    finally:
+        conn.close()
+
+
+def check_migration_status():
+    """檢查遷移狀態"""
+    if not os.path.exists(DATABASE_PATH):
+        print(f"資料庫不存在: {DATABASE_PATH}")
+        return
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    columns = get_columns(conn.cursor())
+    conn.close()
+
+    print("=== 遷移狀態 ===")
+    for name in COLUMNS:
+        print(f"upload_sessions.{name} 欄位: {'✓ 存在' if name in columns else '✗ 不存在'}")
+    print("\n狀態: " + ("已完成遷移" if all(name in columns for name in COLUMNS) else "需要執行遷移"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 資料庫遷移工具 - 直接上傳")
+    parser.add_argument("--check", action="store_true", help="檢查遷移狀態")
+    parser.add_argument("--migrate", action="store_true", help="執行遷移")
+
+    args = parser.parse_args()
+
+    if args.check:
+        check_migration_status()
+    elif args.migrate:
+        migrate()
+    else:
+        parser.print_help()
@@ -0,0 +1,126 @@
+"""
+資料庫遷移腳本：資料夾子樹統計
+
+此腳本將：
+1. 在 folders 表新增 total_file_count / total_version_count / total_bytes 欄位
+2. 依現有資料回填每個資料夾子樹 (含所有子資料夾) 的檔案數、版本數與總大小
+
+(之後可用 python -m app.counters --rebuild 重建)
+
+使用方式：
+    python -m migrations.add_folder_totals --check
+    python -m migrations.add_folder_totals --migrate
+"""
+
+import sqlite3
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_PATH = "./dms.db"
+COLUMNS = {
+    "total_file_count": "BIGINT NOT NULL DEFAULT 0",
+    "total_version_count": "BIGINT NOT NULL DEFAULT 0",
+    "total_bytes": "BIGINT NOT NULL DEFAULT 0",
+}
+
+
+def get_columns(cursor):
+    cursor.execute("PRAGMA table_info(folders)")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def migrate():
+    """執行遷移"""
+
+    if not os.path.exists(DATABASE_PATH):
+        print(f"[錯誤] 資料庫不存在: {DATABASE_PATH}")
+        print("如果是全新安裝，請直接啟動應用程式，SQLAlchemy 會自動建立新結構。")
+        return False
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        columns = get_columns(cursor)
+        for i, (name, definition) in enumerate(COLUMNS.items(), start=1):
+            print(f"[{i}/{len(COLUMNS) + 1}] 新增 {name} 欄位...")
+            if name in columns:
+                print(f"[資訊] {name} 欄位已存在，跳過。")
+                continue
+            cursor.execute(f"ALTER TABLE folders ADD COLUMN {name} {definition}")
+
+        print(f"[{len(COLUMNS) + 1}/{len(COLUMNS) + 1}] 回填子樹統計...")
+        # closure: 每個資料夾與其子樹中的所有資料夾 (含自身)
+        cursor.execute("DROP TABLE IF EXISTS temp.folder_totals")
+        cursor.execute("""
+            CREATE TEMP TABLE folder_totals AS
+            WITH RECURSIVE closure(ancestor_id, folder_id) AS (
+                SELECT id, id FROM folders
+                UNION ALL
+                SELECT c.ancestor_id, f.id FROM folders f JOIN closure c ON f.parent_id = c.folder_id
+            )
+            SELECT c.ancestor_id AS id, COUNT(DISTINCT r.id) AS files, COUNT(v.id) AS versions,
+                   COALESCE(SUM(v.size), 0) AS size
+            FROM closure c
+            JOIN file_records r ON r.folder_id = c.folder_id
+            LEFT JOIN file_versions v ON v.file_id = r.id
+            GROUP BY c.ancestor_id
+        """)
+        cursor.execute("""
+            UPDATE folders SET
+                total_file_count = COALESCE((SELECT files FROM folder_totals t WHERE t.id = folders.id), 0),
+                total_version_count = COALESCE((SELECT versions FROM folder_totals t WHERE t.id = folders.id), 0),
+                total_bytes = COALESCE((SELECT size FROM folder_totals t WHERE t.id = folders.id), 0)
+        """)
+        cursor.execute("SELECT COUNT(*) FROM folder_totals")
+        count = cursor.fetchone()[0]
+        cursor.execute("DROP TABLE temp.folder_totals")
+
+        conn.commit()
+        print("\n[成功] 遷移完成！")
+        print(f"  - {count} 個資料夾含有檔案")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"\n[錯誤] 遷移失敗: {e}")
+        return False
+
+    finally:
+        conn.close()
+
+
+def check_migration_status():
+    """檢查遷移狀態"""
+    if not os.path.exists(DATABASE_PATH):
+        print(f"資料庫不存在: {DATABASE_PATH}")
+        return
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    columns = get_columns(conn.cursor())
+    conn.close()
+
+    print("=== 遷移狀態 ===")
+    for name in COLUMNS:
+        print(f"folders.{name} 欄位: {'✓ 存在' if name in columns else '✗ 不存在'}")
+    print("\n狀態: " + ("已完成遷移" if all(name in columns for name in COLUMNS) else "需要執行遷移"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 資料庫遷移工具 - 資料夾子樹統計")
+    parser.add_argument("--check", action="store_true", help="檢查遷移狀態")
+    parser.add_argument("--migrate", action="store_true", help="執行遷移")
+
+    args = parser.parse_args()
+
+    if args.check:
+        check_migration_status()
+    elif args.migrate:
+        migrate()
+    else:
+        parser.print_help()
@@ -0,0 +1,172 @@
+"""
+資料庫遷移腳本：記錄每個檔案版本的雜湊演算法
+
+此腳本將：
+1. 在 file_versions 表新增 hash_algorithm 欄位
+2. 將舊資料標記為 sha1 (完整計算) 或 sha1-sampled (>10MB 取樣計算)
+3. (可選) 從 MinIO 串流讀取取樣雜湊的檔案，重新計算完整內容雜湊
+
+使用方式：
+    python -m migrations.add_hash_algorithm --check
+    python -m migrations.add_hash_algorithm --migrate
+    python -m migrations.add_hash_algorithm --rehash
+
+注意：請先備份資料庫！
+"""
+
+import sqlite3
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_PATH = "./dms.db"
+
+# 舊版 calculate_sha1 的取樣門檻
+LARGE_FILE_THRESHOLD = 10 * 1024 * 1024  # 10 MB
+PLACEHOLDER_HASH = "0" * 40  # add_versioning 遷移時填入的空 hash
+READ_CHUNK_SIZE = 1 * 1024 * 1024  # 1 MB
+
+
+def migrate():
+    """執行遷移"""
+
+    if not os.path.exists(DATABASE_PATH):
+        print(f"[錯誤] 資料庫不存在: {DATABASE_PATH}")
+        print("如果是全新安裝，請直接啟動應用程式，SQLAlchemy 會自動建立新結構。")
+        return False
+
+    # 備份資料庫
+    backup_path = DATABASE_PATH + ".backup"
+    print(f"[1/3] 備份資料庫到 {backup_path}...")
+    import shutil
+    shutil.copy(DATABASE_PATH, backup_path)
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(file_versions)")
+        columns = [row[1] for row in cursor.fetchall()]
+        if 'hash_algorithm' in columns:
+            print("[資訊] hash_algorithm 欄位已存在，跳過遷移。")
+            return True
+
+        print("[2/3] 新增 hash_algorithm 欄位...")
+        cursor.execute("ALTER TABLE file_versions ADD COLUMN hash_algorithm VARCHAR(16)")
+
+        print("[3/3] 標記既有雜湊的演算法...")
+        cursor.execute("""
+            UPDATE file_versions
+            SET hash_algorithm = CASE
+                WHEN size > ? OR sha1_hash = ? OR sha1_hash IS NULL THEN 'sha1-sampled'
+                ELSE 'sha1'
+            END
+        """, (LARGE_FILE_THRESHOLD, PLACEHOLDER_HASH))
+
+        cursor.execute("SELECT COUNT(*) FROM file_versions WHERE hash_algorithm = 'sha1-sampled'")
+        sampled = cursor.fetchone()[0]
+
+        conn.commit()
+        print("\n[成功] 遷移完成！")
+        print(f"  - {sampled} 筆版本為取樣或空雜湊，可執行 --rehash 升級為完整雜湊")
+        print(f"\n備份檔案保存於: {backup_path}")
+
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"\n[錯誤] 遷移失敗: {e}")
+        print("資料庫已回滾，請檢查錯誤後重試。")
+        return False
+
+    finally:
+        conn.close()
+
+
+def rehash():
+    """從 MinIO 串流讀取取樣雜湊的版本，重新計算完整內容雜湊"""
+    from app.storage import download_file_from_minio
+    from app.utils import HASH_ALGORITHM, SAMPLED_HASH_ALGORITHM, new_hasher
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, object_name FROM file_versions WHERE hash_algorithm = ?",
+        (SAMPLED_HASH_ALGORITHM,)
+    )
+    rows = cursor.fetchall()
+    print(f"共 {len(rows)} 筆版本需要重新計算 ({HASH_ALGORITHM})")
+
+    upgraded = 0
+    for version_id, object_name in rows:
+        try:
+            response = download_file_from_minio(object_name)
+            try:
+                hasher = new_hasher(HASH_ALGORITHM)
+                for chunk in response.stream(READ_CHUNK_SIZE):
+                    hasher.update(chunk)
+            finally:
+                response.close()
+                response.release_conn()
+        except Exception as e:
+            print(f"  [警告] 無法讀取 {object_name}: {e}")
+            continue
+
+        cursor.execute(
+            "UPDATE file_versions SET sha1_hash = ?, hash_algorithm = ? WHERE id = ?",
+            (hasher.hexdigest(), HASH_ALGORITHM, version_id)
+        )
+        conn.commit()
+        upgraded += 1
+
+    conn.close()
+    print(f"[完成] 已升級 {upgraded} 筆版本雜湊")
+
+
+def check_migration_status():
+    """檢查遷移狀態"""
+    if not os.path.exists(DATABASE_PATH):
+        print(f"資料庫不存在: {DATABASE_PATH}")
+        return
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+
+    cursor.execute("PRAGMA table_info(file_versions)")
+    columns = [row[1] for row in cursor.fetchall()]
+    has_column = 'hash_algorithm' in columns
+
+    print("=== 遷移狀態 ===")
+    print(f"hash_algorithm 欄位: {'✓ 存在' if has_column else '✗ 不存在'}")
+
+    if has_column:
+        cursor.execute("SELECT hash_algorithm, COUNT(*) FROM file_versions GROUP BY hash_algorithm")
+        for algorithm, count in cursor.fetchall():
+            print(f"  {algorithm}: {count}")
+        print("\n狀態: 已完成遷移")
+    else:
+        print("\n狀態: 需要執行遷移")
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 資料庫遷移工具 - 雜湊演算法")
+    parser.add_argument("--check", action="store_true", help="檢查遷移狀態")
+    parser.add_argument("--migrate", action="store_true", help="執行遷移")
+    parser.add_argument("--rehash", action="store_true", help="重新計算取樣雜湊")
+
+    args = parser.parse_args()
+
+    if args.check:
+        check_migration_status()
+    elif args.migrate:
+        migrate()
+    elif args.rehash:
+        rehash()
+    else:
+        parser.print_help()
@@ -0,0 +1,103 @@
+"""
+資料庫遷移腳本：背景工作佇列
+
+此腳本將：
+1. 建立 jobs 表 (上傳後處理的背景工作：延後的雜湊與去重、縮圖)
+
+遷移前已建立但仍為 pending 的縮圖記錄沒有對應的工作，可於遷移後重新排入：
+    python -m app.derivatives --backfill
+
+使用方式：
+    python -m migrations.add_jobs --check
+    python -m migrations.add_jobs --migrate
+"""
+
+import sqlite3
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_PATH = "./dms.db"
+
+
+def migrate():
+    """執行遷移"""
+
+    if not os.path.exists(DATABASE_PATH):
+        print(f"[錯誤] 資料庫不存在: {DATABASE_PATH}")
+        print("如果是全新安裝，請直接啟動應用程式，SQLAlchemy 會自動建立新結構。")
+        return False
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        print("[1/1] 建立 jobs 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                type VARCHAR(32) NOT NULL,
+                payload VARCHAR NOT NULL,
+                status VARCHAR(16) NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 5,
+                run_after DATETIME NOT NULL,
+                locked_until DATETIME,
+                worker VARCHAR,
+                last_error VARCHAR,
+                result VARCHAR,
+                created_at DATETIME,
+                updated_at DATETIME,
+                finished_at DATETIME
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_jobs_id ON jobs(id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_run_after ON jobs(status, run_after)")
+
+        conn.commit()
+        print("\n[成功] 遷移完成！")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"\n[錯誤] 遷移失敗: {e}")
+        return False
+
+    finally:
+        conn.close()
+
+
+def check_migration_status():
+    """檢查遷移狀態"""
+    if not os.path.exists(DATABASE_PATH):
+        print(f"資料庫不存在: {DATABASE_PATH}")
+        return
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='jobs'")
+    has_table = cursor.fetchone() is not None
+    conn.close()
+
+    print("=== 遷移狀態 ===")
+    print(f"jobs 表: {'✓ 存在' if has_table else '✗ 不存在'}")
+    print("\n狀態: " + ("已完成遷移" if has_table else "需要執行遷移"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 資料庫遷移工具 - 背景工作佇列")
+    parser.add_argument("--check", action="store_true", help="檢查遷移狀態")
+    parser.add_argument("--migrate", action="store_true", help="執行遷移")
+
+    args = parser.parse_args()
+
+    if args.check:
+        check_migration_status()
+    elif args.migrate:
+        migrate()
+    else:
+        parser.print_help()
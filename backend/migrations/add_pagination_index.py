@@ -0,0 +1,81 @@
+"""
+資料庫遷移腳本：游標分頁索引
+
+此腳本將：
+1. 在 file_records 建立 (created_at, id) 複合索引，供 /history 與 /search 的游標分頁使用
+
+使用方式：
+    python -m migrations.add_pagination_index --check
+    python -m migrations.add_pagination_index --migrate
+"""
+
+import sqlite3
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_PATH = "./dms.db"
+INDEX_NAME = "ix_file_records_created_at_id"
+
+
+def migrate():
+    """執行遷移"""
+
+    if not os.path.exists(DATABASE_PATH):
+        print(f"[錯誤] 資料庫不存在: {DATABASE_PATH}")
+        print("如果是全新安裝，請直接啟動應用程式，SQLAlchemy 會自動建立新結構。")
+        return False
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        print(f"[1/1] 建立索引 {INDEX_NAME}...")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON file_records(created_at, id)")
+        conn.commit()
+        print("\n[成功] 遷移完成！")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"\n[錯誤] 遷移失敗: {e}")
+        return False
+
+    finally:
+        conn.close()
+
+
+def check_migration_status():
+    """檢查遷移狀態"""
+    if not os.path.exists(DATABASE_PATH):
+        print(f"資料庫不存在: {DATABASE_PATH}")
+        return
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name=?", (INDEX_NAME,))
+    has_index = cursor.fetchone() is not None
+    conn.close()
+
+    print("=== 遷移狀態 ===")
+    print(f"{INDEX_NAME} 索引: {'✓ 存在' if has_index else '✗ 不存在'}")
+    print("\n狀態: " + ("已完成遷移" if has_index else "需要執行遷移"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 資料庫遷移工具 - 分頁索引")
+    parser.add_argument("--check", action="store_true", help="檢查遷移狀態")
+    parser.add_argument("--migrate", action="store_true", help="執行遷移")
+
+    args = parser.parse_args()
+
+    if args.check:
+        check_migration_status()
+    elif args.migrate:
+        migrate()
+    else:
+        parser.print_help()
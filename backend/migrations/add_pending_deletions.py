@@ -0,0 +1,100 @@
+"""
+資料庫遷移腳本：待刪除物件佇列與批次刪除索引
+
+此腳本將：
+1. 建立 pending_deletions 表 (MinIO 刪除失敗、待重試的物件)
+2. 在 file_records.folder_id 建立索引，供資料夾子樹的批次刪除使用
+
+使用方式：
+    python -m migrations.add_pending_deletions --check
+    python -m migrations.add_pending_deletions --migrate
+"""
+
+import sqlite3
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_PATH = "./dms.db"
+INDEX_NAME = "ix_file_records_folder_id"
+
+
+def migrate():
+    """執行遷移"""
+
+    if not os.path.exists(DATABASE_PATH):
+        print(f"[錯誤] 資料庫不存在: {DATABASE_PATH}")
+        print("如果是全新安裝，請直接啟動應用程式，SQLAlchemy 會自動建立新結構。")
+        return False
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        print("[1/2] 建立 pending_deletions 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pending_deletions (
+                id INTEGER PRIMARY KEY,
+                bucket_name VARCHAR,
+                object_name VARCHAR NOT NULL UNIQUE,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error VARCHAR,
+                created_at DATETIME,
+                updated_at DATETIME
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_pending_deletions_id ON pending_deletions(id)")
+
+        print(f"[2/2] 建立索引 {INDEX_NAME}...")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON file_records(folder_id)")
+
+        conn.commit()
+        print("\n[成功] 遷移完成！")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"\n[錯誤] 遷移失敗: {e}")
+        return False
+
+    finally:
+        conn.close()
+
+
+def check_migration_status():
+    """檢查遷移狀態"""
+    if not os.path.exists(DATABASE_PATH):
+        print(f"資料庫不存在: {DATABASE_PATH}")
+        return
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='pending_deletions'")
+    has_table = cursor.fetchone() is not None
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index' AND name=?", (INDEX_NAME,))
+    has_index = cursor.fetchone() is not None
+    conn.close()
+
+    print("=== 遷移狀態 ===")
+    print(f"pending_deletions 表: {'✓ 存在' if has_table else '✗ 不存在'}")
+    print(f"{INDEX_NAME} 索引: {'✓ 存在' if has_index else '✗ 不存在'}")
+    print("\n狀態: " + ("已完成遷移" if has_table and has_index else "需要執行遷移"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 資料庫遷移工具 - 待刪除物件佇列")
+    parser.add_argument("--check", action="store_true", help="檢查遷移狀態")
+    parser.add_argument("--migrate", action="store_true", help="執行遷移")
+
+    args = parser.parse_args()
+
+    if args.check:
+        check_migration_status()
+    elif args.migrate:
+        migrate()
+    else:
+        parser.print_help()
@@ -0,0 +1,115 @@
+"""
+資料庫遷移腳本：預先彙總的統計計數器
+
+此腳本將：
+1. 建立 stats_counters 表
+2. 依現有的 file_records / file_versions 回填全系統、各分類及各資料夾的計數
+
+(未執行此腳本時，應用程式啟動時也會建立並回填；之後可用 python -m app.counters --rebuild 重建)
+
+使用方式：
+    python -m migrations.add_stats_counters --check
+    python -m migrations.add_stats_counters --migrate
+"""
+
+import sqlite3
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_PATH = "./dms.db"
+
+# (scope, key 運算式)
+SCOPES = [
+    ("total", "''"),
+    ("category", "COALESCE(f.category, 'other')"),
+    ("folder", "CAST(COALESCE(f.folder_id, 0) AS TEXT)"),
+]
+
+
+def migrate():
+    """執行遷移"""
+
+    if not os.path.exists(DATABASE_PATH):
+        print(f"[錯誤] 資料庫不存在: {DATABASE_PATH}")
+        print("如果是全新安裝，請直接啟動應用程式，SQLAlchemy 會自動建立新結構。")
+        return False
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        print("[1/2] 建立 stats_counters 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                id INTEGER PRIMARY KEY,
+                scope VARCHAR(16) NOT NULL,
+                key VARCHAR NOT NULL,
+                file_count BIGINT NOT NULL DEFAULT 0,
+                version_count BIGINT NOT NULL DEFAULT 0,
+                total_bytes BIGINT NOT NULL DEFAULT 0,
+                CONSTRAINT uq_stats_counters_scope_key UNIQUE (scope, key)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_stats_counters_id ON stats_counters(id)")
+
+        print("[2/2] 回填計數...")
+        cursor.execute("DELETE FROM stats_counters")
+        for scope, key in SCOPES:
+            cursor.execute(f"""
+                INSERT INTO stats_counters (scope, key, file_count, version_count, total_bytes)
+                SELECT '{scope}', {key}, COUNT(DISTINCT f.id), COUNT(v.id), COALESCE(SUM(v.size), 0)
+                FROM file_records f LEFT JOIN file_versions v ON v.file_id = f.id
+                GROUP BY {key}
+            """)
+        cursor.execute("SELECT file_count, total_bytes FROM stats_counters WHERE scope = 'total'")
+        row = cursor.fetchone() or (0, 0)
+
+        conn.commit()
+        print("\n[成功] 遷移完成！")
+        print(f"  - {row[0]} 個檔案，共 {row[1]} bytes")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"\n[錯誤] 遷移失敗: {e}")
+        return False
+
+    finally:
+        conn.close()
+
+
+def check_migration_status():
+    """檢查遷移狀態"""
+    if not os.path.exists(DATABASE_PATH):
+        print(f"資料庫不存在: {DATABASE_PATH}")
+        return
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='stats_counters'")
+    has_table = cursor.fetchone() is not None
+    conn.close()
+
+    print("=== 遷移狀態 ===")
+    print(f"stats_counters 表: {'✓ 存在' if has_table else '✗ 不存在'}")
+    print("\n狀態: " + ("已完成遷移" if has_table else "需要執行遷移"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 資料庫遷移工具 - 統計計數器")
+    parser.add_argument("--check", action="store_true", help="檢查遷移狀態")
+    parser.add_argument("--migrate", action="store_true", help="執行遷移")
+
+    args = parser.parse_args()
+
+    if args.check:
+        check_migration_status()
+    elif args.migrate:
+        migrate()
+    else:
+        parser.print_help()
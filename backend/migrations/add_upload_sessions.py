@@ -0,0 +1,118 @@
+"""
+資料庫遷移腳本：可續傳上傳工作階段
+
+此腳本將：
+1. 建立 upload_sessions 表 (對應 MinIO multipart upload 的上傳工作階段)
+2. 建立 upload_parts 表 (已接收的分段)
+
+SQLite 的 INTEGER 即為 64 位元，blobs.size / file_versions.size 改為 BigInteger 不需遷移。
+
+使用方式：
+    python -m migrations.add_upload_sessions --check
+    python -m migrations.add_upload_sessions --migrate
+"""
+
+import sqlite3
+import os
+import sys
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DATABASE_PATH = "./dms.db"
+
+
+def migrate():
+    """執行遷移"""
+
+    if not os.path.exists(DATABASE_PATH):
+        print(f"[錯誤] 資料庫不存在: {DATABASE_PATH}")
+        print("如果是全新安裝，請直接啟動應用程式，SQLAlchemy 會自動建立新結構。")
+        return False
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+
+    try:
+        print("[1/2] 建立 upload_sessions 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS upload_sessions (
+                id VARCHAR(32) PRIMARY KEY,
+                filename VARCHAR NOT NULL,
+                content_type VARCHAR,
+                folder_id INTEGER REFERENCES folders(id),
+                size BIGINT NOT NULL,
+                object_name VARCHAR NOT NULL,
+                multipart_upload_id VARCHAR NOT NULL,
+                received_bytes BIGINT NOT NULL DEFAULT 0,
+                next_part INTEGER NOT NULL DEFAULT 1,
+                status VARCHAR(16) NOT NULL DEFAULT 'active',
+                created_at DATETIME,
+                updated_at DATETIME,
+                expires_at DATETIME NOT NULL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_upload_sessions_expires_at ON upload_sessions(expires_at)")
+
+        print("[2/2] 建立 upload_parts 表...")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS upload_parts (
+                id INTEGER PRIMARY KEY,
+                session_id VARCHAR(32) NOT NULL REFERENCES upload_sessions(id),
+                part_number INTEGER NOT NULL,
+                etag VARCHAR NOT NULL,
+                size BIGINT NOT NULL,
+                CONSTRAINT uq_upload_parts_number UNIQUE (session_id, part_number)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_upload_parts_id ON upload_parts(id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_upload_parts_session_id ON upload_parts(session_id)")
+
+        conn.commit()
+        print("\n[成功] 遷移完成！")
+        return True
+
+    except Exception as e:
+        conn.rollback()
+        print(f"\n[錯誤] 遷移失敗: {e}")
+        return False
+
+    finally:
+        conn.close()
+
+
+def check_migration_status():
+    """檢查遷移狀態"""
+    if not os.path.exists(DATABASE_PATH):
+        print(f"資料庫不存在: {DATABASE_PATH}")
+        return
+
+    conn = sqlite3.connect(DATABASE_PATH)
+    cursor = conn.cursor()
+    status = {}
+    for table in ("upload_sessions", "upload_parts"):
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,))
+        status[table] = cursor.fetchone() is not None
+    conn.close()
+
+    print("=== 遷移狀態 ===")
+    for table, exists in status.items():
+        print(f"{table} 表: {'✓ 存在' if exists else '✗ 不存在'}")
+    print("\n狀態: " + ("已完成遷移" if all(status.values()) else "需要執行遷移"))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="DMS 資料庫遷移工具 - 可續傳上傳")
+    parser.add_argument("--check", action="store_true", help="檢查遷移狀態")
+    parser.add_argument("--migrate", action="store_true", help="執行遷移")
+
+    args = parser.parse_args()
+
+    if args.check:
+        check_migration_status()
+    elif args.migrate:
+        migrate()
+    else:
+        parser.print_help()
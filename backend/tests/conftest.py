@@ -0,0 +1,89 @@
+"""
+測試共用設定
+
+在匯入 app 之前設定環境變數：使用暫存目錄中的 SQLite 資料庫與記憶體儲存後端，
+不啟動背景工作 (JOB_WORKERS=0)，佇列中的工作由 drain_jobs 在測試中同步執行。
+"""
+
+import io
+import os
+import sys
+import tempfile
+import uuid
+
+_TEMP_DIR = tempfile.mkdtemp(prefix="dms-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEMP_DIR, 'dms.db')}"
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["JOB_WORKERS"] = "0"
+os.environ["GC_INTERVAL_HOURS"] = "0"
+os.environ["UPLOAD_SWEEP_INTERVAL_MINUTES"] = "0"
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import jobs
+from app.database import SessionLocal, engine
+from app.main import app
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def folder(client):
+    """每個測試使用獨立的資料夾，避免互相影響"""
+    return client.post("/folders", json={"name": uuid.uuid4().hex}).json()["id"]
+
+
+@pytest.fixture
+def count_statements():
+    """
+    回傳 count(callable)：執行 callable 期間送出的 SQL 陳述式數量。
+
+    以 before_cursor_execute 監聽 engine 上的每一次執行。
+    """
+    counter = {"statements": 0}
+
+    def on_execute(*_):
+        counter["statements"] += 1
+
+    event.listen(engine, "before_cursor_execute", on_execute)
+
+    def count(func):
+        counter["statements"] = 0
+        func()
+        return counter["statements"]
+
+    yield count
+    event.remove(engine, "before_cursor_execute", on_execute)
+
+
+def upload(client, filename, data, folder_id=None, content_type="text/plain"):
+    response = client.post(
+        "/upload",
+        files={"file": (filename, io.BytesIO(data), content_type)},
+        data={"folder_id": folder_id} if folder_id is not None else {},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def drain_jobs():
+    """同步執行佇列中所有到期的工作"""
+    jobs.work("tests", drain=True)
@@ -0,0 +1,120 @@
+"""
+批次上傳 (POST /upload/batch)
+"""
+
+import hashlib
+import io
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import upload
+from app import blobs, ingest, storage
+from app.database import SessionLocal
+from app.models import Blob, FileVersion
+
+
+def post_batch(client, folder_id=None, **contents):
+    """以 files 欄位上傳 {檔名: 內容}"""
+    response = client.post(
+        "/upload/batch",
+        files=[("files", (name, io.BytesIO(data), "text/plain")) for name, data in contents.items()],
+        data={"folder_id": folder_id} if folder_id is not None else {},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def blob_usage(data: bytes):
+    """回傳 (ref_count, 引用此內容的版本數, 此內容在儲存中的物件數)"""
+    content_hash = hashlib.sha1(data).hexdigest()
+    db = SessionLocal()
+    try:
+        blob = blobs.find_blob(db, "sha1", content_hash)
+        versions = db.query(FileVersion).filter(FileVersion.sha1_hash == content_hash).count()
+    finally:
+        db.close()
+    objects = list(storage.list_objects(f"blobs/sha1/{content_hash[:2]}/{content_hash}"))
+    return (blob.ref_count if blob else None), versions, len(objects)
+
+
+def test_statuses_and_deduplication(client, folder):
+    data = uuid.uuid4().bytes
+    upload(client, "a.txt", data, folder)
+
+    result = post_batch(client, folder, **{"a.txt": data, "b.txt": data, "c.txt": data, "d.txt": uuid.uuid4().bytes})
+
+    statuses = {item["filename"]: item["status"] for item in result["items"]}
+    assert statuses == {"a.txt": "duplicate", "b.txt": "created", "c.txt": "created", "d.txt": "created"}
+    assert blob_usage(data) == (3, 3, 1)
+
+
+def test_archive_creates_subfolders(client, folder):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as zf:
+        zf.writestr("scans/2024/x.txt", b"x")
+        zf.writestr("scans/readme.txt", b"readme")
+        zf.writestr("../evil.txt", b"evil")
+    response = client.post(
+        "/upload/batch",
+        files={"archive": ("a.zip", buffer.getvalue(), "application/zip")},
+        data={"folder_id": folder},
+    )
+
+    assert response.status_code == 200
+    items = {item["filename"]: item for item in response.json()["items"]}
+    assert {name: item["status"] for name, item in items.items()} == {
+        "x.txt": "created", "readme.txt": "created", "evil.txt": "created"
+    }
+    tree = client.get("/folders/tree", params={"root_id": folder}).json()
+    assert [child["name"] for child in tree[0]["children"]] == ["scans"]
+    assert client.get(f"/download/{items['x.txt']['file_id']}").content == b"x"
+
+
+def test_blobs_released_before_the_write_phase_are_stored_again(client, folder, monkeypatch):
+    """上傳階段判定已存在的 Blob，在寫入階段前被並行的刪除釋放 (物件已刪除)"""
+    data = uuid.uuid4().bytes
+    existing = upload(client, "existing.txt", data, folder)
+    upload_items = ingest.upload_items
+    released = []
+
+    def upload_then_release(db, files, archive):
+        result = upload_items(db, files, archive)
+        other = SessionLocal()
+        try:
+            version = other.query(FileVersion).filter(FileVersion.file_id == existing["id"]).one()
+            released.extend(blobs.release_blobs(other, [version.object_name]))
+            other.commit()
+            blobs.purge_objects(other, released)
+        finally:
+            other.close()
+        return result
+
+    monkeypatch.setattr(ingest, "upload_items", upload_then_release)
+    result = post_batch(client, folder, **{"a.txt": data, "b.txt": data})
+    monkeypatch.undo()
+
+    assert released
+    assert [item["status"] for item in result["items"]] == ["created", "created"]
+    for item in result["items"]:
+        assert client.get(f"/download/{item['file_id']}").content == data
+    ref_count, _, objects = blob_usage(data)
+    assert (ref_count, objects) == (2, 1)
+
+
+def test_concurrent_batches_share_one_blob(client):
+    data = uuid.uuid4().bytes
+
+    def batch(_):
+        folder_id = client.post("/folders", json={"name": uuid.uuid4().hex}).json()["id"]
+        return post_batch(client, folder_id, **{"a.txt": data, "b.txt": data})
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        results = list(pool.map(batch, range(8)))
+
+    for result in results:
+        for item in result["items"]:
+            assert item["status"] == "created"
+            assert client.get(f"/download/{item['file_id']}").content == data
+    # 並行上傳時落選的物件已刪除，只留下 Blob 的物件
+    assert blob_usage(data) == (16, 16, 1)
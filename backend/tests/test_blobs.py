@@ -0,0 +1,130 @@
+"""
+內容定址儲存 (Blob) 的去重與引用計數
+"""
+
+import hashlib
+import io
+import uuid
+
+from conftest import drain_jobs, upload
+from app import blobs, gc, storage
+from app.database import SessionLocal
+from app.routers import files as files_router
+
+
+def unique_content() -> bytes:
+    return f"content {uuid.uuid4().hex}".encode()
+
+
+def blob_state(data: bytes):
+    """回傳 (ref_count, 物件是否存在)；Blob 記錄不存在時 ref_count 為 None"""
+    db = SessionLocal()
+    try:
+        blob = blobs.find_blob(db, "sha1", hashlib.sha1(data).hexdigest())
+        if blob is None:
+            return None, False
+        return blob.ref_count, bool(list(storage.list_objects(blob.object_name)))
+    finally:
+        db.close()
+
+
+def test_identical_content_shares_one_blob(client):
+    data = unique_content()
+    first = client.post("/folders", json={"name": uuid.uuid4().hex}).json()["id"]
+    second = client.post("/folders", json={"name": uuid.uuid4().hex}).json()["id"]
+
+    a = upload(client, "a.txt", data, first)
+    b = upload(client, "b.txt", data, second)
+
+    assert a["current_version"]["sha1_hash"] == b["current_version"]["sha1_hash"]
+    assert blob_state(data) == (2, True)
+
+
+def test_duplicate_upload_does_not_take_a_reference(client, folder):
+    data = unique_content()
+    upload(client, "a.txt", data, folder)
+
+    response = client.post("/upload", files={"file": ("a.txt", io.BytesIO(data), "text/plain")}, data={"folder_id": folder})
+
+    assert response.status_code == 409
+    assert blob_state(data) == (1, True)
+
+
+def test_releasing_references(client, folder):
+    data = unique_content()
+    a = upload(client, "a.txt", data, folder)
+    b = upload(client, "b.txt", data, folder)
+    v2 = upload(client, "b.txt", unique_content(), folder)
+    assert blob_state(data) == (2, True)
+
+    # 刪除版本只釋放該版本的引用
+    versions = client.get(f"/files/{b['id']}/versions").json()
+    old_version = next(v for v in versions if v["version_number"] == 1)
+    assert client.delete(f"/files/{b['id']}/versions/{old_version['id']}").status_code == 200
+    assert blob_state(data) == (1, True)
+    assert client.get(f"/download/{a['id']}").content == data
+    assert client.get(f"/download/{v2['id']}").status_code == 200
+
+    # 最後一個引用釋放後刪除 Blob 記錄與物件
+    assert client.delete(f"/files/{a['id']}").status_code == 200
+    drain_jobs()
+    assert blob_state(data) == (None, False)
+
+
+def test_blob_released_during_acquire_is_stored_again(client, folder, monkeypatch):
+    """查詢到 Blob 後、增加引用前，並行的刪除釋放了最後一個引用並刪除物件"""
+    data = unique_content()
+    upload(client, "a.txt", data, folder)
+    find_blob = blobs.find_blob
+    released = []
+
+    def find_then_release(db, hash_algorithm, content_hash):
+        blob = find_blob(db, hash_algorithm, content_hash)
+        if blob is not None and not released:
+            other = SessionLocal()
+            try:
+                names = blobs.release_blobs(other, [blob.object_name])
+                other.commit()
+                blobs.purge_objects(other, names)
+            finally:
+                other.close()
+            released.extend(names)
+        return blob
+
+    monkeypatch.setattr(blobs, "find_blob", find_then_release)
+    second = upload(client, "b.txt", data, folder)
+    monkeypatch.undo()
+
+    assert released
+    assert blob_state(data) == (1, True)
+    assert client.get(f"/download/{second['id']}").content == data
+
+
+def test_delayed_purge_does_not_delete_a_blob_stored_again(client, folder, monkeypatch):
+    """
+    釋放最後一個引用並 commit 後、刪除物件前，相同內容再次上傳並建立新的 Blob；
+    延遲的 purge_objects 與 pending_deletions 的重試都不可刪除新 Blob 的物件。
+    """
+    data = unique_content()
+    first = upload(client, "a.txt", data, folder)
+    delayed = []
+    monkeypatch.setattr(files_router, "purge_objects", lambda db, names: delayed.extend(names) or {})
+    assert client.delete(f"/files/{first['id']}").status_code == 200
+    monkeypatch.undo()
+    # Blob 記錄已刪除，物件尚未刪除
+    assert blob_state(data) == (None, False)
+    assert delayed and list(storage.list_objects(delayed[0]))
+
+    second = upload(client, "b.txt", data, folder)
+
+    db = SessionLocal()
+    try:
+        blobs.purge_objects(db, delayed)
+        blobs.enqueue_pending_deletions(db, {name: "timeout" for name in delayed})
+        db.commit()
+        gc.drain_pending_deletions(db)
+    finally:
+        db.close()
+
+    assert blob_state(data) == (1, True)
+    assert client.get(f"/download/{second['id']}").content == data
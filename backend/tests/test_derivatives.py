@@ -0,0 +1,21 @@
+"""
+影片縮圖的 ffmpeg 輸入限制
+"""
+
+import pytest
+
+from app import derivatives
+
+pytestmark = pytest.mark.skipif(not derivatives.FFMPEG_PATH, reason="ffmpeg is not installed")
+
+
+@pytest.mark.parametrize("name, content", [
+    ("playlist.m3u8", "#EXTM3U\n#EXT-X-TARGETDURATION:1\n#EXTINF:1,\n/etc/hosts\n#EXT-X-ENDLIST\n"),
+    ("list.txt", "ffconcat version 1.0\nfile '/etc/hosts'\n"),
+])
+def test_playlist_inputs_are_rejected(tmp_path, name, content):
+    source = tmp_path / name
+    source.write_text(content)
+
+    with pytest.raises(RuntimeError, match="Unsupported video format"):
+        derivatives._ffmpeg_frame(str(source), derivatives.LOCAL_PROTOCOLS)
@@ -0,0 +1,114 @@
+"""
+直接上傳 (預簽名分段網址)
+
+記憶體後端的預簽名網址由 API 的 /objects 路由提供，以 TestClient 送出。
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from conftest import drain_jobs
+from app import blobs, resumable, storage
+from app.database import SessionLocal
+from app.models import FileVersion
+from app.storage import MIN_PART_SIZE
+
+
+def put_direct(client, url: str, data: bytes):
+    """以預簽名網址上傳一個分段 (客戶端直接傳至儲存服務)"""
+    parts = urlsplit(url)
+    response = client.put(f"{parts.path}?{parts.query}", content=data)
+    assert response.status_code == 200, response.text
+    return response
+
+
+def start_direct(client, folder_id, data: bytes, **extra) -> dict:
+    response = client.post("/uploads", json={
+        "filename": f"{uuid.uuid4().hex}.bin", "size": len(data), "folder_id": folder_id, "direct": True, **extra
+    })
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def test_direct_upload_is_hashed_by_finalize(client, folder, monkeypatch):
+    monkeypatch.setattr(resumable, "UPLOAD_CHUNK_SIZE", MIN_PART_SIZE)
+    data = os.urandom(MIN_PART_SIZE + 123)
+    state = start_direct(client, folder, data)
+    chunk = state["chunk_size"]
+    assert state["part_count"] == 2 and len(state["part_urls"]) == 2
+
+    put_direct(client, state["part_urls"][0], data[:chunk])
+    assert client.head(f"/uploads/{state['id']}").headers["upload-offset"] == str(chunk)
+    # 直接上傳的分段不經過 API；未上傳完成前不可完成
+    assert client.put(f"/uploads/{state['id']}/parts/2", content=data[chunk:]).status_code == 409
+    assert client.post(f"/uploads/{state['id']}/complete").status_code == 409
+
+    url = client.get(f"/uploads/{state['id']}/parts/2/url").json()["url"]
+    put_direct(client, url, data[chunk:])
+    record = client.post(f"/uploads/{state['id']}/complete").json()
+    assert record["current_version"]["sha1_hash"] is None
+
+    drain_jobs()
+    info = client.get(f"/files/{record['id']}/info").json()
+    assert info["current_version"]["sha1_hash"] == hashlib.sha1(data).hexdigest()
+    assert client.get(f"/download/{record['id']}").content == data
+
+
+def test_declared_hash_mismatch_is_rejected(client, folder):
+    data = b"direct upload with a wrong declared hash"
+    state = start_direct(client, folder, data, content_hash="0" * 40)
+    put_direct(client, state["part_urls"][0], data)
+    record = client.post(f"/uploads/{state['id']}/complete").json()
+
+    drain_jobs()
+    assert client.get(f"/files/{record['id']}/info").status_code == 404
+    db = SessionLocal()
+    try:
+        assert blobs.find_blob(db, "sha1", hashlib.sha1(data).hexdigest()) is None
+    finally:
+        db.close()
+
+
+def test_fewer_bytes_than_declared(client, folder):
+    state = start_direct(client, folder, b"x" * 100)
+    put_direct(client, state["part_urls"][0], b"x" * 18)
+
+    response = client.post(f"/uploads/{state['id']}/complete")
+
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Upload incomplete: 18 of 100 bytes received"
+
+
+def test_concurrent_direct_uploads_of_the_same_content_share_one_blob(client, folder):
+    """並行完成相同內容的直接上傳，並由多個 worker 同時執行 finalize_upload：只留下一個 Blob"""
+    data = f"shared direct {uuid.uuid4().hex}".encode()
+    states = [start_direct(client, folder, data) for _ in range(4)]
+    for state in states:
+        put_direct(client, state["part_urls"][0], data)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        responses = list(pool.map(lambda state: client.post(f"/uploads/{state['id']}/complete"), states))
+    assert [response.status_code for response in responses] == [200] * 4
+    workers = [threading.Thread(target=drain_jobs) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    for response in responses:
+        assert client.get(f"/download/{response.json()['id']}").content == data
+    db = SessionLocal()
+    try:
+        blob = blobs.find_blob(db, "sha1", hashlib.sha1(data).hexdigest())
+        objects = {name for name, in db.query(FileVersion.object_name).filter(FileVersion.sha1_hash == blob.content_hash)}
+        assert blob.ref_count == 4
+        assert objects == {blob.object_name}
+    finally:
+        db.close()
+    # 其餘組成的物件已刪除
+    staged = [f"{resumable.UPLOAD_STAGING_PREFIX}{state['id']}" for state in states]
+    assert [name for name in staged if list(storage.list_objects(name))] == [blob.object_name]
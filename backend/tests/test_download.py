@@ -0,0 +1,86 @@
+"""
+下載端點的 Range 與條件式 GET
+"""
+
+import os
+
+import pytest
+
+from conftest import upload
+
+DATA = os.urandom(64 * 1024 + 7)
+
+
+@pytest.fixture(scope="module")
+def uploaded(client):
+    record = upload(client, "range.bin", DATA, content_type="application/octet-stream")
+    full = client.get(f"/download/{record['id']}")
+    assert full.status_code == 200
+    return f"/download/{record['id']}", full.headers
+
+
+def test_full_download(client, uploaded):
+    url, _ = uploaded
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["etag"].startswith('"')
+    assert "last-modified" in response.headers
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=0-99", 0, 99),
+    ("bytes=1000-", 1000, len(DATA) - 1),
+    ("bytes=-500", len(DATA) - 500, len(DATA) - 1),
+    ("bytes=60000-999999", 60000, len(DATA) - 1),
+])
+def test_range_request(client, uploaded, header, start, end):
+    url, _ = uploaded
+    response = client.get(url, headers={"Range": header})
+
+    assert response.status_code == 206
+    assert response.content == DATA[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/{len(DATA)}"
+    assert response.headers["content-length"] == str(end - start + 1)
+
+
+def test_unsatisfiable_range(client, uploaded):
+    url, _ = uploaded
+    response = client.get(url, headers={"Range": f"bytes={len(DATA)}-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+def test_if_none_match(client, uploaded):
+    url, headers = uploaded
+
+    response = client.get(url, headers={"If-None-Match": headers["etag"]})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == headers["etag"]
+
+    assert client.get(url, headers={"If-None-Match": '"other"'}).status_code == 200
+
+
+def test_if_modified_since(client, uploaded):
+    url, headers = uploaded
+
+    assert client.get(url, headers={"If-Modified-Since": headers["last-modified"]}).status_code == 304
+    assert client.get(url, headers={"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"}).status_code == 200
+
+
+def test_if_range(client, uploaded):
+    url, headers = uploaded
+
+    # 客戶端的副本仍是目前版本：回傳範圍
+    current = client.get(url, headers={"Range": "bytes=0-9", "If-Range": headers["etag"]})
+    assert current.status_code == 206
+    assert current.content == DATA[:10]
+
+    # 客戶端的副本已過期：忽略 Range，回傳完整內容
+    stale = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert stale.status_code == 200
+    assert stale.content == DATA
@@ -0,0 +1,115 @@
+"""
+延後處理的上傳 (finalize_upload 工作)
+"""
+
+import hashlib
+import threading
+import uuid
+
+import pytest
+
+from conftest import drain_jobs, upload
+from app import blobs, finalize, storage
+from app.database import SessionLocal
+from app.models import FileVersion
+
+
+@pytest.fixture
+def deferred(monkeypatch):
+    monkeypatch.setattr(finalize, "UPLOAD_DEFERRED_PROCESSING", True)
+
+
+def unique_content() -> bytes:
+    return f"deferred {uuid.uuid4().hex}".encode()
+
+
+def current_blob(data: bytes):
+    db = SessionLocal()
+    try:
+        blob = blobs.find_blob(db, "sha1", hashlib.sha1(data).hexdigest())
+        objects = {name for name, in db.query(FileVersion.object_name).filter(FileVersion.sha1_hash == blob.content_hash)}
+        return blob.ref_count, blob.object_name, objects
+    finally:
+        db.close()
+
+
+def uploaded_objects(records) -> set:
+    """延後處理上傳寫入的物件 (finalize_upload 前版本指向的物件)"""
+    db = SessionLocal()
+    try:
+        return {name for name, in db.query(FileVersion.object_name).filter(FileVersion.file_id.in_([r["id"] for r in records]))}
+    finally:
+        db.close()
+
+
+def test_deferred_upload_is_finalized(client, folder, deferred):
+    data = unique_content()
+    first = upload(client, "a.txt", data, folder)
+    assert first["current_version"]["sha1_hash"] is None
+
+    drain_jobs()
+    second = upload(client, "b.txt", data, folder)
+    duplicate, = uploaded_objects([second])
+    drain_jobs()
+
+    ref_count, object_name, objects = current_blob(data)
+    assert (ref_count, objects) == (2, {object_name})
+    # 第一個上傳的物件即為 Blob 的物件，第二個上傳的物件已刪除
+    assert uploaded_objects([first]) == {object_name}
+    assert not list(storage.list_objects(duplicate))
+    for record in (first, second):
+        assert client.get(f"/download/{record['id']}").content == data
+
+
+def test_blob_released_during_finalize_is_created_again(client, folder, monkeypatch):
+    """查詢到 Blob 後、增加引用前，並行的刪除釋放了最後一個引用並刪除物件：版本改指向本次上傳的物件"""
+    data = unique_content()
+    upload(client, "a.txt", data, folder)
+    find_blob = finalize.find_blob
+    released = []
+
+    def find_then_release(db, hash_algorithm, content_hash):
+        blob = find_blob(db, hash_algorithm, content_hash)
+        if blob is not None and not released:
+            other = SessionLocal()
+            try:
+                names = blobs.release_blobs(other, [blob.object_name])
+                other.commit()
+                blobs.purge_objects(other, names)
+            finally:
+                other.close()
+            released.extend(names)
+        return blob
+
+    monkeypatch.setattr(finalize, "UPLOAD_DEFERRED_PROCESSING", True)
+    second = upload(client, "b.txt", data, folder)
+    monkeypatch.setattr(finalize, "find_blob", find_then_release)
+    drain_jobs()
+    monkeypatch.undo()
+
+    assert released
+    # 第一個檔案的版本仍指向已釋放的 Blob (模擬的並行刪除)，只檢查本次上傳
+    ref_count, object_name, _ = current_blob(data)
+    assert ref_count == 1
+    assert uploaded_objects([second]) == {object_name}
+    assert list(storage.list_objects(object_name))
+    assert client.get(f"/download/{second['id']}").content == data
+
+
+def test_concurrent_finalize_of_the_same_content_shares_one_blob(client, folder, deferred):
+    """相同內容的延後處理上傳由多個 worker 同時執行 finalize_upload：只留下一個 Blob，其餘物件已刪除"""
+    data = unique_content()
+    records = [upload(client, f"{i}.txt", data, folder) for i in range(4)]
+    uploaded = uploaded_objects(records)
+
+    workers = [threading.Thread(target=drain_jobs) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    ref_count, object_name, objects = current_blob(data)
+    assert (ref_count, objects) == (4, {object_name})
+    assert [name for name in uploaded if list(storage.list_objects(name))] == [object_name]
+    for record in records:
+        assert client.get(f"/download/{record['id']}").content == data
@@ -0,0 +1,90 @@
+"""
+遞迴刪除資料夾 (批次 SQL 與物件刪除)
+"""
+
+import hashlib
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import drain_jobs, upload
+from app import blobs
+from app.database import SessionLocal
+from app.models import FileVersion
+
+
+def make_tree(client, files_per_folder: int, shared: bytes):
+    """建立 root/child/grandchild，每層 files_per_folder 個檔案 (含一個與外部共用內容的檔案)"""
+    root = client.post("/folders", json={"name": uuid.uuid4().hex}).json()["id"]
+    child = client.post("/folders", json={"name": "child", "parent_id": root}).json()["id"]
+    grandchild = client.post("/folders", json={"name": "grandchild", "parent_id": child}).json()["id"]
+    files = []
+    for folder_id in (root, child, grandchild):
+        for i in range(files_per_folder):
+            record = upload(client, f"f{i}.txt", uuid.uuid4().bytes, folder_id)
+            upload(client, f"f{i}.txt", uuid.uuid4().bytes, folder_id)
+            client.post(f"/files/{record['id']}/tags", json={"name": "tree"})
+            files.append(record["id"])
+        files.append(upload(client, "shared.txt", shared, folder_id)["id"])
+    return root, (root, child, grandchild), files
+
+
+def ref_count(data: bytes):
+    db = SessionLocal()
+    try:
+        blob = blobs.find_blob(db, "sha1", hashlib.sha1(data).hexdigest())
+        return blob.ref_count if blob else None
+    finally:
+        db.close()
+
+
+def test_recursive_delete_removes_the_subtree(client, folder):
+    shared = uuid.uuid4().bytes
+    outside = upload(client, "outside.txt", shared, folder)
+    root, folders, files = make_tree(client, 3, shared)
+    assert ref_count(shared) == 4
+    before = client.get("/folders/0").json()["total_file_count"]
+
+    assert client.delete(f"/folders/{root}").status_code == 400
+    assert client.delete(f"/folders/{root}", params={"recursive": True}).status_code == 200
+    drain_jobs()
+
+    for folder_id in folders:
+        assert client.get(f"/folders/{folder_id}").status_code == 404
+    for file_id in files:
+        assert client.get(f"/files/{file_id}/info").status_code == 404
+    # 子樹外的檔案仍可下載，共用的 Blob 只扣除子樹內的引用
+    assert client.get(f"/download/{outside['id']}").content == shared
+    assert ref_count(shared) == 1
+    assert before - client.get("/folders/0").json()["total_file_count"] == len(files)
+
+
+def test_statement_count_does_not_grow_with_subtree_size(client, count_statements):
+    counts = []
+    for files_per_folder in (2, 8):
+        root, _, _ = make_tree(client, files_per_folder, uuid.uuid4().bytes)
+        counts.append(count_statements(
+            lambda: client.delete(f"/folders/{root}", params={"recursive": True})
+        ))
+    assert counts[0] == counts[1]
+
+
+def test_uploads_of_the_same_content_during_delete_survive(client, folder):
+    """刪除子樹的同時在子樹外上傳相同內容；完成後子樹外的檔案都可下載，引用數等於版本數"""
+    shared = uuid.uuid4().bytes
+    for _ in range(5):
+        root, _, _ = make_tree(client, 1, shared)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            deleted = pool.submit(client.delete, f"/folders/{root}", params={"recursive": True})
+            uploads = [pool.submit(upload, client, f"{uuid.uuid4().hex}.txt", shared, folder) for _ in range(3)]
+            assert deleted.result().status_code == 200
+            records = [future.result() for future in uploads]
+        drain_jobs()
+        for record in records:
+            assert client.get(f"/download/{record['id']}").content == shared
+
+    db = SessionLocal()
+    try:
+        versions = db.query(FileVersion).filter(FileVersion.sha1_hash == hashlib.sha1(shared).hexdigest()).count()
+    finally:
+        db.close()
+    assert ref_count(shared) == versions == 15
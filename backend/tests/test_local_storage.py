@@ -0,0 +1,81 @@
+"""
+本機檔案系統後端的寫入 (BytesIO、上傳暫存檔、一般檔案與不可 seek 的串流)
+"""
+
+import io
+import os
+import tempfile
+
+import pytest
+
+from app.storage.local import LocalBackend
+
+DATA = os.urandom(3 * 1024 * 1024 + 17)
+
+
+@pytest.fixture
+def local(tmp_path):
+    backend = LocalBackend(str(tmp_path), b"secret", "http://localhost:8000")
+    backend.ensure_bucket()
+    return backend
+
+
+def stored(local, object_name: str) -> bytes:
+    with open(local.local_path(object_name), "rb") as f:
+        return f.read()
+
+
+def filled(data):
+    data.write(DATA)
+    return data
+
+
+def spooled(max_size: int):
+    return filled(tempfile.SpooledTemporaryFile(max_size=max_size))
+
+
+class Stream(io.RawIOBase):
+    """不可 seek、沒有檔案描述子的串流"""
+
+    def __init__(self, data: bytes):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self.data.readinto(buffer)
+
+
+@pytest.mark.parametrize("make", [
+    lambda: io.BytesIO(DATA),
+    lambda: spooled(len(DATA) * 2),  # 仍在記憶體中
+    lambda: spooled(1024),  # 已寫入磁碟
+    lambda: filled(tempfile.TemporaryFile()),
+])
+def test_put_object_from_the_current_position(local, make):
+    data = make()
+    data.seek(100)
+
+    local.put_object("a/b", data, 1000, "application/octet-stream")
+    assert stored(local, "a/b") == DATA[100:1100]
+    assert data.tell() == 1100
+
+    local.put_object("a/c", data, -1, "application/octet-stream")
+    assert stored(local, "a/c") == DATA[1100:]
+
+
+def test_put_object_from_a_stream(local):
+    local.put_object("s", io.BufferedReader(Stream(DATA)), len(DATA), "application/octet-stream")
+    assert stored(local, "s") == DATA
+
+
+def test_in_memory_upload_file_is_not_written_to_disk(local):
+    """SpooledTemporaryFile 的 fileno() 會先將內容寫入磁碟 (rollover)；記憶體中的上傳暫存檔以 read() 串流"""
+    data = spooled(len(DATA) * 2)
+    data.seek(0)
+    data.rollover = lambda: pytest.fail("upload file was rolled over to disk")
+
+    local.put_object("m", data, len(DATA), "application/octet-stream")
+
+    assert stored(local, "m") == DATA
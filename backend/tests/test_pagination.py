@@ -0,0 +1,77 @@
+"""
+/history 與 /search 的游標分頁
+"""
+
+import base64
+import json
+import uuid
+
+import pytest
+
+from conftest import upload
+
+
+def encode(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def pages(client, path, **params):
+    """依 X-Next-Cursor 翻完所有頁，回傳依序取得的檔案 id"""
+    ids = []
+    cursor = None
+    while True:
+        response = client.get(path, params={**params, "cursor": cursor} if cursor else params)
+        assert response.status_code == 200
+        ids.extend(f["id"] for f in response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return ids
+
+
+@pytest.fixture(scope="module")
+def token(client):
+    token = uuid.uuid4().hex[:12]
+    for i in range(7):
+        upload(client, f"{token}-{i}.txt", f"{token} {i}".encode())
+    return token
+
+
+def test_cursor_pages_cover_every_file_once(client, token):
+    everything = [f["id"] for f in client.get("/history", params={"limit": 500}).json()]
+    assert pages(client, "/history", limit=3) == everything
+
+    matches = pages(client, "/search", q=token, limit=2)
+    assert len(matches) == len(set(matches)) == 7
+
+
+def test_skip_is_a_deprecated_fallback(client, token):
+    everything = [f["id"] for f in client.get("/history", params={"limit": 500}).json()]
+
+    second = client.get("/history", params={"limit": 3, "skip": 3})
+    assert [f["id"] for f in second.json()] == everything[3:6]
+
+    found = [f["id"] for f in client.get("/search", params={"q": token, "limit": 500}).json()]
+    assert [f["id"] for f in client.get("/search", params={"q": token, "skip": 5}).json()] == found[5:]
+
+    # 帶游標時忽略 skip
+    cursor = client.get("/history", params={"limit": 3}).headers["x-next-cursor"]
+    with_cursor = client.get("/history", params={"limit": 3, "skip": 100, "cursor": cursor})
+    assert [f["id"] for f in with_cursor.json()] == everything[3:6]
+
+    assert client.get("/history", params={"skip": -1}).status_code == 422
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64 !",
+    encode({"created_at": "2024-01-01T00:00:00", "id": 1}),
+    encode(["2024-01-01T00:00:00"]),
+    encode(["2024-01-01T00:00:00", 1, 2]),
+    encode([["2024"], 1]),
+    encode(["yesterday", 1]),
+    encode(["2024-01-01T00:00:00", "1"]),
+    encode(["2024-01-01T00:00:00", 2 ** 70]),
+    encode("string"),
+])
+def test_malformed_cursor_is_rejected(client, token, cursor):
+    assert client.get("/history", params={"cursor": cursor}).status_code == 400
+    assert client.get("/search", params={"q": token, "cursor": cursor}).status_code == 400
@@ -0,0 +1,46 @@
+"""
+列表端點的查詢數量
+
+/history、/search 與 /folders/{id} 預先載入目前版本與標籤 (with_file_details)，
+查詢數量不應隨檔案數增加 (N+1)。
+"""
+
+import uuid
+
+import pytest
+
+from conftest import upload
+
+
+def add_files(client, folder_id, token, start, count):
+    """上傳 count 個檔案 (部分有多個版本)，並各加上一個標籤"""
+    for i in range(start, start + count):
+        record = upload(client, f"{token}-{i}.txt", f"{token} {i}".encode(), folder_id)
+        if i % 2:
+            upload(client, f"{token}-{i}.txt", f"{token} {i} v2".encode(), folder_id)
+        response = client.post(f"/files/{record['id']}/tags", json={"name": f"{token}-tag-{i % 3}"})
+        assert response.status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/history?limit=100", "/search?q={token}", "/folders/{folder}"])
+def test_statement_count_does_not_grow_with_files(client, folder, count_statements, path):
+    token = uuid.uuid4().hex[:12]
+    url = path.format(token=token, folder=folder)
+
+    def listed():
+        response = client.get(url)
+        assert response.status_code == 200
+        body = response.json()
+        return body if isinstance(body, list) else body["files"]
+
+    add_files(client, folder, token, 0, 3)
+    listed()
+    few = count_statements(listed)
+    assert len(listed()) >= 3
+
+    add_files(client, folder, token, 3, 12)
+    listed()
+    many = count_statements(listed)
+    assert len(listed()) >= 15
+
+    assert many == few
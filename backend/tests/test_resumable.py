@@ -0,0 +1,117 @@
+"""
+可續傳上傳工作階段與資料夾刪除
+"""
+
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import drain_jobs
+from app import resumable, storage
+from app.database import SessionLocal, engine
+from app.models import FileRecord, Folder, UploadSession
+
+
+def start_session(client, folder_id, data: bytes) -> dict:
+    """建立工作階段並上傳全部內容 (單一分段)，尚未完成"""
+    response = client.post("/uploads", json={"filename": "big.bin", "size": len(data), "folder_id": folder_id})
+    assert response.status_code == 201, response.text
+    state = response.json()
+    assert client.put(f"/uploads/{state['id']}/parts/1", content=data).status_code == 200
+    return state
+
+
+def staged_objects(session_id: str):
+    return list(storage.list_objects(f"{resumable.UPLOAD_STAGING_PREFIX}{session_id}"))
+
+
+def test_recursive_delete_discards_upload_sessions(client):
+    root = client.post("/folders", json={"name": uuid.uuid4().hex}).json()["id"]
+    child = client.post("/folders", json={"name": "child", "parent_id": root}).json()["id"]
+    active = start_session(client, root, uuid.uuid4().bytes)
+    assembled = start_session(client, child, uuid.uuid4().bytes)
+    db = SessionLocal()
+    try:
+        session = db.get(UploadSession, assembled["id"])
+        resumable.assemble_session(db, session)
+        upload_id = db.get(UploadSession, active["id"]).multipart_upload_id
+    finally:
+        db.close()
+    assert staged_objects(assembled["id"])
+
+    assert client.delete(f"/folders/{root}", params={"recursive": True}).status_code == 200
+
+    for state in (active, assembled):
+        assert client.get(f"/uploads/{state['id']}").status_code == 404
+        assert client.post(f"/uploads/{state['id']}/complete").status_code == 404
+    # multipart upload 已中止，已組成的暫存物件已刪除
+    assert upload_id not in storage.backend.uploads
+    assert not staged_objects(assembled["id"])
+
+
+@pytest.mark.skipif(engine.dialect.name != "sqlite", reason="其他資料庫以外鍵阻止直接刪除資料夾")
+def test_finish_after_folder_is_gone(client, folder):
+    """SQLite 未強制外鍵：資料夾記錄消失後完成上傳回傳 404，不在不存在的資料夾建立檔案"""
+    state = start_session(client, folder, uuid.uuid4().bytes)
+    db = SessionLocal()
+    try:
+        db.query(Folder).filter(Folder.id == folder).delete()
+        db.commit()
+    finally:
+        db.close()
+
+    response = client.post(f"/uploads/{state['id']}/complete")
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Folder not found"
+    assert client.get(f"/uploads/{state['id']}").status_code == 404
+    assert not staged_objects(state["id"])
+
+
+def test_finish_racing_recursive_delete(client):
+    """並行完成上傳與遞迴刪除：完成的檔案隨資料夾刪除，或完成時回傳 404；不留下工作階段與暫存物件"""
+    for _ in range(5):
+        root = client.post("/folders", json={"name": uuid.uuid4().hex}).json()["id"]
+        states = [start_session(client, root, uuid.uuid4().bytes) for _ in range(3)]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            finished = [pool.submit(client.post, f"/uploads/{state['id']}/complete") for state in states]
+            deleted = pool.submit(client.delete, f"/folders/{root}", params={"recursive": True})
+            assert deleted.result().status_code == 200
+            assert {future.result().status_code for future in finished} <= {200, 404}
+        drain_jobs()
+
+        db = SessionLocal()
+        try:
+            assert db.query(FileRecord).filter(FileRecord.folder_id == root).count() == 0
+            assert db.query(UploadSession).filter(UploadSession.folder_id == root).count() == 0
+        finally:
+            db.close()
+        for state in states:
+            assert not staged_objects(state["id"])
+
+
+@pytest.mark.parametrize("deferred", [False, True])
+def test_concurrent_completes_create_one_version(client, deferred):
+    """
+    同一工作階段並行完成：只有一個請求建立版本，其餘回傳 409 (或工作階段已刪除時 404)。
+
+    deferred 模擬分段由其他行程接收 (遞增雜湊狀態不在此行程)，版本先指向組成的物件，
+    finalize_upload 之後該物件即為 Blob 的物件。
+    """
+    for _ in range(5):
+        folder = client.post("/folders", json={"name": uuid.uuid4().hex}).json()["id"]
+        data = uuid.uuid4().bytes
+        state = start_session(client, folder, data)
+        if deferred:
+            resumable.forget_session(state["id"])
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            responses = list(pool.map(lambda _: client.post(f"/uploads/{state['id']}/complete"), range(3)))
+        drain_jobs()
+
+        statuses = sorted(response.status_code for response in responses)
+        assert statuses[0] == 200 and set(statuses[1:]) <= {404, 409}, statuses
+        record = next(response.json() for response in responses if response.status_code == 200)
+        assert client.get(f"/files/{record['id']}/info").json()["version_count"] == 1
+        assert client.get(f"/download/{record['id']}").content == data
+        assert bool(staged_objects(state["id"])) == deferred